@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+Measure how long it takes to start a short-lived process, as the size of
+this (Python) process grows.
+
+Processes are started the way daudin starts shell commands (in a new
+session, with start_new_session) and, for comparison, with a preexec_fn
+(as daudin used to, and still does when CPU time or memory limits are
+set), which stops subprocess from using vfork, so the cost of forking
+grows with the size of this process.
+"""
+
+import os
+import argparse
+from statistics import median
+from subprocess import Popen
+from time import perf_counter
+
+
+def rss():
+    """
+    Get the resident set size of this process.
+
+    @return: The C{int} number of megabytes.
+    """
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * os.sysconf('SC_PAGESIZE') >> 20
+
+
+def spawnTime(count, **kwargs):
+    """
+    Time starting (and waiting for) a process.
+
+    @param count: The C{int} number of processes to start.
+    @param kwargs: Keyword arguments for C{subprocess.Popen}.
+    @return: The C{float} median number of milliseconds taken.
+    """
+    times = []
+    for _ in range(count):
+        start = perf_counter()
+        Popen(['true'], **kwargs).wait()
+        times.append(perf_counter() - start)
+    return median(times) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__.strip().split('\n\n')[0])
+
+    parser.add_argument(
+        '--sizes', default='0,256,1024,2048', metavar='MB,...',
+        help='The amounts of extra memory to use, in megabytes.')
+
+    parser.add_argument(
+        '--count', type=int, default=50,
+        help='The number of processes to start for each measurement.')
+
+    args = parser.parse_args()
+
+    print('%8s  %18s  %18s' % ('RSS (MB)', 'new session (ms)',
+                               'preexec_fn (ms)'))
+
+    ballast = []
+    for size in map(int, args.sizes.split(',')):
+        # Touch every page, so the memory is really used (as, e.g., a big
+        # value of _ would be).
+        ballast.append(bytearray(b'x' * ((size << 20) - sum(map(len,
+                                                                ballast)))))
+        print('%8d  %18.2f  %18.2f' % (
+            rss(),
+            spawnTime(args.count, start_new_session=True),
+            spawnTime(args.count, preexec_fn=os.setsid)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+import os
+import sys
+from codecs import getincrementaldecoder
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock, Thread
+
+from daudinlib.limits import LimitExceeded
+
+
+class LineCapture:
+    """
+    A write-only text file that splits what is written to it into lines as
+    the text arrives, instead of accumulating one big string that must be
+    split once the writer has finished.
+
+    @param echo: A file-like object (e.g., the terminal) that complete lines
+        should be written to as soon as they are available, or C{None}.
+    @param queue: A C{queue.Queue} to put complete lines onto, or C{None}
+        to collect them in C{self.lines}. If the queue is bounded, a writer
+        will block until a consumer (in another thread) takes lines off it,
+        so the number of lines held in memory is limited by the queue size.
+    @param maxChars: The C{int} maximum number of characters that can be
+        written, or C{None} for no limit. A write that goes over the limit
+        keeps what fits and raises C{LimitExceeded}.
+    """
+    def __init__(self, echo=None, queue=None, maxChars=None):
+        self.echo = echo
+        self.queue = queue
+        self.maxChars = maxChars
+        self.lines = []
+        self.written = False
+        self.closed = False
+        self._partial = []
+
+    def write(self, s):
+        exceeded = False
+        if self.maxChars is not None and s:
+            if len(s) > self.maxChars:
+                s = s[:self.maxChars]
+                exceeded = True
+            self.maxChars -= len(s)
+        if s:
+            self.written = True
+            lines = s.split('\n')
+            if len(lines) == 1:
+                self._partial.append(s)
+            else:
+                if self._partial:
+                    self._partial.append(lines[0])
+                    lines[0] = ''.join(self._partial)
+                    self._partial = []
+                last = lines.pop()
+                if last:
+                    self._partial.append(last)
+                self._emit(lines)
+        if exceeded:
+            raise LimitExceeded('out')
+        return len(s)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _emit(self, lines):
+        if self.echo is not None:
+            self.echo.write('\n'.join(lines) + '\n')
+        if self.queue is None:
+            self.lines.extend(lines)
+        else:
+            put = self.queue.put
+            for line in lines:
+                put(line)
+
+    def flush(self):
+        if self.echo is not None:
+            self.echo.flush()
+
+    def close(self):
+        """
+        Emit any final unterminated line and flush the echo file (if any).
+        """
+        if not self.closed:
+            self.closed = True
+            if self._partial:
+                partial = ''.join(self._partial)
+                self._partial = []
+                if self.echo is not None:
+                    # Terminate the line on the terminal so that it does not
+                    # run into the next prompt.
+                    self.echo.write(partial + '\n')
+                if self.queue is None:
+                    self.lines.append(partial)
+                else:
+                    self.queue.put(partial)
+            self.flush()
+
+    def isatty(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def result(self):
+        """
+        Get the captured output as a pipeline value.
+
+        @return: C{None} if nothing was written (or lines were sent to a
+            queue), a C{str} if a single line was written, else a C{list} of
+            C{str} lines. A single trailing newline does not result in a
+            final empty line.
+        """
+        self.close()
+        if not self.written or self.queue is not None:
+            return None
+        elif len(self.lines) == 1:
+            return self.lines[0]
+        else:
+            return self.lines
+
+
+class ErrorBuffer:
+    """
+    A bounded ring buffer for the standard error output of shell commands.
+
+    @param maxBytes: The C{int} maximum number of bytes to keep. When more
+        than this has been written, the oldest output is discarded.
+    @param echo: A text file-like object (e.g., the terminal) that output
+        should also be written to as it arrives, or C{None}.
+    """
+    def __init__(self, maxBytes=65536, echo=None):
+        self.maxBytes = maxBytes
+        self.echo = echo
+        # Set this to True while the terminal being echoed to is in raw
+        # mode (which does not turn '\n' into '\r\n').
+        self.rawTerminal = False
+        self.clear()
+
+    def clear(self):
+        """
+        Discard all buffered output.
+        """
+        self._chunks = deque()
+        self._size = 0
+        self.dropped = 0
+        self._decoder = getincrementaldecoder('utf-8')(errors='replace')
+
+    def write(self, data):
+        """
+        Add output to the buffer, discarding old output if necessary.
+
+        @param data: The C{bytes} to add.
+        """
+        if not data:
+            return
+
+        if self.echo is not None:
+            text = self._decoder.decode(data)
+            if self.rawTerminal:
+                text = text.replace('\r\n', '\n').replace('\n', '\r\n')
+            self.echo.write(text)
+            self.echo.flush()
+
+        chunks = self._chunks
+        chunks.append(data)
+        self._size += len(data)
+
+        while self._size > self.maxBytes:
+            excess = self._size - self.maxBytes
+            first = chunks[0]
+            if len(first) <= excess:
+                chunks.popleft()
+                self._size -= len(first)
+                self.dropped += len(first)
+            else:
+                chunks[0] = first[excess:]
+                self._size -= excess
+                self.dropped += excess
+
+    def __len__(self):
+        return self._size
+
+    def getvalue(self):
+        """
+        Get the buffered output.
+
+        @return: The C{bytes} currently held in the buffer.
+        """
+        return b''.join(self._chunks)
+
+    def lines(self):
+        """
+        Get the buffered output as lines of text.
+
+        @return: A C{list} of C{str} lines. If output has been discarded,
+            the (partial) first line is not included.
+        """
+        text = self.getvalue().decode('utf-8', errors='replace')
+        if text.endswith('\n'):
+            text = text[:-1]
+        lines = text.split('\n') if text else []
+        if self.dropped and lines:
+            del lines[0]
+        return lines
+
+
+def drain(fd, buffer):
+    """
+    Read from a file descriptor into a buffer, in a background thread.
+
+    @param fd: An C{int} file descriptor to read from until end of file. It
+        is closed when end of file is reached.
+    @param buffer: An object with a C{write} method that accepts C{bytes}
+        (e.g., an C{ErrorBuffer}).
+    @return: The started C{threading.Thread}.
+    """
+    def run():
+        try:
+            while True:
+                data = os.read(fd, 65536)
+                if data:
+                    buffer.write(data)
+                else:
+                    break
+        finally:
+            os.close(fd)
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+# The file that sys.stdout or sys.stdin is redirected to in the current
+# context (see redirect).
+_REDIRECTS = {
+    'stdout': ContextVar('daudin_stdout', default=None),
+    'stdin': ContextVar('daudin_stdin', default=None),
+}
+
+_installLock = Lock()
+
+
+class StreamProxy:
+    """
+    A stand-in for C{sys.stdout} or C{sys.stdin} that passes everything on
+    to the file it is redirected to in the current thread (or asyncio task),
+    if any, else to the file it replaced. See C{redirect}.
+
+    @param name: The C{str} name of the stream, 'stdout' or 'stdin'.
+    @param default: The file to use when the stream is not redirected.
+    """
+    def __init__(self, name, default):
+        self._redirect = _REDIRECTS[name]
+        self._default = default
+
+    def _target(self):
+        fp = self._redirect.get()
+        return self._default if fp is None else fp
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        return self._target().flush()
+
+    def readline(self, *args):
+        return self._target().readline(*args)
+
+    def read(self, *args):
+        return self._target().read(*args)
+
+    def __iter__(self):
+        return iter(self._target())
+
+    def __repr__(self):
+        return '<StreamProxy for %r>' % (self._target(),)
+
+
+@contextmanager
+def redirect(name, fp):
+    """
+    Redirect C{sys.stdout} or C{sys.stdin} to a file, in the current thread
+    (or asyncio task) only.
+
+    The first time this is used (and whenever the stream has since been
+    replaced, e.g., by C{contextlib.redirect_stdout}), a C{StreamProxy} is
+    installed as the stream. The redirection itself is kept in a
+    C{contextvars.ContextVar}, so code running at the same time in other
+    threads (e.g., another C{Pipeline}) is not affected. Note that a thread
+    started while the stream is redirected does not see the redirection.
+
+    @param name: The C{str} name of the stream, 'stdout' or 'stdin'.
+    @param fp: The file to redirect the stream to.
+    @return: A context manager that gives C{fp}.
+    """
+    with _installLock:
+        if not isinstance(getattr(sys, name), StreamProxy):
+            setattr(sys, name, StreamProxy(name, getattr(sys, name)))
+    token = _REDIRECTS[name].set(fp)
+    try:
+        yield fp
+    finally:
+        _REDIRECTS[name].reset(token)
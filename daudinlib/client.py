@@ -0,0 +1,143 @@
+"""
+A thin client for a daudin server (see daudinlib.server).
+
+This module deliberately imports nothing from the rest of daudinlib (or
+any other slow-to-import module), so that starting a client is fast.
+"""
+
+import os
+import sys
+import json
+import signal
+import socket
+import struct
+
+_LENGTH = struct.Struct('!I')
+
+USAGE = '''\
+usage: daudinc [-h] [--socket PATH] [--fresh] [FILE [FILE ...]]
+
+Run daudin commands in a running daudin server (started with
+"daudin --server"). With no FILE, commands are read from standard input
+(interactively if it is a terminal).
+
+options:
+  -h, --help     show this help message and exit
+  --socket PATH  The server socket (default: %s).
+  --fresh        Use a new Pipeline in the server, instead of a copy of the
+                 server's already initialized one.
+'''
+
+
+def defaultSocketPath():
+    """
+    Get the default path of the server socket.
+
+    @return: A C{str} path in C{$XDG_RUNTIME_DIR} (or C{/tmp}) that
+        includes the user id, so different users have different servers.
+    """
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/tmp',
+                        'daudin-%d.sock' % os.getuid())
+
+
+def sendRequest(sock, request, fds):
+    """
+    Send a request, along with file descriptors, to a server.
+
+    @param sock: A connected Unix-domain C{socket.socket}.
+    @param request: A C{dict} that can be converted to JSON.
+    @param fds: A C{list} of C{int} file descriptors to pass to the server.
+    """
+    data = json.dumps(request).encode()
+    message = _LENGTH.pack(len(data)) + data
+    sent = socket.send_fds(sock, [message], fds)
+    if sent < len(message):
+        sock.sendall(message[sent:])
+
+
+def receiveRequest(sock):
+    """
+    Receive a request sent with C{sendRequest}.
+
+    @param sock: A connected Unix-domain C{socket.socket}.
+    @raise ConnectionError: If the connection is closed before the whole
+        request has been received.
+    @return: A C{tuple} of the request C{dict} and a C{list} of the C{int}
+        file descriptors that were passed.
+    """
+    data, fds, _, _ = socket.recv_fds(sock, 65536, 3)
+    while len(data) < _LENGTH.size or (
+            len(data) < _LENGTH.size + _LENGTH.unpack_from(data)[0]):
+        more = sock.recv(65536)
+        if not more:
+            raise ConnectionError('Incomplete request.')
+        data += more
+    length = _LENGTH.unpack_from(data)[0]
+    return json.loads(data[_LENGTH.size:_LENGTH.size + length]), fds
+
+
+def main(argv=None):
+    """
+    Run the client.
+
+    @param argv: A C{list} of C{str} command-line arguments, or C{None} to
+        use C{sys.argv[1:]}.
+    @return: The C{int} exit status of the commands run by the server.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    path = defaultSocketPath()
+    mode = 'fork'
+    scriptFiles = []
+
+    while argv:
+        arg = argv.pop(0)
+        if arg in ('-h', '--help'):
+            print(USAGE % path, end='')
+            return 0
+        elif arg == '--socket' and argv:
+            path = argv.pop(0)
+        elif arg.startswith('--socket='):
+            path = arg[len('--socket='):]
+        elif arg == '--fresh':
+            mode = 'fresh'
+        elif arg == '--':
+            scriptFiles.extend(argv)
+            break
+        elif arg.startswith('-') and arg != '-':
+            print(USAGE % path, end='', file=sys.stderr)
+            return 2
+        else:
+            scriptFiles.append(arg)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        print('Could not connect to a daudin server at %r (%s). Start one '
+              'with "daudin --server".' % (path, e.strerror), file=sys.stderr)
+        return 2
+
+    sendRequest(sock, {
+        'scriptFiles': [os.path.abspath(f) if f != '-' else f
+                        for f in scriptFiles],
+        'cwd': os.getcwd(),
+        'environ': dict(os.environ),
+        'mode': mode,
+    }, [0, 1, 2])
+
+    # The server is not in the terminal's foreground process group, so pass
+    # on interrupts.
+    def interrupt(signum, frame):
+        sock.send(b'I')
+
+    signal.signal(signal.SIGINT, interrupt)
+
+    reply = b''
+    while not reply.endswith(b'\n'):
+        data = sock.recv(1024)
+        if not data:
+            print('Lost connection to the daudin server.', file=sys.stderr)
+            return 1
+        reply += data
+
+    return json.loads(reply)['status']
@@ -0,0 +1,58 @@
+import csv
+import json
+from io import IOBase
+
+from daudinlib.lines import LineBuffer
+from daudinlib.stream import LineStream, sourceLines
+
+FORMATS = ('json', 'jsonl', 'csv', 'tsv')
+
+
+def decode(data, format='jsonl', header=True):
+    """
+    Decode structured text (e.g., the output of a shell command).
+
+    @param data: A C{str}, C{bytes}, file, or iterable of C{str} lines
+        (e.g., a C{LineStream} of the output of a shell command, which is
+        then read directly from the process).
+    @param format: The C{str} format of the text: 'json' (one JSON
+        document), 'jsonl' (one JSON value per line, blank lines are
+        ignored), 'csv' or 'tsv'.
+    @param header: For 'csv' and 'tsv', if C{True} the first row gives the
+        field names and each record is a C{dict}. Else each record is a
+        C{list} of C{str} fields.
+    @raise ValueError: If C{format} is unknown.
+    @return: For 'json', the decoded value. Else a C{LineStream} of the
+        records, which are decoded only as they are needed.
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown format %r (use one of %s).' %
+                         (format, ', '.join(FORMATS)))
+
+    if format == 'json':
+        if isinstance(data, (str, bytes, bytearray)):
+            return json.loads(data)
+        elif isinstance(data, LineBuffer):
+            return json.loads(data.text)
+        lines, close = sourceLines(data)
+        try:
+            if isinstance(lines, IOBase):
+                return json.load(lines)
+            else:
+                return json.loads('\n'.join(lines))
+        finally:
+            if close is not None:
+                close()
+
+    lines, close = sourceLines(data)
+
+    if format == 'jsonl':
+        records = (json.loads(line) for line in lines if line.strip())
+    else:
+        delimiter = ',' if format == 'csv' else '\t'
+        if header:
+            records = csv.DictReader(lines, delimiter=delimiter)
+        else:
+            records = csv.reader(lines, delimiter=delimiter)
+
+    return LineStream(records, close=close)
@@ -0,0 +1,197 @@
+import os
+import reprlib
+from collections import deque
+from collections.abc import Sequence, Sized
+from io import TextIOWrapper
+from itertools import chain, islice
+from shutil import get_terminal_size
+from subprocess import Popen, PIPE
+
+# The (approximate) number of characters to write at once.
+CHUNK_SIZE = 65536
+
+
+def valueLines(value, asList=False, maxLines=None):
+    """
+    Get the lines to display for a pipeline value, without joining them
+    into one string.
+
+    @param value: The value to display.
+    @param asList: If C{True} and C{value} is a C{list}, display its
+        elements one per line (as for the output of a shell command).
+        Otherwise, C{value} is displayed as by C{print}.
+    @param maxLines: An C{int} number of items beyond which a large
+        container is displayed in abbreviated form, or C{None}.
+    @return: A C{list} or other iterable of lines (which need not be
+        C{str}), without trailing newlines.
+    """
+    if isinstance(value, TextIOWrapper):
+        return (line[:-1] if line.endswith('\n') else line for line in value)
+    elif isinstance(value, str):
+        return (value[:-1] if value.endswith('\n') else value).split('\n')
+    elif asList:
+        # Like the shell, show a single empty line for no output.
+        return value or ['']
+    else:
+        return summaryRepr(value, maxLines).split('\n')
+
+
+def summaryRepr(value, maxItems=None):
+    """
+    Get the text that C{print} would show for a value, abbreviated if the
+    value is a large container.
+
+    @param value: Any value.
+    @param maxItems: The C{int} maximum number of items of a container to
+        show, or C{None} to show them all.
+    @return: A C{str}.
+    """
+    if maxItems is not None and isinstance(value, Sized):
+        try:
+            length = len(value)
+        except TypeError:
+            length = 0
+        if length > maxItems:
+            r = reprlib.Repr()
+            r.maxlevel = 3
+            r.maxlist = r.maxtuple = r.maxdict = maxItems
+            r.maxset = r.maxfrozenset = r.maxdeque = r.maxarray = maxItems
+            r.maxstring = r.maxlong = r.maxother = 1000
+            if (isinstance(value, Sequence) and
+                    not hasattr(r, 'repr_' + type(value).__name__)):
+                # reprlib would make the repr of all of a sequence it does
+                # not know (e.g., a LineBuffer, whose repr is that of a
+                # list). Abbreviate only the items that will be shown.
+                value = list(islice(value, maxItems + 1))
+            return '%s\n(%d items)' % (r.repr(value), length)
+
+    return str(value)
+
+
+def truncate(lines, maxLines):
+    """
+    Abbreviate lines, keeping those at the start and the end.
+
+    @param lines: An iterable of lines.
+    @param maxLines: The C{int} maximum number of lines to keep.
+    @return: A generator of lines. If lines were left out, a line saying
+        how many is put in their place.
+    """
+    tailCount = maxLines // 2
+    headCount = maxLines - tailCount
+
+    if isinstance(lines, Sequence):
+        total = len(lines)
+        if total <= maxLines:
+            yield from lines
+            return
+        head = lines[:headCount]
+        tail = lines[total - tailCount:] if tailCount else []
+        omitted = total - maxLines
+    else:
+        lines = iter(lines)
+        head = list(islice(lines, headCount))
+        tail = deque(maxlen=tailCount)
+        omitted = 0
+        for line in lines:
+            if len(tail) == tailCount:
+                omitted += 1
+            tail.append(line)
+        total = len(head) + omitted + len(tail)
+
+    yield from head
+    if omitted:
+        yield '... %d more line%s (%d in total) ...' % (
+            omitted, '' if omitted == 1 else 's', total)
+    yield from tail
+
+
+def _fileno(fp):
+    try:
+        return fp.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def writeLines(lines, fp):
+    """
+    Write lines to a file in large chunks. If the file has a file
+    descriptor, the chunks are written directly to it.
+
+    @param lines: An iterable of lines (which are converted to C{str}).
+    @param fp: A text or binary file.
+    """
+    fd = _fileno(fp)
+    if fd is not None:
+        fp.flush()
+        encoding = getattr(fp, 'encoding', None) or 'utf-8'
+
+    lines = iter(lines)
+    while True:
+        chunk = []
+        size = 0
+        for line in lines:
+            line = str(line)
+            chunk.append(line)
+            size += len(line) + 1
+            if size >= CHUNK_SIZE:
+                break
+
+        if not chunk:
+            return
+
+        text = '\n'.join(chunk) + '\n'
+        if fd is None:
+            fp.write(text)
+        else:
+            data = memoryview(text.encode(encoding, 'replace'))
+            while data:
+                data = data[os.write(fd, data):]
+
+
+def page(lines, command):
+    """
+    Show lines using a pager.
+
+    @param lines: An iterable of lines.
+    @param command: The C{str} pager shell command (e.g., 'less -R').
+    """
+    process = Popen(command, shell=True, stdin=PIPE)
+    try:
+        writeLines(lines, process.stdin)
+        process.stdin.close()
+    except BrokenPipeError:
+        # The pager was quit before all lines were shown.
+        pass
+    process.wait()
+
+
+def show(value, fp, asList=False, maxLines=None, pager=None):
+    """
+    Display a pipeline value.
+
+    @param value: The value to display.
+    @param fp: The text file to write to.
+    @param asList: If C{True} and C{value} is a C{list}, display its
+        elements one per line.
+    @param maxLines: The C{int} maximum number of lines to display, or
+        C{None} for no limit.
+    @param pager: A C{str} pager shell command to use if there are more
+        lines than fit on the terminal, or C{None}.
+    """
+    lines = valueLines(value, asList, maxLines)
+
+    if pager:
+        lines = iter(lines)
+        # Leave room for the prompt.
+        height = get_terminal_size().lines - 1
+        first = list(islice(lines, height + 1))
+        lines = chain(first, lines)
+        if len(first) > height:
+            page(lines, pager)
+            return
+
+    if maxLines is not None:
+        lines = truncate(lines, maxLines)
+
+    writeLines(lines, fp)
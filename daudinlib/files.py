@@ -0,0 +1,270 @@
+import os
+import bz2
+import gzip
+import lzma
+import mmap
+import stat
+import shutil
+from glob import glob, has_magic
+from os.path import basename, dirname, realpath
+
+from daudinlib.lines import LineBuffer
+from daudinlib.serialize import serialize
+from daudinlib.stream import LineStream
+
+# The first bytes of compressed files, and the functions to open them with.
+_COMPRESSED = (
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+)
+
+# The kinds of compression that files can be written with, and the
+# functions to open them with.
+COMPRESSORS = {
+    'gzip': gzip.open,
+    'bz2': bz2.open,
+    'xz': lzma.open,
+}
+
+# The kind of compression used for a file name suffix.
+_SUFFIXES = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+}
+
+# The size of the buffer used when writing files.
+BUFFER_SIZE = 1 << 20
+
+
+def expandPaths(paths):
+    """
+    Expand '~' and glob patterns in file paths.
+
+    @param paths: An iterable of C{str} paths, which may contain glob
+        patterns (e.g., 'logs/*.gz').
+    @raise FileNotFoundError: If a pattern matches nothing.
+    @return: A C{list} of C{str} paths. The files matched by each pattern
+        are sorted.
+    """
+    result = []
+    for path in paths:
+        path = os.path.expanduser(path)
+        if has_magic(path):
+            matches = sorted(glob(path))
+            if not matches:
+                raise FileNotFoundError('No files match %r.' % path)
+            result.extend(matches)
+        else:
+            result.append(path)
+    return result
+
+
+def _opener(path):
+    """
+    Find how to open a file, from its first bytes.
+
+    @param path: The C{str} path of a regular file.
+    @return: A function to open the (compressed) file with, or C{None} if
+        the file is not compressed.
+    """
+    with open(path, 'rb') as fp:
+        start = fp.read(6)
+    for magic, opener in _COMPRESSED:
+        if start.startswith(magic):
+            return opener
+    return None
+
+
+def _textLines(fp):
+    """
+    Read the lines of a text file.
+
+    @param fp: A text file opened with C{newline='\\n'}.
+    @return: A generator of C{str} lines, without their newlines.
+    """
+    for line in fp:
+        yield line[:-1] if line.endswith('\n') else line
+
+
+def _mappedLines(path):
+    """
+    Read the lines of a (regular, uncompressed) file by mapping it into
+    memory, so it is not copied into a buffer first.
+
+    @param path: The C{str} file path.
+    @return: A generator of C{str} lines, without their newlines.
+    """
+    with open(path, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if not size:
+            return
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    with mm:
+        find = mm.find
+        start = 0
+        while start < size:
+            end = find(b'\n', start)
+            if end == -1:
+                end = size
+            yield mm[start:end].decode('utf-8', errors='surrogateescape')
+            start = end + 1
+
+
+def fileLines(path):
+    """
+    Read the lines of a file. Regular files are mapped into memory, and
+    gzip, bzip2 and xz files are decompressed as they are read.
+
+    @param path: The C{str} file path.
+    @return: A generator of C{str} lines, without their newlines.
+    """
+    if stat.S_ISREG(os.stat(path).st_mode):
+        opener = _opener(path)
+        if opener is None:
+            yield from _mappedLines(path)
+            return
+    else:
+        # E.g., a named pipe, which cannot be mapped (or looked at first).
+        opener = open
+
+    with opener(path, 'rt', encoding='utf-8', errors='surrogateescape',
+                newline='\n') as fp:
+        yield from _textLines(fp)
+
+
+def read(*paths):
+    """
+    Read the lines of files, without starting a process (as, e.g., C{cat}
+    would need).
+
+    @param paths: C{str} file paths, which may contain glob patterns. The
+        lines of all the files are read, in turn. Files compressed with
+        gzip, bzip2 or xz are decompressed.
+    @raise FileNotFoundError: If a file does not exist or a pattern matches
+        nothing.
+    @raise ValueError: If no paths are given.
+    @return: A C{LineStream} of the C{str} lines, which are only read as
+        they are needed.
+    """
+    if not paths:
+        raise ValueError('No files given to read.')
+
+    paths = expandPaths(paths)
+    # Report missing files now, rather than once some lines have been read.
+    for path in paths:
+        os.stat(path)
+
+    def lines():
+        for path in paths:
+            yield from fileLines(path)
+
+    generator = lines()
+    return LineStream(generator, close=generator.close)
+
+
+def _tempFile(path):
+    """
+    Create a temporary file to write a file's new contents to, in the same
+    directory (so it can be renamed over the file).
+
+    @param path: The C{str} path of the file.
+    @return: A C{tuple} of the C{str} path of the temporary file and its
+        C{int} file descriptor, open for writing.
+    """
+    for count in range(100):
+        tmp = os.path.join(dirname(path), '.%s.%d.%d.tmp' % (
+            basename(path), os.getpid(), count))
+        try:
+            # The file permissions are as for a new file (i.e., allowing for
+            # the umask), not the 0600 that tempfile.mkstemp would use.
+            return tmp, os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                                0o666)
+        except FileExistsError:
+            continue
+    raise FileExistsError('Could not create a temporary file for %r.' % path)
+
+
+def _writeSerialized(value, fp, opener):
+    """
+    Write a pipeline value to a file, as it would be given to a shell
+    command.
+
+    @param value: A pipeline value. If C{None} or empty (e.g., an empty
+        C{list}), nothing is written.
+    @param fp: A binary file, open for writing.
+    @param opener: A function to open a compressed file (writing to C{fp})
+        with, or C{None} to write to C{fp} directly.
+    @return: The C{int} number of (uncompressed) bytes written.
+    """
+    size = 0
+    if not (value is None or
+            isinstance(value, (list, LineBuffer)) and not value):
+        out = fp if opener is None else opener(fp, 'wb')
+        try:
+            for chunk in serialize(value):
+                out.write(chunk)
+                size += len(chunk)
+        finally:
+            if out is not fp:
+                out.close()
+    return size
+
+
+def writeValue(value, path, append=False, compress=None):
+    """
+    Write a pipeline value to a file, as it would be given to a shell
+    command (see C{daudinlib.serialize.serialize}), e.g., one line per item
+    of a list.
+
+    A file that is not being appended to is replaced in one step (by
+    renaming a temporary file), so it is never seen partly written, and is
+    left unchanged if writing fails. Appending only writes the new data to
+    the end of the file (so it takes no longer for a large file), but if
+    writing fails part of the new data may have been added.
+
+    @param value: A pipeline value. If C{None} or empty (e.g., an empty
+        C{list}), nothing is written (but the file is still made).
+    @param path: The C{str} file path.
+    @param append: If C{True}, add to the end of the file (which is created
+        if it does not exist). A compressed file is added to by writing
+        another compressed stream after those already in it.
+    @param compress: The C{str} kind of compression to use (see
+        C{COMPRESSORS}), C{False} for none, or C{None} to use compression
+        if the file name ends in '.gz', '.bz2' or '.xz'.
+    @raise ValueError: If C{compress} is unknown.
+    @return: The C{int} number of (uncompressed) bytes written.
+    """
+    path = realpath(os.path.expanduser(path))
+    if compress is None:
+        compress = _SUFFIXES.get(os.path.splitext(path)[1])
+    if compress:
+        try:
+            opener = COMPRESSORS[compress]
+        except KeyError:
+            raise ValueError('Unknown compression %r (use one of %s).' % (
+                compress, ', '.join(sorted(COMPRESSORS))))
+    else:
+        opener = None
+
+    if append:
+        with open(path, 'ab', buffering=BUFFER_SIZE) as fp:
+            return _writeSerialized(value, fp, opener)
+
+    tmp, fd = _tempFile(path)
+    try:
+        with open(fd, 'wb', buffering=BUFFER_SIZE) as fp:
+            if os.path.exists(path):
+                # Keep the permissions of the file being replaced.
+                shutil.copymode(path, tmp)
+            size = _writeSerialized(value, fp, opener)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+    return size
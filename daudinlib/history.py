@@ -0,0 +1,140 @@
+import sqlite3
+from collections import namedtuple
+from time import time
+
+HistoryEntry = namedtuple(
+    'HistoryEntry', ('id', 'command', 'cwd', 'started', 'duration', 'status'))
+
+_COLUMNS = 'id, command, cwd, started, duration, status'
+
+
+class History:
+    """
+    A command history kept in an SQLite database, with a full-text index of
+    the commands.
+
+    Each command is committed as soon as it is added, and the database uses
+    write-ahead logging, so several daudin sessions can add to (and search)
+    the same history at once.
+
+    @param path: The C{str} path to the database file (it is created if it
+        does not exist).
+    @param timeout: The C{float} number of seconds to wait for another
+        session that is writing to the database.
+    """
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=timeout,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY,
+                command TEXT NOT NULL,
+                cwd TEXT,
+                started REAL,
+                duration REAL,
+                status INTEGER)''')
+
+        try:
+            self._db.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS historyText USING fts5(
+                    command, content='history', content_rowid='id')''')
+        except sqlite3.OperationalError:
+            # This SQLite was built without FTS5. Searches fall back to
+            # scanning all commands.
+            self.fts = False
+        else:
+            self.fts = True
+            self._db.execute('''
+                CREATE TRIGGER IF NOT EXISTS historyInsert
+                AFTER INSERT ON history BEGIN
+                    INSERT INTO historyText (rowid, command)
+                    VALUES (new.id, new.command);
+                END''')
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+
+    def add(self, command, cwd=None, started=None, duration=None,
+            status=None):
+        """
+        Add a command to the history.
+
+        @param command: The C{str} command line.
+        @param cwd: The C{str} directory the command was run in, or C{None}.
+        @param started: The C{float} time (in seconds since the epoch) the
+            command was started, or C{None} to use the current time.
+        @param duration: The C{float} number of seconds the command took,
+            or C{None}.
+        @param status: The C{int} exit status of the command, or C{None}.
+        @return: The C{int} id of the new history entry.
+        """
+        return self._db.execute(
+            'INSERT INTO history (command, cwd, started, duration, status) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (command, cwd, time() if started is None else started, duration,
+             status)).lastrowid
+
+    def addMany(self, commands):
+        """
+        Add several commands (with no other details) in one transaction.
+
+        @param commands: An iterable of C{str} command lines.
+        """
+        with self._db:
+            self._db.execute('BEGIN')
+            self._db.executemany(
+                'INSERT INTO history (command) VALUES (?)',
+                ((command,) for command in commands))
+
+    def recent(self, n):
+        """
+        Get the most recent commands.
+
+        @param n: The C{int} maximum number of entries to return.
+        @return: A C{list} of C{HistoryEntry}, oldest first.
+        """
+        rows = self._db.execute(
+            'SELECT %s FROM history ORDER BY id DESC LIMIT ?' % _COLUMNS,
+            (n,)).fetchall()
+        return [HistoryEntry(*row) for row in reversed(rows)]
+
+    def search(self, query, n=50):
+        """
+        Find commands containing all the words in a query.
+
+        @param query: A C{str} query. With full-text searching, this may use
+            the SQLite FTS5 query syntax (e.g., 'git AND NOT push'). If it
+            is not a valid query, its words are searched for literally.
+        @param n: The C{int} maximum number of entries to return.
+        @return: A C{list} of the C{n} most recent matching C{HistoryEntry},
+            oldest first.
+        """
+        if not query.split():
+            return self.recent(n)
+
+        if self.fts:
+            sql = ('SELECT %s FROM history WHERE id IN '
+                   '(SELECT rowid FROM historyText WHERE historyText MATCH ?) '
+                   'ORDER BY id DESC LIMIT ?' % _COLUMNS)
+            try:
+                rows = self._db.execute(sql, (query, n)).fetchall()
+            except sqlite3.OperationalError:
+                # Not a valid FTS5 query (e.g., it contains punctuation).
+                # Search for each word as a quoted string instead.
+                literal = ' '.join('"%s"' % word.replace('"', '""')
+                                   for word in query.split())
+                rows = self._db.execute(sql, (literal, n)).fetchall()
+        else:
+            words = query.split()
+            where = ' AND '.join(['instr(command, ?) > 0'] * len(words))
+            sql = 'SELECT %s FROM history WHERE %s' % (_COLUMNS, where)
+            rows = self._db.execute(
+                sql + ' ORDER BY id DESC LIMIT ?', words + [n]).fetchall()
+
+        return [HistoryEntry(*row) for row in reversed(rows)]
+
+    def close(self):
+        self._db.close()
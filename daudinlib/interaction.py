@@ -1,27 +1,182 @@
 from __future__ import print_function
 
+import os
+import re
 import sys
 import traceback
 import shlex
+from io import StringIO
 from os.path import expanduser
+from shutil import get_terminal_size
+from time import localtime, strftime, time
 
-from daudinlib.parse import lineSplitter
+from daudinlib.decode import FORMATS
+from daudinlib.limits import parseLimits
+from daudinlib.parse import lineSplitter, compileBlock
 from daudinlib.pipeline import Pipeline
+from daudinlib.watch import parseWatch, makeWatcher, redraw
+
+
+# A '%as FORMAT' command, which decodes the pipeline value.
+_AS = re.compile(r'\s*%%as\s+(%s)\s*$' % '|'.join(FORMATS))
 
 
 class _DaudinBase:
 
-    def __init__(self, pipeline=None):
+    def __init__(self, pipeline=None, history=None):
         self.pipeline = pipeline or Pipeline()
-
-    def runCommandLine(self, text):
-        commands = list(lineSplitter(text))
+        self.history = history
+
+    def runCommandLine(self, text, resume=True):
+        """
+        Run a command line.
+
+        @param text: The C{str} command line.
+        @param resume: If C{True}, start from the kept value of its first
+            stages, if any (see C{Pipeline.resumeLine}).
+        @return: C{False} if a command failed, else C{True}.
+        """
+        if text.lstrip().startswith('%limit'):
+            return self._limit(text.lstrip()[6:], resume)
+
+        if text.lstrip().startswith('%watch'):
+            return self._watch(text.lstrip()[6:])
+
+        if text.strip() == '%fresh' or text.lstrip().startswith('%fresh '):
+            # Forget cached stage values, and run any command line given.
+            self.pipeline.fresh()
+            text = text.lstrip()[6:]
+            if not text.strip():
+                return True
+
+        # A '%as' command becomes a call to decode, so it can be a stage
+        # anywhere in a pipeline.
+        commands = [_AS.sub(r"decode('\1')", command)
+                    for command in lineSplitter(text)]
         nCommands = len(commands)
-        for i, command in enumerate(commands, start=1):
+        # Start from the cached value of the first stages, if any.
+        resumed = self.pipeline.resumeLine(commands) if resume else 0
+        for i, command in enumerate(commands[resumed:], start=resumed + 1):
             if self.runCommand(command, i, nCommands) is False:
                 return False
         return True
 
+    def _limit(self, text, resume=True):
+        """
+        Handle the %limit special command. With no arguments, show the
+        limits. With only limits (e.g., '%limit time=10s mem=1G'), change
+        the limits for each stage (or, after 'line', for each command line).
+        With limits followed by a command line, run the command line with
+        those stage limits. The time limits of Python stages only take
+        effect between Python bytecodes, so do not stop a long call into C
+        code (see C{daudinlib.limits.enforced}).
+
+        @param text: The C{str} text after '%limit'.
+        @param resume: Passed to C{runCommandLine}.
+        @return: C{False} if a command failed, else C{True}.
+        """
+        if text and not text[0].isspace():
+            print('Unknown special command %r.' % ('%limit' + text),
+                  file=sys.stderr)
+            return True
+
+        pipeline = self.pipeline
+        text = text.strip()
+        line = text == 'line' or text.startswith('line ')
+        if line:
+            text = text[4:]
+
+        try:
+            limits, rest = parseLimits(text)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return True
+
+        if rest:
+            if line:
+                print('Command line limits cannot be given for one '
+                      'command line.', file=sys.stderr)
+                return True
+            with pipeline.limited(limits):
+                return self.runCommandLine(rest, resume)
+        elif limits:
+            if line:
+                pipeline.lineLimits = pipeline.lineLimits.update(limits)
+            else:
+                pipeline.limits = pipeline.limits.update(limits)
+        else:
+            print('stage: %s' % pipeline.limits)
+            print('line: %s' % pipeline.lineLimits)
+        return True
+
+    def _watch(self, text):
+        """
+        Handle the %watch special command, which runs a command line each
+        time files change (see C{daudinlib.watch.parseWatch}), showing its
+        latest output in place, until Ctrl-C is pressed or the command line
+        fails.
+
+        @param text: The C{str} text after '%watch'.
+        @return: C{True}.
+        """
+        if text and not text[0].isspace():
+            print('Unknown special command %r.' % ('%watch' + text),
+                  file=sys.stderr)
+            return True
+
+        paths, commandLine = parseWatch(text)
+        if not commandLine:
+            print('Give a command line to %watch.', file=sys.stderr)
+            return True
+
+        pipeline = self.pipeline
+        fp = pipeline.outfp
+        try:
+            terminal = fp.isatty()
+        except (AttributeError, ValueError):
+            terminal = False
+        saved = (pipeline.usePtys, pipeline.pager, pipeline.displayLines)
+
+        try:
+            watcher = makeWatcher(paths)
+        except OSError as e:
+            print('Could not watch %s: %s' % (', '.join(paths), e),
+                  file=sys.stderr)
+            return True
+
+        try:
+            while True:
+                # The output is collected and then shown all at once, so
+                # the previous output can be overwritten.
+                out = pipeline.outfp = StringIO()
+                pipeline.usePtys = False
+                pipeline.pager = None
+                if terminal:
+                    pipeline.displayLines = get_terminal_size().lines - 3
+                try:
+                    # Kept stage values are not used, as the point is to
+                    # see what has changed.
+                    ok = self.runCommandLine(commandLine, resume=False)
+                finally:
+                    pipeline.outfp = fp
+                    (pipeline.usePtys, pipeline.pager,
+                     pipeline.displayLines) = saved
+                header = '%%watch %s  (%s)' % (commandLine,
+                                               strftime('%H:%M:%S'))
+                redraw(fp, header, out.getvalue(), terminal)
+                if ok is False:
+                    break
+                # Ignore changes made while the command line ran (e.g., by
+                # the command line itself).
+                watcher.clear()
+                watcher.wait()
+        except KeyboardInterrupt:
+            print(file=fp)
+        finally:
+            watcher.close()
+
+        return True
+
     def _handleSpecial(self, command):
         strippedCommand = command.strip()
         pipeline = self.pipeline
@@ -66,14 +221,70 @@ class _DaudinBase:
                 pipeline.debug = True
             return True
 
-        if strippedCommand == '%u':
-            pipeline.undo()
+        if strippedCommand == '%u' or strippedCommand.startswith('%u '):
+            args = strippedCommand[2:].split()
+            if not args:
+                pipeline.undo()
+            elif len(args) == 1 and args[0].isdigit() and int(args[0]):
+                try:
+                    pipeline.undo(int(args[0]))
+                except IndexError:
+                    print('Only %d earlier result%s kept.' % (
+                        len(pipeline.resultHistory),
+                        '' if len(pipeline.resultHistory) == 1 else 's'),
+                        file=sys.stderr)
+            else:
+                print('Give a positive number to %u.', file=sys.stderr)
+            return True
+
+        if strippedCommand == '%save' or strippedCommand.startswith('%save '):
+            args = shlex.split(strippedCommand[5:])
+            if len(args) == 1:
+                try:
+                    pipeline.save(args[0])
+                except Exception as e:
+                    print('Could not save %r: %s' % (args[0], e),
+                          file=sys.stderr)
+            else:
+                print('Give one name to %save.', file=sys.stderr)
+            return True
+
+        if strippedCommand == '%load' or strippedCommand.startswith('%load '):
+            args = shlex.split(strippedCommand[5:])
+            if len(args) == 1:
+                try:
+                    pipeline.load(args[0])
+                except (KeyError, ValueError):
+                    print('No saved result %r.' % args[0], file=sys.stderr)
+            elif args:
+                print('Give one name to %load.', file=sys.stderr)
+            else:
+                # List the saved names.
+                for name in pipeline.results:
+                    print(name)
+            return True
+
+        if strippedCommand == '%hist' or strippedCommand.startswith('%hist '):
+            if self.history is None:
+                print('No command history is being kept.', file=sys.stderr)
+            else:
+                for entry in self.history.search(strippedCommand[5:]):
+                    print('%6d  %s  %s' % (
+                        entry.id,
+                        strftime('%Y-%m-%d %H:%M',
+                                 localtime(entry.started or 0)),
+                        entry.command))
             return True
 
         if strippedCommand == '_':
             pipeline.print_()
             return True
 
+        if strippedCommand == '%as' or strippedCommand.startswith('%as '):
+            print('Give one format to %%as (%s).' % ', '.join(FORMATS),
+                  file=sys.stderr)
+            return True
+
         return False
 
 
@@ -89,13 +300,16 @@ class REPL(_DaudinBase):
         function that returns a C{str}. Note that the passed value will
         only be used if C{sys.ps2} is not already set. The value may have
         already been set when reading the user's daudin init file.
+    @param history: A C{daudinlib.history.History} to record command lines
+        in, or C{None}.
     """
 
     DEFAULT_PS1 = '>>> '
     DEFAULT_PS2 = '... '
 
-    def __init__(self, pipeline=None, ps1=DEFAULT_PS1, ps2=DEFAULT_PS2):
-        super().__init__(pipeline)
+    def __init__(self, pipeline=None, ps1=DEFAULT_PS1, ps2=DEFAULT_PS2,
+                 history=None):
+        super().__init__(pipeline, history)
 
         try:
             sys.ps1
@@ -132,7 +346,56 @@ class REPL(_DaudinBase):
 
     def run(self):
         for commandLine in self._readStdin():
-            self.runCommandLine(commandLine)
+            if self.history is None or not commandLine.strip():
+                self.runText(commandLine)
+            else:
+                cwd = os.getcwd()
+                started = time()
+                ok = self.runText(commandLine)
+                self.history.add(
+                    commandLine, cwd=cwd, started=started,
+                    duration=time() - started,
+                    status=self.pipeline.status if ok else 1)
+
+    def runText(self, text):
+        """
+        Run text read from the user. With bracketed paste (see
+        C{daudinlib.readline.setupReadline}), text pasted into the terminal
+        arrives all at once and may have several lines. If these are all
+        Python, they are compiled and run as one block (whose final
+        expression, if any, is printed and becomes the pipeline value, as it
+        would if the lines were typed). Otherwise they are run one at a
+        time, as in a script.
+
+        @param text: The C{str} text.
+        @return: C{False} if a command failed, else C{True}.
+        """
+        if '\n' not in text:
+            return self.runCommandLine(text)
+
+        text = text.rstrip('\n')
+        compiled = None if self.pipeline.incomplete else compileBlock(text)
+
+        if compiled is None:
+            for line in text.split('\n'):
+                if self.runCommandLine(line) is False:
+                    return False
+            return True
+
+        try:
+            doPrint = self.pipeline.runBlock(*compiled)
+        except KeyboardInterrupt:
+            print('^C', file=sys.stderr)
+            self.reset()
+            return False
+        except Exception:
+            print(traceback.format_exc(), file=sys.stderr)
+            self.reset()
+            return False
+
+        if doPrint:
+            self.pipeline.print_()
+        return True
 
     def runCommand(self, command, commandNumber=1, nCommands=1):
         pipeline = self.pipeline
@@ -0,0 +1,358 @@
+import os
+import re
+import signal
+import resource
+import threading
+from contextlib import contextmanager
+from math import ceil
+
+# The exit status given to a command that is stopped for going over a
+# limit (as used by the timeout command).
+LIMIT_STATUS = 124
+
+_DESCRIPTIONS = {
+    'time': 'Time',
+    'cpu': 'CPU time',
+    'mem': 'Memory',
+    'out': 'Output',
+}
+
+_SECONDS = {'': 1, 's': 1, 'm': 60, 'h': 3600}
+_SIZES = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+_LIMIT = re.compile(r'\s*(time|cpu|mem|out)=(\S+)')
+_VALUE = re.compile(r'(\d+(?:\.\d*)?|\.\d+)([a-z]?)$')
+
+# The smallest time limit, so a stage that starts after the time for its
+# command line has run out is stopped at once (a timer of zero seconds
+# would never fire).
+_MIN_TIME = 0.001
+
+
+class LimitExceeded(BaseException):
+    """
+    Raised in a Python stage that goes over one of its limits.
+
+    This is not an C{Exception}, so a stage that is stopped is not mistaken
+    for one that failed (which daudin would then try running in another
+    way).
+
+    @param name: The C{str} name of the limit ('time', 'cpu', 'mem' or
+        'out').
+    """
+    def __init__(self, name):
+        super().__init__(name)
+        self.name = name
+
+    def __str__(self):
+        return '%s limit exceeded.' % _DESCRIPTIONS[self.name]
+
+
+def _parseValue(name, value):
+    """
+    Convert a limit value (e.g., '30s' or '2G') to a number.
+
+    @param name: The C{str} name of the limit.
+    @param value: The C{str} value, or 'none'.
+    @raise ValueError: If C{value} cannot be converted.
+    @return: A C{float} number of seconds (for 'time' or 'cpu') or an
+        C{int} number of bytes or characters (for 'mem' or 'out'), or
+        C{None} for no limit.
+    """
+    value = value.lower()
+    if value == 'none':
+        return None
+
+    match = _VALUE.match(value)
+    units = _SECONDS if name in ('time', 'cpu') else _SIZES
+    if match is None or match.group(2) not in units:
+        raise ValueError('Invalid %s limit %r.' % (name, value))
+
+    number = float(match.group(1)) * units[match.group(2)]
+    return number if units is _SECONDS else int(number)
+
+
+def _formatValue(name, value):
+    if value is None:
+        return 'none'
+    elif name in ('time', 'cpu'):
+        return '%gs' % value
+    for suffix in 'TGMK':
+        size = _SIZES[suffix.lower()]
+        if value >= size and value % size == 0:
+            return '%d%s' % (value // size, suffix)
+    return str(value)
+
+
+def parseLimits(text):
+    """
+    Parse limit settings from the start of some text.
+
+    @param text: A C{str} such as 'time=10s mem=1G find / -name x'.
+        The limits are 'time' (wall time, in seconds, or with an 's', 'm'
+        or 'h' suffix), 'cpu' (CPU time, likewise), 'mem' (memory, in
+        bytes, or with a 'k', 'M', 'G' or 'T' suffix) and 'out' (output,
+        in characters, likewise). A value of 'none' removes a limit.
+    @raise ValueError: If a limit value is invalid.
+    @return: A C{tuple} of a C{dict} of the limits (mapping C{str} names
+        to values) and the C{str} remainder of C{text}.
+    """
+    limits = {}
+    while True:
+        match = _LIMIT.match(text)
+        if match is None:
+            return limits, text.strip()
+        name, value = match.groups()
+        limits[name] = _parseValue(name, value)
+        text = text[match.end():]
+
+
+class Limits:
+    """
+    Limits on the wall time, CPU time, memory and output of a pipeline
+    stage (or a whole command line). A limit of C{None} means no limit.
+
+    @param time: The C{float} number of seconds (of wall time).
+    @param cpu: The C{float} number of seconds of CPU time.
+    @param mem: The C{int} number of bytes of memory (address space).
+    @param out: The C{int} number of characters of output.
+    """
+    NAMES = ('time', 'cpu', 'mem', 'out')
+
+    def __init__(self, time=None, cpu=None, mem=None, out=None):
+        self.time = time
+        self.cpu = cpu
+        self.mem = mem
+        self.out = out
+
+    @classmethod
+    def fromString(cls, text):
+        """
+        Make a C{Limits} from a string of settings (see C{parseLimits}).
+
+        @param text: A C{str} such as 'time=10s mem=1G'.
+        @raise ValueError: If C{text} has anything other than limits in it.
+        @return: A C{Limits}.
+        """
+        limits, rest = parseLimits(text)
+        if rest:
+            raise ValueError('Invalid limit %r.' % rest)
+        return cls(**limits)
+
+    def __bool__(self):
+        return any(getattr(self, name) is not None for name in self.NAMES)
+
+    def __eq__(self, other):
+        if isinstance(other, Limits):
+            return all(getattr(self, name) == getattr(other, name)
+                       for name in self.NAMES)
+        return NotImplemented
+
+    def __str__(self):
+        return ' '.join('%s=%s' % (name, _formatValue(name,
+                                                      getattr(self, name)))
+                        for name in self.NAMES)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self)
+
+    def update(self, limits):
+        """
+        Make new limits with some of these replaced.
+
+        @param limits: A C{dict} mapping C{str} limit names to new values.
+        @return: A new C{Limits}.
+        """
+        values = {name: getattr(self, name) for name in self.NAMES}
+        values.update(limits)
+        return Limits(**values)
+
+    def tighter(self, other):
+        """
+        Combine these limits with others, keeping the lower of each.
+
+        @param other: A C{Limits}.
+        @return: A new C{Limits}.
+        """
+        values = {}
+        for name in self.NAMES:
+            mine, theirs = getattr(self, name), getattr(other, name)
+            values[name] = (theirs if mine is None else
+                            mine if theirs is None else min(mine, theirs))
+        return Limits(**values)
+
+    def remaining(self, elapsed, cpu):
+        """
+        Get the limits that are left once some time has been used (e.g., by
+        the earlier stages of a command line).
+
+        @param elapsed: The C{float} number of seconds of wall time used.
+        @param cpu: The C{float} number of seconds of CPU time used.
+        @return: A new C{Limits}.
+        """
+        return Limits(
+            time=(None if self.time is None else
+                  max(self.time - elapsed, _MIN_TIME)),
+            cpu=None if self.cpu is None else max(self.cpu - cpu, _MIN_TIME),
+            mem=self.mem, out=self.out)
+
+    def childSetup(self):
+        """
+        Get a function to set the CPU time and memory limits (with
+        C{resource.setrlimit}) in a child process, for the C{preexec_fn}
+        argument of C{subprocess.Popen}.
+
+        Note that a C{preexec_fn} stops C{subprocess} from starting the
+        child with C{vfork} (so the whole of this process is forked), so it
+        should only be used when needed.
+
+        @return: A no-argument function, or C{None} if there are no CPU time
+            or memory limits.
+        """
+        settings = []
+        if self.cpu is not None:
+            # The process gets SIGXCPU at the soft limit, and SIGKILL at
+            # the hard limit.
+            seconds = max(ceil(self.cpu), 1)
+            settings.append((resource.RLIMIT_CPU, seconds, seconds + 1))
+        if self.mem is not None:
+            settings.append((resource.RLIMIT_AS, self.mem, self.mem))
+
+        if not settings:
+            return None
+
+        def setup():
+            for which, soft, hard in settings:
+                _, oldHard = resource.getrlimit(which)
+                if oldHard != resource.RLIM_INFINITY:
+                    soft, hard = min(soft, oldHard), min(hard, oldHard)
+                resource.setrlimit(which, (soft, hard))
+
+        return setup
+
+
+def cpuUsed():
+    """
+    Get the CPU time used so far by this process and its (finished)
+    children.
+
+    @return: A C{float} number of seconds.
+    """
+    total = 0.0
+    for who in resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN:
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _addressSpace():
+    """
+    Get the size of this process' address space.
+
+    @return: The C{int} number of bytes, or C{None} if it is not known.
+    """
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@contextmanager
+def enforced(limits):
+    """
+    Enforce the time, CPU time and memory limits of a stage run in this
+    process (i.e., Python code). Time limits use interval timers, whose
+    signals raise C{LimitExceeded}. Python only handles signals between
+    bytecodes, so a single long call into C code (e.g.,
+    C{sum(range(10 ** 10))}) is not stopped until it returns (a thread
+    calling C{_thread.interrupt_main} would be no quicker). The memory
+    limit lowers this process' address space limit (with
+    C{resource.setrlimit}) to allow C{limits.mem} more bytes, and a
+    C{MemoryError} becomes C{LimitExceeded}. Limits can only be enforced in
+    the main thread.
+
+    @param limits: A C{Limits}.
+    @raise LimitExceeded: If a limit is exceeded.
+    """
+    if (limits.time is None and limits.cpu is None and limits.mem is None
+            or threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    def expired(signum, frame):
+        raise LimitExceeded('time' if signum == signal.SIGALRM else 'cpu')
+
+    timers = []
+    if limits.time is not None:
+        timers.append((signal.ITIMER_REAL, signal.SIGALRM, limits.time))
+    if limits.cpu is not None:
+        timers.append((signal.ITIMER_PROF, signal.SIGPROF, limits.cpu))
+
+    oldHandlers = []
+    for timer, signum, seconds in timers:
+        oldHandlers.append((signum, signal.signal(signum, expired)))
+        signal.setitimer(timer, seconds)
+
+    oldMemory = None
+    if limits.mem is not None:
+        size = _addressSpace()
+        if size is not None:
+            oldMemory = resource.getrlimit(resource.RLIMIT_AS)
+            soft = size + limits.mem
+            if oldMemory[1] != resource.RLIM_INFINITY:
+                soft = min(soft, oldMemory[1])
+            resource.setrlimit(resource.RLIMIT_AS, (soft, oldMemory[1]))
+
+    try:
+        yield
+    except MemoryError:
+        if oldMemory is None:
+            raise
+        raise LimitExceeded('mem') from None
+    finally:
+        for timer, _, _ in timers:
+            signal.setitimer(timer, 0)
+        for signum, handler in oldHandlers:
+            signal.signal(signum, handler)
+        if oldMemory is not None:
+            resource.setrlimit(resource.RLIMIT_AS, oldMemory)
+
+
+class Watchdog:
+    """
+    Kill a process (and the processes it starts) if it runs for too long.
+
+    @param process: A C{subprocess.Popen} instance, started in its own
+        session (i.e., process group).
+    @param seconds: The C{float} number of seconds to allow it.
+    @param onKill: A no-argument function to call (in another thread) if
+        the process is killed, or C{None}.
+    """
+    def __init__(self, process, seconds, onKill=None):
+        self.process = process
+        self.onKill = onKill
+        self.fired = False
+        self._lock = threading.Lock()
+        self._timer = threading.Timer(seconds, self._kill)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _kill(self):
+        with self._lock:
+            if self.process.poll() is not None:
+                return
+            self.fired = True
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        if self.onKill is not None:
+            self.onKill()
+
+    def cancel(self):
+        """
+        Stop watching (e.g., because the process has finished).
+        """
+        with self._lock:
+            self._timer.cancel()
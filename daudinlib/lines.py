@@ -0,0 +1,138 @@
+import re
+import sys
+from array import array
+from collections.abc import MutableSequence, Sequence
+from itertools import islice
+
+_NEWLINE = re.compile('\n')
+
+
+class LineBuffer(MutableSequence):
+    """
+    Lines of text (e.g., the output of a shell command) kept as one C{str}
+    and an array of the offsets of the lines in it, rather than as a list
+    of C{str}s. Each C{str} has around 50 bytes of overhead, and a list
+    another 8 bytes per item, so this uses several times less memory when
+    there are many (short) lines. The C{str} of a line is only made when
+    the line is used.
+
+    A C{LineBuffer} can be used like a C{list} of lines. If it is changed
+    (e.g., with C{append} or C{sort}) it is converted to a C{list}
+    internally.
+
+    @param text: A C{str} of lines, each ended by a newline (which may be
+        left off the last line).
+    """
+    def __init__(self, text=''):
+        if text and not text.endswith('\n'):
+            text += '\n'
+        self._text = text
+        # The offset of the start of each line, followed by the offset
+        # just past the end of the text.
+        self._starts = array('Q', [0])
+        self._starts.extend(match.end() for match in _NEWLINE.finditer(text))
+        # The lines, once the buffer has been changed.
+        self._list = None
+
+    @property
+    def text(self):
+        """
+        Get the text of the lines.
+
+        @return: A C{str} with each line followed by a newline (or an empty
+            C{str} if there are no lines).
+        """
+        if self._list is None:
+            return self._text
+        else:
+            return ''.join(line + '\n' for line in self._list)
+
+    def _line(self, index):
+        starts = self._starts
+        return self._text[starts[index]:starts[index + 1] - 1]
+
+    def _change(self):
+        """
+        Convert to a C{list}, so the lines can be changed.
+
+        @return: The C{list} of lines.
+        """
+        if self._list is None:
+            self._list = list(self)
+            self._text = ''
+            self._starts = array('Q', [0])
+        return self._list
+
+    def __len__(self):
+        if self._list is None:
+            return len(self._starts) - 1
+        else:
+            return len(self._list)
+
+    def __getitem__(self, index):
+        if self._list is not None:
+            return self._list[index]
+        elif isinstance(index, slice):
+            return [self._line(i)
+                    for i in range(*index.indices(len(self._starts) - 1))]
+        length = len(self._starts) - 1
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('line index out of range')
+        return self._line(index)
+
+    def __iter__(self):
+        if self._list is not None:
+            return iter(self._list)
+        starts = self._starts
+        text = self._text
+        return (text[start:end - 1]
+                for start, end in zip(starts, islice(starts, 1, None)))
+
+    def __setitem__(self, index, value):
+        self._change()[index] = value
+
+    def __delitem__(self, index):
+        del self._change()[index]
+
+    def insert(self, index, value):
+        self._change().insert(index, value)
+
+    def sort(self, *, key=None, reverse=False):
+        self._change().sort(key=key, reverse=reverse)
+
+    def copy(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        # The text (and the lines) cannot be changed, so can be shared.
+        result = LineBuffer()
+        result._text = self._text
+        result._starts = array('Q', self._starts)
+        result._list = None if self._list is None else list(self._list)
+        return result
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __sizeof__(self):
+        size = object.__sizeof__(self) + sys.getsizeof(self._text)
+        size += sys.getsizeof(self._starts)
+        if self._list is not None:
+            size += sys.getsizeof(self._list) + sum(
+                sys.getsizeof(line) for line in self._list)
+        return size
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from copy import deepcopy
+
+from daudinlib.results import MappedLines, estimateSize
+
+# The start value of a cached stage that does not depend on the value _ had
+# when its command line started.
+INDEPENDENT = object()
+
+
+def snapshot(value, limit=None):
+    """
+    Copy a value to keep in the stage cache, so that changes made to it
+    afterwards (e.g., by a later stage such as '_.append(3)') do not change
+    the kept value.
+
+    @param value: A pipeline value.
+    @param limit: The C{int} estimated size (see
+        C{daudinlib.results.estimateSize}) above which a value is not
+        copied (as it could not be kept), or C{None} for no limit.
+    @return: A (deep) copy of C{value}, C{value} itself if it cannot be
+        changed, or C{None} if it cannot (or should not) be copied.
+    """
+    if isinstance(value, (str, bytes, MappedLines)):
+        return value
+    if limit is not None and estimateSize(value) > limit:
+        return None
+    try:
+        return deepcopy(value)
+    except Exception:
+        return None
+
+
+class StageCache:
+    """
+    The values of the first stages of recent command lines. A later command
+    line that starts with the same stages (e.g., one recalled from the
+    history with only its last stage changed) can start from their value,
+    instead of running them again.
+
+    The most recently used values are kept, up to a number of them and a
+    total estimated size (see C{daudinlib.results.estimateSize}).
+
+    @param maxEntries: The C{int} maximum number of values to keep.
+    @param budget: The C{int} number of bytes of memory the values may use.
+    """
+    def __init__(self, maxEntries=32, budget=256 << 20):
+        self.maxEntries = maxEntries
+        self.budget = budget
+        # Map (directory, commands) keys to (start, value, size) tuples.
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<%s: %d value%s, %d bytes>' % (
+            self.__class__.__name__, len(self._entries),
+            '' if len(self._entries) == 1 else 's', self._size)
+
+    def clear(self):
+        """
+        Forget all values (e.g., because files may have changed).
+        """
+        self._entries.clear()
+        self._size = 0
+
+    def add(self, directory, commands, value, start=INDEPENDENT):
+        """
+        Keep the value of the first stages of a command line.
+
+        @param directory: The C{str} directory the command line was run in.
+        @param commands: A C{tuple} of the C{str} commands of the stages.
+        @param value: The value of the last of the stages.
+        @param start: The value of _ when the command line started, if the
+            stages depend on it, else C{INDEPENDENT}.
+        """
+        size = estimateSize(value)
+        key = (directory, commands)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old[2]
+        if size > self.budget:
+            return
+        self._entries[key] = (start, value, size)
+        self._size += size
+        while (len(self._entries) > self.maxEntries or
+               self._size > self.budget):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+    def find(self, directory, commands, start):
+        """
+        Find the value of the most stages at the start of a command line
+        (but not of all of it).
+
+        @param directory: The C{str} directory the command line is being
+            run in.
+        @param commands: A C{tuple} of the C{str} commands of the command
+            line.
+        @param start: The value of _ at the start of the command line.
+        @return: A C{tuple} of the C{int} number of stages found (0 if
+            none) and a copy of their value (see C{snapshot}), so the kept
+            value is not changed by the command line that uses it.
+        """
+        for count in range(len(commands) - 1, 0, -1):
+            key = (directory, commands[:count])
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is INDEPENDENT or
+                                      entry[0] is start):
+                self._entries.move_to_end(key)
+                return count, snapshot(entry[1])
+        return 0, None
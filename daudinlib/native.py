@@ -0,0 +1,396 @@
+import os
+import re
+import shlex
+from functools import lru_cache
+from itertools import groupby, islice
+
+from daudinlib.stream import LineStream
+
+# Characters that (when not quoted) mean a command uses shell features
+# (redirection, globbing, variables, sub-shells, escapes, etc.), in which
+# case it is always given to the shell.
+_shellChars = set('|&;<>()$`\\*?[]{}~!#=\n')
+
+# Characters that make a grep pattern mean something different to grep
+# (basic regular expressions) than to Python's re module.
+_breSpecial = re.compile(r'[\\+?|(){}]|\[:')
+_ereSpecial = re.compile(r'\\|\[:')
+
+_leadingNumber = re.compile(r'\s*(-?\d+(?:\.\d*)?|-?\.\d+)')
+
+# Commands that read their standard input (i.e., the pipeline value).
+READS_STDIN = {'grep', 'head', 'tail', 'wc', 'sort', 'uniq', 'cut'}
+
+
+class Unsupported(Exception):
+    """
+    Raised when a command is given arguments that are not handled natively.
+    """
+
+
+def parseCommand(text):
+    """
+    Split a command into its arguments, if it uses no shell syntax.
+
+    @param text: The C{str} command.
+    @return: A C{list} of C{str} arguments, or C{None} if the command uses
+        shell features (e.g., unquoted metacharacters) or cannot be split.
+    """
+    quote = None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+            elif quote == '"' and char in '$`\\':
+                return None
+        elif char in '\'"':
+            quote = char
+        elif char in _shellChars:
+            return None
+
+    if quote:
+        return None
+
+    try:
+        return shlex.split(text)
+    except ValueError:
+        return None
+
+
+def collationIsNative():
+    """
+    Does the current locale sort strings in code point order (as Python
+    does)?
+
+    @return: A C{bool}.
+    """
+    for name in 'LC_ALL', 'LC_COLLATE', 'LANG':
+        value = os.environ.get(name)
+        if value:
+            return value in {'C', 'POSIX'} or value.startswith('C.')
+    return True
+
+
+@lru_cache(maxsize=128)
+def _compile(pattern, flags):
+    return re.compile(pattern, flags)
+
+
+def _count(value):
+    # Note that this rejects forms like '+3' and '-3', which have special
+    # meanings to head and tail.
+    if value.isdigit():
+        return int(value)
+    else:
+        raise Unsupported()
+
+
+def _headTailCount(args):
+    """
+    Get the number of lines wanted from C{head} or C{tail} arguments.
+    """
+    if not args:
+        return 10
+    elif len(args) == 1 and args[0][:1] == '-' and args[0][1:].isdigit():
+        return int(args[0][1:])
+    elif len(args) == 1 and args[0].startswith('-n'):
+        return _count(args[0][2:])
+    elif len(args) == 2 and args[0] == '-n':
+        return _count(args[1])
+    else:
+        raise Unsupported()
+
+
+def _flags(args, allowed):
+    """
+    Split arguments into single-letter flags and the remaining arguments.
+
+    @param args: A C{list} of C{str} arguments.
+    @param allowed: A C{str} of the allowed flag letters.
+    @raise Unsupported: If an unknown flag is found.
+    @return: A C{tuple} of a C{set} of flag letters and a C{list} of the
+        remaining arguments.
+    """
+    flags = set()
+    for index, arg in enumerate(args):
+        if arg == '--':
+            return flags, args[index + 1:]
+        elif arg.startswith('-') and len(arg) > 1:
+            for letter in arg[1:]:
+                if letter not in allowed:
+                    raise Unsupported()
+                flags.add(letter)
+        else:
+            return flags, args[index:]
+    return flags, []
+
+
+def _stream(lines, process):
+    """
+    Process the lines of a stream lazily, so that, e.g., in
+    'find / | grep x | head' find is stopped once head has its lines.
+
+    @param lines: A C{LineStream}.
+    @param process: A function that takes an iterable of C{str} lines and
+        returns an iterable of C{str} output lines.
+    @return: A C{LineStream} of the output lines. Closing it closes
+        C{lines}.
+    """
+    # The stream is closed by the reader, not by the pipeline.
+    lines.feeding = True
+
+    def output():
+        try:
+            yield from process(lines)
+        finally:
+            lines.close()
+
+    generator = output()
+    return LineStream(generator, close=generator.close)
+
+
+def _breLiteralAnchors(pattern):
+    """
+    Does a basic regular expression have a '^', '$', or '*' that grep would
+    take literally but Python would not (i.e., a '^' that is not at the
+    start, a '$' that is not at the end, or a leading '*')?
+    """
+    return ('^' in pattern[1:] or '$' in pattern[:-1] or
+            pattern.startswith(('*', '^*')))
+
+
+def grep(args, lines):
+    flags, rest = _flags(args, 'vicFEx')
+    if len(rest) != 1:
+        # A file name was given (or no pattern).
+        raise Unsupported()
+    pattern = rest[0]
+
+    if 'F' in flags:
+        if 'i' in flags or 'x' in flags:
+            pattern = re.escape(pattern)
+            match = None
+        else:
+            def match(line):
+                return pattern in line
+    else:
+        match = None
+        if 'E' in flags:
+            if _ereSpecial.search(pattern):
+                raise Unsupported()
+        elif _breSpecial.search(pattern) or _breLiteralAnchors(pattern):
+            raise Unsupported()
+
+    if match is None:
+        if 'x' in flags:
+            pattern = '(?:%s)\\Z' % pattern
+        try:
+            regex = _compile(pattern, re.IGNORECASE if 'i' in flags else 0)
+        except re.error:
+            raise Unsupported()
+        match = regex.match if 'x' in flags else regex.search
+
+    invert = 'v' in flags
+
+    def select(lines):
+        return (line for line in lines if bool(match(line)) != invert)
+
+    if 'c' in flags:
+        return [str(sum(1 for _ in select(lines)))]
+    elif isinstance(lines, LineStream):
+        return _stream(lines, select)
+    else:
+        return list(select(lines))
+
+
+def head(args, lines):
+    return list(islice(lines, _headTailCount(args)))
+
+
+def tail(args, lines):
+    count = _headTailCount(args)
+    return list(lines[-count:]) if count else []
+
+
+def wc(args, lines):
+    if args == ['-l']:
+        count = len(lines)
+    elif args == ['-w']:
+        count = sum(len(line.split()) for line in lines)
+    elif args == ['-c']:
+        count = sum(len(line.encode()) + 1 for line in lines)
+    else:
+        raise Unsupported()
+    return [str(count)]
+
+
+def _numericKey(line):
+    match = _leadingNumber.match(line)
+    return (float(match.group(1)) if match else 0.0), line
+
+
+def sort(args, lines):
+    flags, rest = _flags(args, 'rnu')
+    if rest or not collationIsNative():
+        raise Unsupported()
+    key = _numericKey if 'n' in flags else None
+    result = sorted(lines, key=key, reverse='r' in flags)
+    if 'u' in flags:
+        if key is None:
+            result = [line for line, _ in groupby(result)]
+        else:
+            # As with GNU sort, lines are unique if their keys differ.
+            result = [next(group) for _, group in
+                      groupby(result, key=lambda line: key(line)[0])]
+    return result
+
+
+def uniq(args, lines):
+    flags, rest = _flags(args, 'c')
+    if rest:
+        raise Unsupported()
+    def unique(lines):
+        if 'c' in flags:
+            return ('%7d %s' % (sum(1 for _ in group), line)
+                    for line, group in groupby(lines))
+        else:
+            return (line for line, _ in groupby(lines))
+
+    if isinstance(lines, LineStream):
+        return _stream(lines, unique)
+    else:
+        return list(unique(lines))
+
+
+def _fieldList(spec):
+    """
+    Parse a C{cut} field list (e.g., '1,3-4,6-').
+
+    @return: A function that takes a C{list} of fields and returns the
+        selected ones.
+    """
+    ranges = []
+    for part in spec.split(','):
+        start, dash, end = part.partition('-')
+        try:
+            start = int(start) if start else 1
+            end = (int(end) if end else None) if dash else start
+        except ValueError:
+            raise Unsupported()
+        if start < 1 or (end is not None and end < start):
+            raise Unsupported()
+        ranges.append((start, end))
+
+    def select(fields):
+        return [field for index, field in enumerate(fields, start=1)
+                if any(start <= index and (end is None or index <= end)
+                       for start, end in ranges)]
+
+    return select
+
+
+def cut(args, lines):
+    delimiter = '\t'
+    spec = None
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in ('-f', '-d') and args:
+            value = args.pop(0)
+        elif arg[:2] in ('-f', '-d') and len(arg) > 2:
+            arg, value = arg[:2], arg[2:]
+        else:
+            raise Unsupported()
+        if arg == '-f':
+            spec = value
+        elif len(value) == 1:
+            delimiter = value
+        else:
+            raise Unsupported()
+
+    if spec is None:
+        raise Unsupported()
+
+    select = _fieldList(spec)
+
+    def fields(lines):
+        return (delimiter.join(select(line.split(delimiter)))
+                if delimiter in line else line for line in lines)
+
+    if isinstance(lines, LineStream):
+        return _stream(lines, fields)
+    else:
+        return list(fields(lines))
+
+
+def echo(args, lines):
+    # The echo of some shells (e.g., dash) interprets backslash escapes
+    # such as '\t', and others do not, so leave those to the shell.
+    if args and args[0].startswith('-') or any('\\' in arg for arg in args):
+        raise Unsupported()
+    return ' '.join(args).split('\n')
+
+
+def pwd(args, lines):
+    if args:
+        raise Unsupported()
+    return [os.getcwd()]
+
+
+def true(args, lines):
+    return []
+
+
+COMMANDS = {
+    'grep': grep,
+    'head': head,
+    'tail': tail,
+    'wc': wc,
+    'sort': sort,
+    'uniq': uniq,
+    'cut': cut,
+    'echo': echo,
+    'pwd': pwd,
+    'true': true,
+}
+
+
+def exitStatus(argv, result):
+    """
+    Get the exit status the real command would have given.
+
+    @param argv: A C{list} of C{str} arguments.
+    @param result: The C{list} of C{str} output lines (or C{LineStream})
+        from C{run}.
+    @return: The C{int} exit status (as for grep, 1 if nothing matched).
+    """
+    if argv[0] == 'grep':
+        if 'c' in _flags(argv[1:], 'vicFEx')[0]:
+            return 1 if result == ['0'] else 0
+        return 0 if result else 1
+    return 0
+
+
+def run(argv, lines):
+    """
+    Run a command natively.
+
+    @param argv: A C{list} of C{str} arguments, as returned by
+        C{parseCommand}.
+    @param lines: A C{list} of C{str} input lines, or a C{LineStream} if
+        the input is being streamed.
+    @return: A C{list} of C{str} output lines, or C{None} if the command is
+        not (or cannot be, given its arguments) handled natively. Filters
+        (C{grep}, C{uniq} and C{cut}) given a C{LineStream} return a
+        C{LineStream}, whose lines are only read from the input as they are
+        needed.
+    """
+    try:
+        func = COMMANDS[argv[0]]
+    except (IndexError, KeyError):
+        return None
+
+    try:
+        return func(argv[1:], lines)
+    except Unsupported:
+        return None
@@ -0,0 +1,274 @@
+import builtins
+from array import array
+from bisect import bisect_right
+from io import StringIO
+from math import fsum
+
+from daudinlib.lines import LineBuffer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Note that all the functions below use NumPy if it is installed (pip
+# install daudin[numeric]) and otherwise fall back to the standard library
+# array module (and Python loops). With NumPy, the parsing and the
+# operations are all vectorised.
+
+
+def _text(data):
+    """
+    Get the text of some (shell command) output.
+
+    @param data: A C{str}, C{bytes}, or an iterable of C{str} lines.
+    @return: A C{str}.
+    """
+    if isinstance(data, str):
+        return data
+    elif isinstance(data, LineBuffer):
+        return data.text
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data).decode()
+    else:
+        return '\n'.join(data)
+
+
+def _typecode(dtype):
+    return 'q' if dtype is int else 'd'
+
+
+def nums(data, sep=None, dtype=float):
+    """
+    Parse all the numbers in some text.
+
+    @param data: A C{str} or an iterable of C{str} lines (e.g., the output
+        of a shell command).
+    @param sep: The C{str} separator between numbers on a line, or C{None}
+        to split lines on whitespace.
+    @param dtype: The type of the numbers, either C{float} or C{int}.
+    @return: A one-dimensional NumPy array (or a standard library C{array}
+        if NumPy is not installed).
+    """
+    text = _text(data)
+    if sep is not None:
+        text = text.replace('\n', sep)
+    fields = text.split(sep)
+    if sep is not None:
+        # Ignore empty fields, e.g., due to trailing separators.
+        fields = [field for field in fields if field.strip()]
+
+    if np is None:
+        return array(_typecode(dtype), map(dtype, fields))
+    else:
+        return np.array(fields, dtype=dtype)
+
+
+def cols(data, *columns, sep=None, dtype=float):
+    """
+    Parse columns of numbers from lines of text.
+
+    @param data: A C{str} or an iterable of C{str} lines (e.g., the output
+        of a shell command).
+    @param columns: The C{int} (zero-based) indices of the columns to
+        extract. If none are given, all columns are extracted (in which case
+        all lines must have the same number of fields). Lines may have
+        other (non-numeric) fields in columns that are not extracted.
+    @param sep: The C{str} field separator, or C{None} to split lines on
+        whitespace.
+    @param dtype: The type of the numbers, either C{float} or C{int}.
+    @return: If a single column is extracted, a one-dimensional array of
+        its values. Else a two-dimensional NumPy array (or a C{list} of
+        standard library C{array}s if NumPy is not installed) in which
+        the first index is the column.
+    """
+    text = _text(data)
+
+    if np is None:
+        lines = [line.split(sep) for line in text.split('\n') if line.strip()]
+        if not columns:
+            columns = range(len(lines[0]) if lines else 0)
+        typecode = _typecode(dtype)
+        result = [array(typecode, (dtype(fields[column]) for fields in lines))
+                  for column in columns]
+    else:
+        result = np.loadtxt(StringIO(text), dtype=dtype, delimiter=sep,
+                            usecols=columns or None, ndmin=2, unpack=True)
+
+    return result[0] if len(columns) == 1 else result
+
+
+def arrayLines(value):
+    """
+    Get the lines of text that represent an array, as a shell command
+    should read it.
+
+    @param value: Any value.
+    @return: A C{list} of C{str} lines (one per number, or for a
+        two-dimensional array as returned by C{cols}, one per row with the
+        columns separated by spaces), or C{None} if C{value} is not an
+        array.
+    """
+    if isinstance(value, array):
+        return list(map(str, value))
+    elif np is not None and isinstance(value, np.ndarray):
+        if value.ndim == 1:
+            return list(map(str, value.tolist()))
+        elif value.ndim == 2:
+            # The first index of an array from cols is the column.
+            return [' '.join(map(str, row)) for row in value.T.tolist()]
+    return None
+
+
+def arrayChunks(value, size=4096):
+    """
+    Get the text that represents an array (as for C{arrayLines}) in chunks,
+    without converting the whole array to lines at once.
+
+    @param value: Any value.
+    @param size: The C{int} maximum number of lines in a chunk.
+    @return: A generator of C{str} chunks of lines (each ending with a
+        newline), or C{None} if C{value} is not an array.
+    """
+    if isinstance(value, array):
+        rows = value
+    elif (np is not None and isinstance(value, np.ndarray) and
+          value.ndim in (1, 2)):
+        # The first index of an array from cols is the column.
+        rows = value if value.ndim == 1 else value.T
+    else:
+        return None
+
+    def chunks():
+        if not len(rows):
+            # As for an empty list.
+            yield '\n'
+        for start in range(0, len(rows), size):
+            part = rows[start:start + size]
+            if isinstance(part, array) or part.ndim == 1:
+                lines = map(str, part.tolist())
+            else:
+                lines = (' '.join(map(str, row)) for row in part.tolist())
+            yield '\n'.join(lines) + '\n'
+
+    return chunks()
+
+
+def _asArray(data):
+    """
+    Convert data to an array of numbers, parsing it if necessary.
+
+    @param data: An array, an iterable of numbers, or text to be parsed by
+        C{nums}.
+    @return: A NumPy array (or a standard library C{array} if NumPy is not
+        installed).
+    """
+    if np is None:
+        if isinstance(data, array):
+            return data
+    elif isinstance(data, np.ndarray):
+        return data
+
+    if isinstance(data, (str, bytes, bytearray, memoryview)):
+        return nums(data)
+
+    data = list(data)
+    if data and isinstance(data[0], str):
+        return nums(data)
+    elif np is None:
+        return array('d', data)
+    else:
+        return np.array(data, dtype=float)
+
+
+def nfilter(data, predicate):
+    """
+    Select numbers.
+
+    @param data: An array, an iterable of numbers, or text to be parsed.
+    @param predicate: A function that returns C{True} for numbers that
+        should be kept. With NumPy, this is called once with the whole array
+        and must return a boolean array (e.g., C{lambda a: a > 10}).
+    @return: An array of the selected numbers.
+    """
+    values = _asArray(data)
+    if np is None:
+        return array(values.typecode, filter(predicate, values))
+    else:
+        return values[predicate(values)]
+
+
+def nsum(data):
+    """
+    Add numbers.
+
+    @param data: An array, an iterable of numbers, or text to be parsed.
+    @return: The sum of the numbers.
+    """
+    values = _asArray(data)
+    if np is None:
+        return fsum(values) if values.typecode == 'd' else sum(values)
+    else:
+        return values.sum().item()
+
+
+def percentile(data, q):
+    """
+    Compute percentiles, using linear interpolation between data points.
+
+    @param data: An array, an iterable of numbers, or text to be parsed.
+    @param q: A percentile (between 0 and 100) or a sequence of them.
+    @return: A C{float} percentile, or a list of them if C{q} is a sequence.
+    """
+    values = _asArray(data)
+    if np is not None:
+        result = np.percentile(values, q)
+        return result.tolist()
+
+    values = sorted(values)
+    if not values:
+        raise ValueError('Cannot compute a percentile of no values.')
+
+    def one(q):
+        position = (len(values) - 1) * q / 100.0
+        low = int(position)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (position - low)
+
+    if isinstance(q, (int, float)):
+        return float(one(q))
+    else:
+        return [float(one(x)) for x in q]
+
+
+def histogram(data, bins=10, range=None):
+    """
+    Compute a histogram.
+
+    @param data: An array, an iterable of numbers, or text to be parsed.
+    @param bins: The C{int} number of equal-width bins.
+    @param range: A (min, max) C{tuple} of the range of the bins, or C{None}
+        to use the minimum and maximum of the data.
+    @return: A C{tuple} of (counts, bin edges), as returned by
+        C{numpy.histogram}.
+    """
+    values = _asArray(data)
+    if np is not None:
+        return np.histogram(values, bins=bins, range=range)
+
+    if range is None:
+        low, high = (min(values), max(values)) if values else (0.0, 1.0)
+    else:
+        low, high = range
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+
+    width = (high - low) / bins
+    edges = [low + i * width for i in builtins.range(bins)] + [high]
+    counts = array('q', [0] * bins)
+    for value in values:
+        if low <= value <= high:
+            # Values equal to the upper edge go in the last bin.
+            counts[min(bisect_right(edges, value) - 1, bins - 1)] += 1
+
+    return counts, array('d', edges)
@@ -0,0 +1,184 @@
+import os
+import sys
+import signal
+import traceback
+from os.path import basename, join
+from tempfile import TemporaryDirectory
+
+from daudinlib.server import _exitStatus
+
+
+def _status(waitStatus):
+    """
+    Get the exit status of a process from its C{os.wait} status.
+    """
+    if os.WIFSIGNALED(waitStatus):
+        return 128 + os.WTERMSIG(waitStatus)
+    else:
+        return os.WEXITSTATUS(waitStatus)
+
+
+def outputNames(scriptFiles):
+    """
+    Get the names of the files to write the output of scripts to.
+
+    @param scriptFiles: A C{list} of C{str} script file paths.
+    @return: A C{list} of C{str} names (without a suffix), one for each
+        script, based on the script's file name. Scripts with the same file
+        name (in different directories) are given a numeric suffix.
+    """
+    names = []
+    seen = set()
+    for scriptFile in scriptFiles:
+        name = base = basename(scriptFile.rstrip('/')) or 'script'
+        count = 1
+        while name in seen:
+            count += 1
+            name = '%s-%d' % (base, count)
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _child(scriptFile, outPath, errPath, makePipeline, run):
+    """
+    Run a script, in a child process. This does not return.
+    """
+    status = 1
+    try:
+        for target, path in ((1, outPath), (2, errPath)):
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            os.dup2(fd, target)
+            os.close(fd)
+        fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(fd, 0)
+        os.close(fd)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        pipeline = makePipeline()
+        try:
+            run(pipeline, [scriptFile])
+        except SystemExit as e:
+            status = _exitStatus(e)
+        else:
+            status = pipeline.status
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        for fp in sys.stdout, sys.stderr:
+            try:
+                fp.flush()
+            except Exception:
+                pass
+        os._exit(status & 0xff)
+
+
+def _copy(path, fp, prefix):
+    """
+    Copy the output of a script, adding a prefix to each line.
+    """
+    with open(path, errors='surrogateescape') as output:
+        for line in output:
+            fp.write(prefix + (line if line.endswith('\n') else line + '\n'))
+    fp.flush()
+
+
+def runParallel(scriptFiles, makePipeline, run, jobs, outputDir=None,
+                outfp=sys.stdout, errfp=sys.stderr):
+    """
+    Run independent scripts at the same time, each with its own
+    C{Pipeline} in a separate (forked) process.
+
+    The standard output and error of each script (including that of the
+    shell commands it runs) are collected. If C{outputDir} is given, they
+    are written to files named for the script, with '.out' and '.err'
+    suffixes. Otherwise, they are written to C{outfp} and C{errfp} when the
+    script finishes (in the order the scripts were given), with each line
+    prefixed by the script's path.
+
+    @param scriptFiles: A C{list} of C{str} script file paths.
+    @param makePipeline: A no-argument function that returns a new
+        C{Pipeline}.
+    @param run: A function taking a C{Pipeline} and a C{list} of C{str}
+        script files, which runs them, as the daudin command does.
+    @param jobs: The C{int} maximum number of scripts to run at once.
+    @param outputDir: The C{str} directory to write the output of each
+        script to, or C{None}.
+    @param outfp: The text file to write the standard output of the scripts
+        to, if C{outputDir} is C{None}.
+    @param errfp: The text file to write the standard error of the scripts
+        to, if C{outputDir} is C{None}, and to report failed scripts to.
+    @return: The C{int} exit status: 0 if all the scripts succeeded, else
+        the highest exit status of a script.
+    """
+    jobs = max(1, jobs)
+    names = outputNames(scriptFiles)
+    statuses = [None] * len(scriptFiles)
+    running = {}
+    shown = 0
+
+    if outputDir is not None:
+        os.makedirs(outputDir, exist_ok=True)
+
+    with TemporaryDirectory(prefix='daudin-') as tmpdir:
+        directory = tmpdir if outputDir is None else outputDir
+        paths = [(join(directory, name + '.out'),
+                  join(directory, name + '.err')) for name in names]
+
+        def show(index):
+            prefix = scriptFiles[index] + ': '
+            _copy(paths[index][0], outfp, prefix)
+            _copy(paths[index][1], errfp, prefix)
+
+        def reap(pid, waitStatus):
+            nonlocal shown
+            index = running.pop(pid, None)
+            if index is None:
+                # Not one of ours.
+                return
+            statuses[index] = _status(waitStatus)
+            if outputDir is None:
+                # Show the output of the scripts that have finished, in
+                # order (so the output of a script is not held back by a
+                # later one, and does not get ahead of an earlier one).
+                while shown < len(statuses) and statuses[shown] is not None:
+                    show(shown)
+                    shown += 1
+
+        # Output still buffered here would be written again by each child.
+        for fp in sys.stdout, sys.stderr, outfp, errfp:
+            fp.flush()
+
+        try:
+            for index, scriptFile in enumerate(scriptFiles):
+                while len(running) >= jobs:
+                    reap(*os.wait())
+                pid = os.fork()
+                if pid == 0:
+                    _child(scriptFile, *paths[index], makePipeline, run)
+                running[pid] = index
+
+            while running:
+                reap(*os.wait())
+        except KeyboardInterrupt:
+            # The children got the interrupt too.
+            for pid in running:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in list(running):
+                statuses[running.pop(pid)] = _status(os.waitpid(pid, 0)[1])
+            if outputDir is None:
+                for index in range(shown, len(statuses)):
+                    if statuses[index] is not None:
+                        show(index)
+
+    for scriptFile, status in zip(scriptFiles, statuses):
+        if status is None:
+            print('%s: not run.' % scriptFile, file=errfp)
+        elif status:
+            print('%s: exit status %d.' % (scriptFile, status), file=errfp)
+
+    return max((1 if status is None else status for status in statuses),
+               default=0)
@@ -1,12 +1,238 @@
-import re
+import ast
+from functools import lru_cache
 
-_unescapedPipeRegex = re.compile(r'(?<!\\)\|')
+_OPEN = '([{'
+_CLOSE = ')]}'
+_QUOTES = '\'"`'
 
 
-def lineSplitter(line):
+@lru_cache(maxsize=1024)
+def splitCommandLine(line):
+    """
+    Split a command line into the commands of a pipeline, in a single pass.
+
+    A '|' separates commands unless it is inside a (Python or shell) quoted
+    string, inside brackets (so a Python expression like C{(x | y)} is not
+    split), part of '||' or '|=', in a comment, or escaped with a
+    backslash. An escaped '\\|' is always replaced by '|' (in commands from
+    before quoting was understood, it was the only way to keep a '|').
+
+    Results are cached, so repeated lines (e.g., in loops in scripts or
+    from the history) are only split once.
+
+    @param line: The C{str} command line.
+    @return: A C{tuple} of C{str} commands. There is always at least one
+        (possibly empty) command.
+    """
+    if '|' not in line:
+        return (line,)
+
+    commands = []
+    current = []
     start = 0
-    for match in _unescapedPipeRegex.finditer(line):
-        yield line[start:match.start()].replace(r'\|', '|')
-        start = match.end()
+    depth = 0
+    quote = None
+    index = 0
+    length = len(line)
+
+    while index < length:
+        char = line[index]
+        if char == '\\':
+            if line.startswith('|', index + 1):
+                current.append(line[start:index])
+                start = index + 1
+            # Skip the escaped character.
+            index += 2
+            continue
+        elif quote:
+            if char == quote:
+                quote = None
+        elif char in _QUOTES:
+            quote = char
+        elif char in _OPEN:
+            depth += 1
+        elif char in _CLOSE:
+            if depth:
+                depth -= 1
+        elif char == '#' and (index == 0 or line[index - 1].isspace()):
+            # The rest of the line is a comment.
+            break
+        elif char == '|' and not depth:
+            if line.startswith(('||', '|='), index):
+                index += 2
+                continue
+            else:
+                current.append(line[start:index])
+                commands.append(''.join(current))
+                current = []
+                start = index + 1
+        index += 1
+
+    current.append(line[start:])
+    commands.append(''.join(current))
+    return tuple(commands)
+
+
+def lineSplitter(line):
+    """
+    Split a command line into the commands of a pipeline.
+
+    @param line: The C{str} command line.
+    @return: A generator of C{str} commands (see C{splitCommandLine}).
+    """
+    yield from splitCommandLine(line)
+
+
+_PAIRS = dict(zip(_CLOSE, _OPEN))
+
+
+class CommandBlock:
+    """
+    Collect the lines of an incomplete (multi-line) Python command.
+
+    The bracket depth, string state and backslash continuation of the lines
+    are kept up to date as each line is added, so the block only needs to
+    be compiled when it may be complete, not each time a line is added.
+    This keeps entering (or pasting) a long function definition linear in
+    its length.
+    """
+    def __init__(self):
+        self.lines = []
+        # The open brackets, innermost last.
+        self._brackets = []
+        # The quote of an open (triple-quoted or continued) string.
+        self._quote = None
+        self._continued = False
+        self._error = False
+        # Whether the block is a compound statement (e.g., a 'def'), which
+        # is only ended by a blank or unindented line.
+        self._compound = False
+
+    @property
+    def text(self):
+        """
+        Get the text of the block.
+
+        @return: The C{str} lines of the block, joined with newlines.
+        """
+        return '\n'.join(self.lines)
+
+    @property
+    def open(self):
+        """
+        Is the block inside brackets, a string, or a continued line?
+        """
+        return bool(self._brackets or self._quote or self._continued)
+
+    def add(self, line):
+        """
+        Add a line to the block.
+
+        @param line: The C{str} line to add.
+        @return: C{True} if the block should now be compiled (it may be
+            complete, or contains an error), else C{False}.
+        """
+        self.lines.append(line)
+        self._scan(line)
+        if self._error:
+            return True
+        elif self.open:
+            return False
+        elif self._compound:
+            return not line.strip() or not line[:1].isspace()
+        else:
+            return True
+
+    def incomplete(self):
+        """
+        Note that the block (so far) did not compile because it is
+        incomplete. If it is not open, it must be a compound statement.
+        """
+        if not self.open:
+            self._compound = True
+
+    def _scan(self, line):
+        """
+        Update the block state for a new line.
+
+        @param line: The C{str} line.
+        """
+        self._continued = False
+        quote = self._quote
+        brackets = self._brackets
+        index = 0
+        length = len(line)
+
+        while index < length:
+            char = line[index]
+            if quote:
+                if char == '\\':
+                    if index == length - 1:
+                        self._continued = True
+                    index += 2
+                    continue
+                elif line.startswith(quote, index):
+                    index += len(quote)
+                    quote = None
+                    continue
+            elif char == '#':
+                break
+            elif char == '\\':
+                if index == length - 1:
+                    self._continued = True
+            elif char in '\'"':
+                quote = char * 3 if line.startswith(char * 3, index) else char
+                index += len(quote)
+                continue
+            elif char in _OPEN:
+                brackets.append(char)
+            elif char in _CLOSE:
+                if brackets and brackets[-1] == _PAIRS[char]:
+                    brackets.pop()
+                else:
+                    self._error = True
+            index += 1
+
+        if quote and len(quote) == 1 and not self._continued:
+            # An unterminated single-quoted string.
+            self._error = True
+            quote = None
+
+        self._quote = quote
+
+
+def compileBlock(text):
+    """
+    Compile a block of lines (e.g., pasted into the REPL) as Python, if it
+    is Python.
+
+    A block that compiles but has a top-level expression statement that is
+    not a call or a constant (e.g., 'ls' or 'ls -l', which daudin would give
+    to the shell) is not taken to be Python.
+
+    If the block ends with an expression, it is compiled separately, so
+    its value can be shown and used as the pipeline value (as it would be
+    if the lines were entered one at a time).
+
+    @param text: The C{str} block.
+    @return: A C{tuple} of a code object for the block and one for its
+        final expression (or C{None} if it does not end with one), or
+        C{None} if C{text} should be run line by line.
+    """
+    try:
+        tree = ast.parse(text, '<input>', 'exec')
+    except (OverflowError, SyntaxError, ValueError):
+        return None
+
+    for statement in tree.body:
+        if (isinstance(statement, ast.Expr) and
+                not isinstance(statement.value, (ast.Call, ast.Constant))):
+            return None
+
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        expression = compile(ast.Expression(tree.body.pop().value),
+                             '<input>', 'eval')
+    else:
+        expression = None
 
-    yield line[start:].replace(r'\|', '|')
+    return compile(tree, '<input>', 'exec'), expression
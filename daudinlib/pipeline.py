@@ -1,18 +1,38 @@
 import os
 import sys
 import re
+import builtins
 import select
 import termios
 import tty
 import pty
 import signal
 from code import compile_command
-from io import StringIO, TextIOWrapper
+from io import StringIO, IOBase
 from contextlib import contextmanager
+from functools import wraps
 from os.path import exists, join, expanduser
+from symtable import symtable
+from time import monotonic
+from types import CodeType
 import traceback
 from subprocess import Popen, PIPE, CalledProcessError, run
 
+from daudinlib.capture import LineCapture, ErrorBuffer, drain, redirect
+from daudinlib.decode import decode
+from daudinlib.files import read, writeValue
+from daudinlib.lines import LineBuffer
+from daudinlib.memo import StageCache, INDEPENDENT, snapshot
+from daudinlib.limits import (
+    Limits, LimitExceeded, LIMIT_STATUS, Watchdog, enforced, cpuUsed)
+from daudinlib.parse import CommandBlock
+from daudinlib.results import ResultStore, ResultHistory, MappedLines
+from daudinlib.serialize import Feed, Recording
+from daudinlib.sort import xsort
+from daudinlib.stream import (
+    LineStream, processLines, iteratorLines, isIterator, isSelfContained)
+from daudinlib import numeric, native, display
+
 _originalStdout = sys.stdout
 
 # The following escape sequence regex is taken from
@@ -28,29 +48,113 @@ ANSI_esc = re.compile(r'''
 ''', re.VERBOSE)
 
 
-@contextmanager
-def newStdout(stdout=None):
-    originalStdout = sys.stdout
-    stdout = stdout or StringIO()
-    sys.stdout = stdout
+# The names of earlier values of _ (see Pipeline.resultHistory).
+_PAST_NAME = re.compile(r'_[1-9]\d*$')
+
+# The functions given to Python commands that operate on _ (see
+# Pipeline._onStdin).
+_STDIN_FUNCTIONS = (numeric.nums, numeric.cols, numeric.nfilter,
+                    numeric.nsum, numeric.percentile, numeric.histogram,
+                    decode, xsort)
+
+# Names that show that a command may use the value of _ (or other pipeline
+# state) without it being given to the command on its standard input.
+_USES_STATE = re.compile(
+    r'(?<![\w.])(?:_\w*|self|sh|write|tee|%s)(?!\w)' % '|'.join(
+        func.__name__ for func in _STDIN_FUNCTIONS))
+
+# Names that show that a command may write _ to a file (so the stage must
+# be run again, rather than its value being taken from the stage cache).
+_WRITES = re.compile(r'(?<![\w.])(?:write|tee)(?!\w)')
+
+# Marks a stage whose value was taken from the stage cache.
+_CACHED = object()
+
+
+def _pastNames(codeobj):
+    """
+    Get the names of earlier values of _ (e.g., '_1') that a code object (or
+    any code nested in it) uses.
+
+    @param codeobj: A code object.
+    @return: A C{set} of C{str} names.
+    """
+    names = {name for name in codeobj.co_names if _PAST_NAME.match(name)}
+    for const in codeobj.co_consts:
+        if isinstance(const, CodeType):
+            names |= _pastNames(const)
+    return names
+
+
+def _onlyBuiltins(table, namespace):
+    """
+    Check that Python code uses no global names other than _ and builtins,
+    and sets none, so its value depends only on the value of _ (e.g.,
+    '[x * 2 for x in _]', but not '[x * n for x in _]').
+
+    @param table: The C{symtable.SymbolTable} of the code.
+    @param namespace: The C{dict} namespace the code is run in. Builtins
+        that have been replaced in it do not count.
+    @return: A C{bool}.
+    """
+    for symbol in table.get_symbols():
+        if table.get_type() == 'module' or symbol.is_global():
+            if symbol.is_assigned() or symbol.is_imported():
+                return False
+            name = symbol.get_name()
+            if (symbol.is_referenced() and name != '_' and
+                    (name in namespace or not hasattr(builtins, name))):
+                return False
+    return all(_onlyBuiltins(child, namespace)
+               for child in table.get_children())
+
+
+def _keepable(source, mode, namespace):
+    """
+    Check whether the value of a Python command can be kept in the stage
+    cache (see C{_onlyBuiltins}).
+
+    @param source: The C{str} Python source.
+    @param mode: The C{str} compile mode, 'eval' or 'exec'.
+    @param namespace: The C{dict} namespace the code is run in.
+    @return: A C{bool}.
+    """
     try:
-        yield stdout
-    except Exception:
-        raise
-    finally:
-        sys.stdout = originalStdout
+        return _onlyBuiltins(symtable(source, '<input>', mode), namespace)
+    except SyntaxError:
+        return False
 
 
-@contextmanager
-def newStdin(fp):
-    originalStdin = sys.stdin
-    sys.stdin = fp
+def _getcwd():
+    """
+    Get the current directory.
+
+    @return: The C{str} directory, or C{None} if it no longer exists.
+    """
     try:
-        yield fp
-    except Exception:
-        raise
-    finally:
-        sys.stdin = originalStdin
+        return os.getcwd()
+    except OSError:
+        return None
+
+
+def newStdout(stdout=None):
+    """
+    Capture what is printed (to C{sys.stdout}) in this thread.
+
+    @param stdout: The file to write to, or C{None} to use a C{StringIO}.
+    @return: A context manager that gives the file.
+    """
+    return redirect('stdout', stdout or StringIO())
+
+
+def newStdin(fp):
+    """
+    Read standard input (from C{sys.stdin}) from a file, in this thread.
+
+    @param fp: The file to read from.
+    @return: A context manager that gives the file.
+    """
+    return redirect('stdin', fp)
 
 
 class Pipeline:
@@ -59,19 +163,63 @@ class Pipeline:
 
     def __init__(self, outfp=sys.stdout, errfp=sys.stderr, debug=False,
                  printTracebacks=False, loadInitFile=True, shell=None,
-                 usePtys=True):
+                 usePtys=True, errBufferSize=65536, echoErrors=True,
+                 useNative=True, displayLines=None, pager=None,
+                 resultsDir=None, limits=None, lineLimits=None,
+                 resultHistorySize=100, resultHistoryBudget=256 << 20,
+                 stageCache=True):
         self.outfp = outfp
         self.errfp = errfp
+        self.errors = ErrorBuffer(errBufferSize,
+                                  echo=errfp if echoErrors else None)
         self.debug = debug
         self.printTracebacks = printTracebacks
         self.shell = shell or ['/bin/sh', '-c']
         self.usePtys = usePtys
+        self.useNative = useNative
+        self.displayLines = displayLines
+        self.pager = pager
+        # Limits for each stage, and for each command line as a whole.
+        self.limits = limits or Limits()
+        self.lineLimits = lineLimits or Limits()
+        # The wall and CPU time when the current command line started.
+        self._lineStart = (monotonic(), 0.0)
+        # When the latest streamed stage on the command line will be
+        # stopped (if it has a time limit).
+        self._streamDeadline = None
         self.stdin = None
         self.lastStdin = None
+        # The streams started on the current command line.
+        self._streams = []
         self.stdout = None
-        self.pendingText = ''
+        # The lines of an incomplete Python command (or None).
+        self._block = None
         self.initFile = join(expanduser('~'), '.daudin.py')
+        self.results = ResultStore(
+            resultsDir or join(expanduser('~'), '.daudin_results'))
+        # The earlier values of _ (available as _1, _2, etc.), and the value
+        # of _ when the current command line started.
+        self.resultHistory = ResultHistory(resultHistorySize,
+                                           resultHistoryBudget)
+        self._lineValue = None
+        # The values of the first stages of recent command lines (or None
+        # if they are not kept), and the state needed to add to it: the
+        # stages of the current command line (or None if they cannot be
+        # kept), the directory and pipeline state it started with, what was
+        # recorded of the output of its shell commands, and the previous
+        # command line.
+        self.stageCache = StageCache() if stageCache else None
+        self._lineStages = None
+        self._lineDirectory = None
+        self._lineInPipeline = False
+        self._recordings = []
+        self._previousLine = None
+        # Whether the value of the current stage can be kept (a shell
+        # command, or Python that depends only on the value of _).
+        self._stageKeepable = True
         self.lastResultIsList = False
+        # The exit status of the most recent command (as in the shell).
+        self.status = 0
         self.local = self._getLocal()
         if loadInitFile:
             self.loadInitFile()
@@ -79,7 +227,11 @@ class Pipeline:
 
     @property
     def incomplete(self):
-        return bool(self.pendingText)
+        return self._block is not None
+
+    @property
+    def pendingText(self):
+        return '' if self._block is None else self._block.text
 
     def loadInitFile(self):
         """
@@ -95,23 +247,65 @@ class Pipeline:
 
     def _getLocal(self):
         """Prepare a dict to be used with eval/exec."""
-        return {
+        local = {
             'self': self,
             'sh': self.sh,
             'cd': self.cd,
             '_': self.stdin,
+            '_err': [],
+            'results': self.results,
+            'read': read,
+            'write': self.write,
+            'tee': self.tee,
         }
 
+        for func in _STDIN_FUNCTIONS:
+            local[func.__name__] = self._onStdin(func)
+
+        return local
+
+    def _onStdin(self, func):
+        """
+        Make a version of a function that operates on the pipeline value.
+
+        @param func: A function whose first argument is the data to operate
+            on.
+        @return: A function that passes the current pipeline value as the
+            first argument to C{func}, unless a C{data} keyword argument is
+            given.
+        """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            data = kwargs.pop('data') if 'data' in kwargs else self.stdin
+            return func(data, *args, **kwargs)
+
+        return wrapper
+
     def run(self, command, commandNumber=1, nCommands=1):
         self._debug('--> Processing %r.' % command)
-        self.lastStdin = self.stdin
+        previous = self.lastStdin = self.stdin
         self.lastResultIsList = False
+        self.status = 0
+        self._stageKeepable = True
         strippedCommand = command.strip()
 
-        if self.pendingText:
-            # The previous command was incomplete.
-            fullCommand = self.pendingText + '\n' + (
-                command if strippedCommand else '')
+        if commandNumber == 1:
+            self._lineStart = (
+                monotonic(),
+                0.0 if self.lineLimits.cpu is None else cpuUsed())
+            self._streamDeadline = None
+            if self._block is None:
+                self._startLine()
+            else:
+                self._lineStages = None
+
+        if self._block is not None:
+            # The previous command was incomplete. Only compile the block
+            # once it may be complete.
+            if not self._block.add(command if strippedCommand else ''):
+                self._debug('Incomplete command (not compiled).')
+                return True, False
+            fullCommand = self._block.text
         else:
             fullCommand = strippedCommand
 
@@ -142,8 +336,291 @@ class Pipeline:
         else:
             print('Could not handle command %r' % command, file=self.errfp)
             self.reset()
+            self.status = 1
+
+        # If the previous value was being streamed (e.g., from a process or
+        # a generator) into this command, stop its production if this
+        # command did not read it all (e.g., 'find / | head'). This is only
+        # safe if the new value cannot still refer to the stream (as, e.g.,
+        # 'map(int, _)' does). Otherwise the stream is read in full at the
+        # end of the command line. A stream that is being written to a
+        # process is closed when the process has read it.
+        if isSelfContained(self.stdin):
+            for value in previous, self.lastStdin:
+                if (isinstance(value, LineStream) and
+                        value is not self.stdin and not value.feeding):
+                    value.close()
+
+        if self._lineStages is not None:
+            if self.incomplete:
+                self._lineStages = None
+            else:
+                value = self.stdin
+                if not self._stageKeepable:
+                    value = None
+                elif (commandNumber < nCommands and
+                      not isinstance(value, LineStream)):
+                    # Later stages may change the value (e.g., with
+                    # '_.append(3)').
+                    value = snapshot(value, self.stageCache.budget)
+                self._lineStages.append(
+                    (commandNumber, command, value, self.status,
+                     _getcwd()))
+
+        if commandNumber == nCommands:
+            self._settle()
+            if not self.incomplete:
+                self._remember(self._lineValue)
+                self._cacheStages()
+
+        return self.incomplete, doPrint
+
+    def _startLine(self):
+        """
+        Note the state at the start of a command line.
+        """
+        self._lineValue = self.stdin
+        self._lineStages = [] if self.stageCache is not None else None
+        self._lineDirectory = _getcwd()
+        self._lineInPipeline = self.inPipeline
+        self._recordings = []
+
+    def resumeLine(self, commands):
+        """
+        Start a command line, using the value of its first stages from the
+        stage cache if they were run (in the same directory) as the start of
+        an earlier command line. As re-running the previous command line is
+        presumably done to get new results, its stages are always all run.
+
+        @param commands: A C{list} of the C{str} commands of the command
+            line.
+        @return: The C{int} number of stages that should not be run (as
+            their value is now the pipeline value).
+        """
+        line = tuple(command.strip() for command in commands)
+        previous, self._previousLine = self._previousLine, line
+        directory = _getcwd()
+        if (self.stageCache is None or self._block is not None or
+                line == previous or directory is None):
+            return 0
+
+        count, value = self.stageCache.find(directory, line, self.stdin)
+        if not count:
+            return 0
+
+        self._debug('Using the cached value of %r.' % (line[:count],))
+        self._lineStart = (
+            monotonic(), 0.0 if self.lineLimits.cpu is None else cpuUsed())
+        self._streamDeadline = None
+        self._startLine()
+        self._lineStages = [(number, command, _CACHED, 0, directory)
+                            for number, command in enumerate(
+                                    commands[:count], start=1)]
+        self.lastStdin = self.stdin
+        self.stdin = value
+        self.lastResultIsList = False
+        self.status = 0
+        self.inPipeline = True
+        return count
+
+    @staticmethod
+    def _cacheable(value, recordings):
+        """
+        Get a value to keep in the stage cache for the value of a stage.
+
+        @param value: The value of the stage.
+        @param recordings: A C{list} of (C{LineStream}, C{Recording})
+            C{tuple}s, giving what was recorded of streams that were passed
+            directly to shell commands.
+        @return: The value to keep, or C{None} if it cannot be kept (e.g.,
+            it is a stream that was not read to its end).
+        """
+        if isinstance(value, LineStream):
+            if value.eof:
+                lines = value.tolist()
+                # Keep lines of text compactly.
+                try:
+                    text = '\n'.join(lines) + '\n' if lines else ''
+                except TypeError:
+                    return lines
+                return (LineBuffer(text) if text.count('\n') == len(lines)
+                        else lines)
+            for stream, recording in recordings:
+                if stream is value:
+                    return recording.value()
+            return None
+        elif value is not None and isSelfContained(value):
+            return value
+
+    def _cacheStages(self):
+        """
+        Keep the values of the first stages of the command line that just
+        finished, in case a later command line starts with them.
+        """
+        stages, self._lineStages = self._lineStages, None
+        recordings, self._recordings = self._recordings, []
+        if (stages is None or len(stages) < 2 or
+                [stage[0] for stage in stages] !=
+                list(range(1, len(stages) + 1))):
+            return
+
+        commands = tuple(stage[1].strip() for stage in stages)
+        start = (self._lineValue if self._lineInPipeline or not commands[0]
+                 or _USES_STATE.search(commands[0]) else INDEPENDENT)
+        for count, (_, _, value, status, directory) in enumerate(
+                stages[:-1], start=1):
+            if _WRITES.search(commands[count - 1]):
+                break
+            if value is _CACHED:
+                continue
+            if (status or directory is None or
+                    directory != self._lineDirectory):
+                break
+            value = self._cacheable(value, recordings)
+            if value is None:
+                break
+            self.stageCache.add(directory, commands[:count], value, start)
+
+    def fresh(self):
+        """
+        Forget the values of the stages of earlier command lines, so they
+        are all run again.
+        """
+        if self.stageCache is not None:
+            self.stageCache.clear()
+
+    def _remember(self, value):
+        """
+        Add an earlier value of _ to the result history, if it has changed.
+
+        @param value: The earlier value.
+        """
+        if value is not None and value is not self.stdin:
+            self.resultHistory.push(value)
+
+    @contextmanager
+    def _pastValues(self, *codeobjs):
+        """
+        Make the earlier values of _ (_1, _2, etc.) that code objects use
+        available to them while they run. They are only looked up if they
+        are used (so values that were written to disk are not read
+        otherwise), and are not kept afterwards. Names the user has set
+        (e.g., with '_2 = 99') are left alone.
 
-        return bool(self.pendingText), doPrint
+        @param codeobjs: Code objects (or C{None}s, which are ignored).
+        """
+        names = set()
+        for codeobj in codeobjs:
+            if codeobj is not None:
+                names |= _pastNames(codeobj)
+        local = self.local
+        injected = {}
+        for name in names - local.keys():
+            try:
+                value = self.resultHistory[int(name[1:])]
+            except IndexError:
+                continue
+            injected[name] = local[name] = value
+        try:
+            yield
+        finally:
+            for name, value in injected.items():
+                if local.get(name) is value:
+                    del local[name]
+
+    def _settle(self):
+        """
+        Read the rest of any streamed pipeline values. This is done at the
+        end of each command line, so streams do not outlive the command line
+        they were created in.
+        """
+        streamed = False
+        # The pipeline values are read first, as they may be reading from
+        # (e.g., decoding) other streams.
+        if isinstance(self.stdin, LineStream):
+            self.stdin = self.stdin.tolist()
+            streamed = True
+        if isinstance(self.lastStdin, LineStream):
+            self.lastStdin = self.lastStdin.tolist()
+            streamed = True
+        for stream in self._streams:
+            if not stream.closed:
+                stream.tolist()
+                streamed = True
+        self._streams = []
+        if streamed:
+            self.local['_err'] = self.errors.lines()
+
+    @contextmanager
+    def limited(self, limits):
+        """
+        Change some of the stage limits for a while (e.g., for one command
+        line).
+
+        @param limits: A C{dict} mapping C{str} limit names to new values
+            (see C{daudinlib.limits.parseLimits}).
+        """
+        original = self.limits
+        self.limits = original.update(limits)
+        try:
+            yield
+        finally:
+            self.limits = original
+
+    def _stageLimits(self):
+        """
+        Get the limits for a stage that is starting now, allowing for the
+        time already used by the command line.
+
+        @return: A C{Limits}.
+        """
+        limits = self.limits
+        if limits.time is not None and self._streamDeadline is not None:
+            # This stage may have to wait for the output of an earlier
+            # (streamed) stage, so it is also allowed the time that stage
+            # has left.
+            wait = self._streamDeadline - monotonic()
+            if wait > 0:
+                limits = limits.update({'time': limits.time + wait})
+        if not self.lineLimits:
+            return limits
+        started, cpu = self._lineStart
+        return limits.tighter(self.lineLimits.remaining(
+            monotonic() - started,
+            0.0 if self.lineLimits.cpu is None else cpuUsed() - cpu))
+
+    def _limitExceeded(self, name):
+        """
+        Report that a stage was stopped for going over a limit.
+
+        @param name: The C{str} name of the limit.
+        """
+        print(LimitExceeded(name), file=self.errfp)
+        self.status = LIMIT_STATUS
+
+    def _stopped(self, exception, so, print_):
+        """
+        Keep the partial output of a Python stage that was stopped for going
+        over a limit.
+
+        @param exception: The C{LimitExceeded} that stopped the stage.
+        @param so: The C{LineCapture} of the stage's standard output.
+        @param print_: If C{True}, the output should be printed.
+        @return: A C{tuple} of two C{bool}s, indicating that the command was
+            handled and whether its output needs to be printed.
+        """
+        self._debug('Stopped: %s' % exception)
+        self._limitExceeded(exception.name)
+        self._block = None
+        stdout = so.result()
+        self.lastStdin = self.stdin
+        self.stdin = stdout
+        if so.echo is None:
+            self.lastResultIsList = isinstance(stdout, list)
+            return True, print_ and stdout is not None
+        else:
+            self.lastResultIsList = False
+            return True, False
 
     def _tryEval(self, strippedCommand, print_):
         if not strippedCommand:
@@ -153,9 +630,15 @@ class Pipeline:
         self._debug('Trying eval %r.' % (strippedCommand,))
         self._debug('self.stdin is %r.' % (self.stdin,))
         self.local['_'] = self.stdin
+        limits = self._stageLimits()
+        so = LineCapture(maxChars=limits.out)
         try:
-            with newStdout() as so:
-                result = eval(strippedCommand, self.local)
+            codeobj = compile(strippedCommand, '<input>', 'eval')
+            with newStdout(so), self._pastValues(codeobj):
+                with enforced(limits):
+                    result = eval(codeobj, self.local)
+        except LimitExceeded as e:
+            return self._stopped(e, so, print_)
         except Exception as e:
             self._debug('Could not eval: %s.' % e)
             if self.printTracebacks:
@@ -163,23 +646,20 @@ class Pipeline:
             return False, False
         else:
             self._debug('Eval returned %r.' % (result,))
-            self.pendingText = ''
+            self._block = None
+            self._stageKeepable = _keepable(strippedCommand, 'eval',
+                                            self.local)
             if isinstance(result, str):
                 if result.endswith('\n'):
                     result = result[:-1]
             elif result is None:
-                stdout = so.getvalue()
-                if stdout:
-                    self._debug('Eval printed %r.' % (stdout,))
-                    if stdout.endswith('\n'):
-                        stdout = stdout[:-1]
-                    if stdout.find('\n') > -1:
-                        result = stdout.split('\n')
-                        self.lastResultIsList = True
-                    else:
-                        result = stdout
-                else:
+                stdout = so.result()
+                if stdout is None:
                     print_ = False
+                else:
+                    self._debug('Eval printed %r.' % (stdout,))
+                    result = stdout
+                    self.lastResultIsList = isinstance(stdout, list)
 
             if result is self.IGNORE:
                 print_ = False
@@ -192,7 +672,7 @@ class Pipeline:
     def _tryExec(self, command, print_):
         self._debug('Trying to compile %r.' % (command,))
 
-        exception = None
+        exception = stopped = None
 
         try:
             codeobj = compile_command(command)
@@ -200,16 +680,27 @@ class Pipeline:
             self._debug('%s: %s.' % (e.__class__.__name__, e))
             if self.printTracebacks:
                 self._debug(traceback.format_exc())
-            self.pendingText = ''
+            self._block = None
             exception = e
         else:
             self._debug('Command compiled OK.')
-            so = StringIO()
+            # If this is the last command on the line, print output as it is
+            # produced instead of waiting for the command to finish. Note
+            # that if the command then raises an exception (and so is given
+            # to the shell), what it printed has already been shown. This
+            # is deliberate: the alternative would be to hold back all
+            # output until the command finishes.
+            limits = self._stageLimits()
+            so = LineCapture(echo=self.outfp if print_ else None,
+                             maxChars=limits.out)
             if codeobj:
                 self.local['_'] = self.stdin
                 with newStdout(so):
                     try:
-                        exec(codeobj, self.local)
+                        with enforced(limits), self._pastValues(codeobj):
+                            exec(codeobj, self.local)
+                    except LimitExceeded as e:
+                        stopped = e
                     except Exception as e:
                         self._debug('Could not exec: %s.' % e)
                         if self.printTracebacks:
@@ -217,56 +708,206 @@ class Pipeline:
                         exception = e
                     else:
                         self._debug('Exec succeeded.')
-                self.pendingText = ''
+                so.close()
+                if stopped is not None:
+                    return self._stopped(stopped, so, print_)
+                self._block = None
             else:
                 self._debug('Incomplete command.')
-                self.pendingText = command
+                if self._block is None:
+                    self._block = CommandBlock()
+                    self._block.add(command)
+                self._block.incomplete()
 
         if exception is None:
-            if self.pendingText:
+            self._stageKeepable = _keepable(command, 'exec', self.local)
+            if self._block is not None:
                 print_ = False
             else:
-                stdout = so.getvalue()
-                if stdout:
+                stdout = so.result()
+                if stdout is None:
+                    print_ = False
+                else:
                     self._debug('Exec printed %r.' % (stdout,))
-                    if stdout.endswith('\n'):
-                        stdout = stdout[:-1]
-                    if stdout.find('\n') > -1:
-                        self.lastStdin = self.stdin
-                        self.stdin = stdout.split('\n')
-                        self.lastResultIsList = True
+                    self.lastStdin = self.stdin
+                    self.stdin = stdout
+                    if so.echo is None:
+                        self.lastResultIsList = isinstance(stdout, list)
                     else:
-                        self.lastStdin = self.stdin
-                        self.stdin = stdout
-                else:
-                    print_ = False
+                        # The output has already been printed as it was
+                        # produced. As for shell output, the next time it is
+                        # printed we want to see the list.
+                        self.lastResultIsList = False
+                        print_ = False
 
             return True, print_
         else:
             return False, False
 
+    def runBlock(self, codeobj, expression=None):
+        """
+        Run a compiled block of Python (e.g., pasted into the REPL, see
+        C{daudinlib.parse.compileBlock}) in one go, printing its output as
+        it is produced. Exceptions are not caught.
+
+        @param codeobj: A code object.
+        @param expression: A code object for an expression that ends the
+            block (compiled in 'eval' mode), or C{None}. As when a command
+            is run on its own, its value (if not C{None}) becomes the
+            pipeline value.
+        @return: C{True} if the pipeline value should be printed.
+        """
+        self._debug('--> Running a block.')
+        self.lastStdin = self._lineValue = self.stdin
+        self.lastResultIsList = False
+        self.status = 0
+        self.inPipeline = False
+        self.local['_'] = self.stdin
+        self._lineStart = (
+            monotonic(), 0.0 if self.lineLimits.cpu is None else cpuUsed())
+        limits = self._stageLimits()
+        so = LineCapture(echo=self.outfp, maxChars=limits.out)
+        doPrint = False
+        try:
+            with newStdout(so), self._pastValues(codeobj, expression):
+                with enforced(limits):
+                    exec(codeobj, self.local)
+                    result = (None if expression is None else
+                              eval(expression, self.local))
+        except LimitExceeded as e:
+            self._stopped(e, so, True)
+        else:
+            if result is None:
+                stdout = so.result()
+                if stdout is not None:
+                    self.stdin = stdout
+            elif result is not self.IGNORE:
+                if isinstance(result, str) and result.endswith('\n'):
+                    result = result[:-1]
+                self.stdin = result
+                doPrint = True
+        finally:
+            so.close()
+        self._settle()
+        self._remember(self._lineValue)
+        return doPrint
+
+    def _tryNative(self, command, print_):
+        """
+        Try to run a simple command (e.g., C{grep foo} or C{head -5})
+        in-process instead of via the shell.
+
+        @param command: The C{str} command.
+        @param print_: If C{True}, print the command output.
+        @return: A C{tuple} of two C{bool}s, indicating whether the command
+            was handled and whether its output needs to be printed.
+        """
+        argv = native.parseCommand(command)
+        if not argv:
+            return False, False
+
+        if argv[0] in native.READS_STDIN:
+            if not self.inPipeline or self.stdin is None:
+                # The command would read from the terminal.
+                return False, False
+            lines = self._stdinLines()
+        else:
+            lines = None
+
+        stopped = None
+        try:
+            with enforced(self._stageLimits()):
+                result = native.run(argv, lines)
+        except LimitExceeded as e:
+            stopped = e
+            result = []
+        if result is None:
+            return False, False
+
+        self._debug('Ran %r natively.' % (command,))
+        self.status = native.exitStatus(argv, result)
+        if stopped is not None:
+            self._limitExceeded(stopped.name)
+        if isinstance(result, LineStream):
+            self._streams.append(result)
+        self.errors.clear()
+        self.local['_err'] = []
+        if print_ and result:
+            print('\n'.join(result), file=self.outfp)
+        self.lastStdin = self.stdin
+        self.stdin = result
+        self.lastResultIsList = False
+        return True, False
+
+    def _stdinLines(self):
+        """
+        Get the lines that a shell command would read as its standard input.
+
+        @return: A C{list} of C{str}, or a C{LineStream} if the pipeline
+            value is being streamed.
+        """
+        arrayLines = numeric.arrayLines(self.stdin)
+        if arrayLines is not None:
+            return arrayLines
+        elif isinstance(self.stdin, LineStream):
+            return self.stdin
+        elif isinstance(self.stdin, IOBase):
+            return iteratorLines(
+                line.decode('utf-8', errors='surrogateescape')
+                if isinstance(line, bytes) else line for line in self.stdin)
+        elif isinstance(self.stdin, (list, MappedLines, LineBuffer)):
+            # Note that (like the shell) this gives a single empty line for
+            # an empty list.
+            lines = list(map(str, self.stdin)) or ['']
+            if any('\n' in line for line in lines):
+                lines = '\n'.join(lines).split('\n')
+            return lines
+        else:
+            return str(self.stdin).split('\n')
+
     def _tryShell(self, command, print_):
+        if (self.inPipeline and isIterator(self.stdin) and
+                not isinstance(self.stdin, IOBase)):
+            # Read from iterators (e.g., generators) lazily, so they can be
+            # closed if the command does not read everything.
+            self.stdin = iteratorLines(self.stdin)
+            self._streams.append(self.stdin)
+
+        if self.useNative:
+            handled, doPrint = self._tryNative(command, print_)
+            if handled:
+                return handled, doPrint
+
         self._debug('Trying shell %r with stdin %r.' % (command, self.stdin,))
         args = self.shell + [command]
         try:
+            if not print_:
+                # Another command follows this one on the command line, so
+                # its output is read from the process only as needed.
+                stream = self._shStream(
+                    self._shInput() if self.inPipeline else None, args)
+                self._streams.append(stream)
+                self.lastStdin = self.stdin
+                self.stdin = stream
+                self.lastResultIsList = False
+                return True, False
+
             result = self.sh(args, print_=print_)
         except CalledProcessError as e:
-            print('Process error: %s' % e, file=sys.errfp)
+            print('Process error: %s' % e, file=self.errfp)
             return False, False
+        finally:
+            self.local['_err'] = self.errors.lines()
 
         self._debug('Shell returned %r' % (result,))
-        if result:
-            if result.endswith('\n'):
-                result = result[:-1]
-            self.lastStdin = self.stdin
-            self.stdin = result.split('\n')
-            # Set lastResultIsList to False because the result has
-            # already been printed in its non-list form. So next time
-            # we print it we want to see the list.
-            self.lastResultIsList = False
-        else:
-            self.lastStdin = self.stdin
-            self.stdin = []
+        self.lastStdin = self.stdin
+        # The output is kept compactly, rather than as a list of strings
+        # (which, for many lines, would use several times more memory).
+        self.stdin = LineBuffer(result)
+        # Set lastResultIsList to False because the result has already been
+        # printed in its non-list form. So next time we print it we want to
+        # see the list.
+        self.lastResultIsList = False
 
         return True, False
 
@@ -283,16 +924,7 @@ class Pipeline:
         @return: The C{str} output of the command.
         """
         kwargs.setdefault('shell', len(args) == 1 and isinstance(args[0], str))
-
-        if self.inPipeline:
-            if self.stdin is None:
-                stdin = None
-            elif isinstance(self.stdin, list):
-                stdin = '\n'.join(map(str, self.stdin)) + '\n'
-            else:
-                stdin = str(self.stdin) + '\n'
-        else:
-            stdin = None
+        stdin = self._shInput() if self.inPipeline else None
 
         if print_ and self.usePtys:
             result = self._shPty(stdin, *args, **kwargs)
@@ -303,27 +935,188 @@ class Pipeline:
 
         return result
 
+    def _shInput(self):
+        """
+        Get the standard input for a shell command from the pipeline value.
+
+        @return: C{None} if there is no pipeline value, a file (to be read
+            directly by the process) if the value is being streamed from
+            another process, else a C{daudinlib.serialize.Feed} that writes
+            the value to the process as it reads it.
+        """
+        if self.stdin is None:
+            return None
+        elif isinstance(self.stdin, LineStream):
+            fp = self.stdin.detach()
+            if fp is not None:
+                if self._lineStages is None:
+                    return fp
+                # Pass the output on through this process, keeping a copy
+                # for the stage cache.
+                recording = Recording(self.stageCache.budget)
+                self._recordings.append((self.stdin, recording))
+                return Feed(recording.chunks(fp), self.stdin)
+        return Feed.fromValue(self.stdin)
+
+    def _shStream(self, stdin, *args, **kwargs):
+        """
+        Start a shell command whose output is read lazily.
+
+        @param stdin: A C{Feed} of input for the process, a file for it to
+            read, or C{None}.
+        @param args: Positional arguments to pass to C{subprocess.Popen}.
+        @param kwargs: Keyword arguments to pass to C{subprocess.Popen}.
+        @return: A C{LineStream} of the output of the command.
+        """
+        self._debug('In _shStream, stdin is %r' % (stdin,))
+        if stdin is None or isinstance(stdin, Feed):
+            self.errors.clear()
+        limits = self._stageLimits()
+        setup = limits.childSetup()
+        if setup is not None:
+            kwargs.setdefault('preexec_fn', setup)
+        errRead, errWrite = os.pipe()
+        drainer = drain(errRead, self.errors)
+        try:
+            # The process is run in its own session so that it (and any
+            # processes it starts) can be stopped if its output is not all
+            # needed.
+            process = Popen(
+                *args, stdin=(PIPE if isinstance(stdin, Feed) else stdin),
+                stdout=PIPE, stderr=errWrite, universal_newlines=True,
+                errors='replace', start_new_session=True, **kwargs)
+        finally:
+            os.close(errWrite)
+            if stdin is not None and not isinstance(stdin, Feed):
+                stdin.close()
+
+        feeder = (stdin.start(process.stdin) if isinstance(stdin, Feed)
+                  else None)
+
+        if limits.time is None:
+            watchdog = None
+        else:
+            watchdog = Watchdog(process, limits.time,
+                                lambda: self._limitExceeded('time'))
+            self._streamDeadline = monotonic() + limits.time
+
+        return processLines(process, drainer, watchdog=watchdog,
+                            maxChars=limits.out,
+                            onLimit=self._limitExceeded, feeder=feeder)
+
     def _sh(self, stdin, *args, **kwargs):
         """
         Execute a shell command, with input from C{stdin}.
 
-        @param stdin: The C{str} input to the process, else C{None}.
-        @param args: Positional arguments to pass to C{subprocess.run}.
-        @param kwargs: Keyword arguments to pass to C{subprocess.run}.
+        @param stdin: A C{Feed} of input for the process, a file for it to
+            read, or C{None}.
+        @param args: Positional arguments to pass to C{subprocess.Popen}.
+        @param kwargs: Keyword arguments to pass to C{subprocess.Popen}.
         @raise CalledProcessError: If the command results in an error.
         @return: The C{str} output of the command.
         """
         self._debug('In _sh, stdin is %r' % (stdin,))
-        kwargs.setdefault('input', stdin)
+        if stdin is None or isinstance(stdin, Feed):
+            kwargs.setdefault('input', stdin)
+            fp = None
+        else:
+            kwargs.setdefault('stdin', stdin)
+            fp = stdin
         kwargs.setdefault('stdout', PIPE)
         kwargs.setdefault('universal_newlines', True)
-        return run(*args, **kwargs).stdout
+
+        try:
+            if 'stderr' in kwargs:
+                self.status, output = self._run(*args, **kwargs)
+                return output
+
+            # Collect standard error separately, via a pipe that is read in
+            # another thread. This cannot deadlock with the reading of
+            # standard output and (unlike stderr=PIPE) the amount kept is
+            # bounded.
+            if fp is None:
+                self.errors.clear()
+            errRead, errWrite = os.pipe()
+            drainer = drain(errRead, self.errors)
+            try:
+                self.status, output = self._run(*args, stderr=errWrite,
+                                                **kwargs)
+                return output
+            finally:
+                os.close(errWrite)
+                drainer.join()
+        finally:
+            if fp is not None:
+                fp.close()
+
+    def _run(self, *args, input=None, **kwargs):
+        """
+        Run a process to completion, within the stage limits.
+
+        @param args: Positional arguments to pass to C{subprocess.Popen}.
+        @param input: A C{Feed} of input for the process, its C{str} or
+            C{bytes} input, or C{None}.
+        @param kwargs: Keyword arguments to pass to C{subprocess.Popen}.
+        @return: A C{tuple} of the C{int} exit status and the output of the
+            process (or as much of it as was read before it was stopped).
+        """
+        limits = self._stageLimits()
+        if input is None and not limits:
+            process = run(*args, **kwargs)
+            return process.returncode, process.stdout
+
+        setup = limits.childSetup()
+        if setup is not None:
+            kwargs.setdefault('preexec_fn', setup)
+        if input is not None:
+            kwargs['stdin'] = PIPE
+        if limits.time is not None or limits.out is not None:
+            # So it (and anything it starts) can be killed.
+            kwargs['start_new_session'] = True
+
+        exceeded = None
+        feeder = None
+        with Popen(*args, **kwargs) as process:
+            watchdog = (None if limits.time is None else
+                        Watchdog(process, limits.time))
+            try:
+                if input is not None:
+                    feeder = Feed.fromInput(input).start(process.stdin)
+                if process.stdout is None:
+                    output = None
+                elif limits.out is None:
+                    output = process.stdout.read()
+                else:
+                    output = process.stdout.read(limits.out + 1)
+                    if len(output) > limits.out:
+                        output = output[:limits.out]
+                        exceeded = 'out'
+                        os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+                if feeder is not None:
+                    feeder.join()
+
+        if watchdog is not None and watchdog.fired:
+            exceeded = 'time'
+        elif process.returncode == -signal.SIGXCPU:
+            exceeded = 'cpu'
+
+        if exceeded is None:
+            return process.returncode, output
+        else:
+            self._limitExceeded(exceeded)
+            return LIMIT_STATUS, output
 
     def _shPty(self, stdin, *args, **kwargs):
         """
         Run a command in a pseudo-tty, with input from C{stdin}.
         """
         self._debug('In _shPty, stdin is %r' % (stdin,))
+        limits = self._stageLimits()
+        exceeded = feeder = None
 
         # Stdin cannot be manipulated if it's not a terminal or we're
         # running under pytest.
@@ -343,21 +1136,40 @@ class Pipeline:
         try:
             if stdinIsTty:
                 tty.setraw(sys.stdin.fileno())
+                self.errors.rawTerminal = True
 
-            # Open a pseudo-terminal to interact with the subprocess.
+            # Open a pseudo-terminal to interact with the subprocess. Standard
+            # error goes to a separate pipe so it is not mixed in with the
+            # command output.
             master_fd, slave_fd = pty.openpty()
-
-            # Pass os.setsid to have the process run in a new process group.
+            errRead, errWrite = os.pipe()
+            if stdin is None or isinstance(stdin, Feed):
+                self.errors.clear()
+
+            # The process is run in a new session (so it is in its own process
+            # group). This is done with start_new_session rather than a
+            # preexec_fn, which would force a slow fork of this (possibly
+            # large) process and run Python code in the child. A preexec_fn
+            # is only used to set CPU time and memory limits.
             #
             # Note that we should be more careful with kwargs here. If the
             # user has called 'sh' interactively and passed a value for
             # stdin, stdout, stderr, or universal_newlines, the following
             # will cause Python to complain about multiple values for a
             # keyword argument. We should check & warn the user etc.
+            if stdin is None:
+                childStdin = slave_fd
+            elif isinstance(stdin, Feed):
+                childStdin = PIPE
+            else:
+                childStdin = stdin
+            setup = limits.childSetup()
+            if setup is not None:
+                kwargs.setdefault('preexec_fn', setup)
             process = Popen(
-                *args, preexec_fn=os.setsid,
-                stdin=(slave_fd if stdin is None else PIPE), stdout=slave_fd,
-                stderr=slave_fd, universal_newlines=True, **kwargs)
+                *args, stdin=childStdin, stdout=slave_fd, stderr=errWrite,
+                universal_newlines=True, start_new_session=True, **kwargs)
+            os.close(errWrite)
 
             if stdinIsTty:
                 def handle():
@@ -365,19 +1177,34 @@ class Pipeline:
 
                 signal.signal(signal.SIGINT, handle)
 
-            # Write the command's stdin to it, if any.
-            if stdin is not None:
-                # print('WROTE %r' % (stdin,), file=self.errfp)
-                os.write(process.stdin.fileno(), stdin.encode())
-                process.stdin.close()
+            # Write the command's stdin to it, if any. This is done in
+            # another thread, so that a command that produces output before
+            # reading all its input cannot block.
+            if isinstance(stdin, Feed):
+                feeder = stdin.start(process.stdin)
+            elif stdin is not None:
+                # The process has its own copy of the file.
+                stdin.close()
 
             if stdinIsTty:
-                readFds = [sys.stdin, master_fd]
+                readFds = [sys.stdin, master_fd, errRead]
             else:
-                readFds = [master_fd]
+                readFds = [master_fd, errRead]
 
+            deadline = (None if limits.time is None else
+                        monotonic() + limits.time)
             result = b''
             while process.poll() is None:
+                if deadline is not None and monotonic() > deadline:
+                    exceeded = 'time'
+                elif limits.out is not None and len(result) > limits.out:
+                    exceeded = 'out'
+                if exceeded:
+                    try:
+                        os.killpg(process.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                    break
                 r, w, e = select.select(readFds, [], [], 0.05)
                 if sys.stdin in r:
                     data = os.read(sys.stdin.fileno(), 10240)
@@ -389,10 +1216,33 @@ class Pipeline:
                     if data:
                         result += data
                         os.write(_originalStdout.fileno(), data)
+                if errRead in r:
+                    data = os.read(errRead, 10240)
+                    if data:
+                        self.errors.write(data)
+                    else:
+                        readFds.remove(errRead)
+
+            # Collect any standard error output that was written just
+            # before the process exited.
+            while (errRead in readFds and
+                   select.select([errRead], [], [], 0)[0]):
+                data = os.read(errRead, 10240)
+                if data:
+                    self.errors.write(data)
+                else:
+                    break
+            os.close(errRead)
+            self.status = process.wait()
+            if feeder is not None:
+                feeder.join()
+            if self.status == -signal.SIGXCPU:
+                exceeded = 'cpu'
 
         finally:
             if stdinIsTty:
                 # Restore tty settings and SIGINT handler.
+                self.errors.rawTerminal = False
                 termios.tcsetattr(sys.stdin, termios.TCSADRAIN, oldTty)
                 signal.signal(signal.SIGINT, oldHandler)
 
@@ -414,6 +1264,11 @@ class Pipeline:
         else:
             result = ANSI_esc.sub('', result).replace('\r\n', '\n')
 
+        if exceeded:
+            self._limitExceeded(exceeded)
+            if limits.out is not None:
+                result = result[:limits.out]
+
         return result
 
     def cd(self, dest=None):
@@ -421,21 +1276,97 @@ class Pipeline:
             os.chdir(expanduser(dest or '~'))
         except FileNotFoundError as e:
             print(e, file=sys.stderr)
+        else:
+            self.fresh()
+        return self.IGNORE
+
+    def write(self, path, append=False, compress=None):
+        """
+        Write the pipeline value to a file (see
+        C{daudinlib.files.writeValue}), leaving it unchanged (for a following
+        command) and not printing it.
+
+        @param path: The C{str} file path.
+        @param append: If C{True}, add to the end of the file.
+        @param compress: The C{str} kind of compression to use ('gzip', 'bz2'
+            or 'xz'), C{False} for none, or C{None} to use compression if the
+            file name ends in '.gz', '.bz2' or '.xz'.
+        """
+        if isIterator(self.stdin) and not isinstance(self.stdin, IOBase):
+            # Keep the lines, so the value can still be used once written.
+            self.stdin = iteratorLines(self.stdin)
+            self._streams.append(self.stdin)
+        writeValue(self.stdin, path, append=append, compress=compress)
         return self.IGNORE
 
+    def tee(self, path, append=False, compress=None):
+        """
+        Write the pipeline value to a file, as C{write} does, and give the
+        value (so it is printed if this is the last command on the line).
+
+        @param path: The C{str} file path.
+        @param append: If C{True}, add to the end of the file.
+        @param compress: The C{str} kind of compression to use (see
+            C{write}).
+        @return: The pipeline value.
+        """
+        self.write(path, append=append, compress=compress)
+        return self.stdin
+
     def toggleDebug(self):
         self.debug = not self.debug
 
     def toggleTracebacks(self):
         self.printTracebacks = not self.printTracebacks
 
-    def undo(self):
-        self.stdin = self.lastStdin
+    def undo(self, count=None):
+        """
+        Go back to an earlier value of _.
+
+        @param count: The C{int} number of command lines to go back (see
+            C{self.resultHistory}), or C{None} to go back to the value from
+            before the last command (i.e., pipeline stage).
+        @raise IndexError: If C{count} is more than the number of earlier
+            values kept.
+        """
+        if count is None:
+            self.stdin = self.lastStdin
+        else:
+            value = self.resultHistory[count]
+            self.lastStdin = self.stdin
+            self.stdin = value
+
+    def save(self, name):
+        """
+        Save the pipeline value, so it can be loaded in a later session.
+
+        @param name: The C{str} name to save the value under.
+        """
+        if isinstance(self.stdin, LineStream):
+            self.stdin = self.stdin.tolist()
+        self.results[name] = self.stdin
+
+    def load(self, name):
+        """
+        Make a saved value the pipeline value.
+
+        @param name: The C{str} name of the saved value.
+        @raise KeyError: If there is no saved value called C{name}.
+        """
+        value = self.results[name]
+        self._remember(self.stdin)
+        self.lastStdin = self.stdin
+        self.stdin = value
+        self.lastResultIsList = False
 
     def reset(self):
+        for value in [self.stdin, self.lastStdin] + self._streams:
+            if isinstance(value, LineStream):
+                value.close()
+        self._streams = []
         self.stdin = None
         self.lastStdin = None
-        self.pendingText = ''
+        self._block = None
         self.lastResultIsList = False
         self.inPipeline = False
 
@@ -450,13 +1381,8 @@ class Pipeline:
         return self.IGNORE
 
     def print_(self):
-        if isinstance(self.stdin, TextIOWrapper):
-            s = self.stdin.read()
-            print(s, end='' if s.endswith('\n') else '\n', file=self.outfp)
-        elif isinstance(self.stdin, str):
-            print(self.stdin, end='' if self.stdin.endswith('\n') else '\n',
-                  file=self.outfp)
-        elif self.lastResultIsList:
-            print('\n'.join(self.stdin), file=self.outfp)
-        else:
-            print(self.stdin, file=self.outfp)
+        if isinstance(self.stdin, LineStream):
+            self.stdin = self.stdin.tolist()
+
+        display.show(self.stdin, self.outfp, asList=self.lastResultIsList,
+                     maxLines=self.displayLines, pager=self.pager)
@@ -36,19 +36,44 @@ class Completer:
             return None
 
 
-def setupReadline(local):
+def setupReadline(local, history=None, historyLength=1000):
     """Initialize the readline library and command history.
 
+    @param local: The C{dict} namespace used for Python completions.
+    @param history: A C{daudinlib.history.History} to load recent commands
+        from, or C{None} to use a ~/.daudin_history file instead.
+    @param historyLength: The C{int} number of recent commands to make
+        available to readline.
     @return: A C{bool} to indicate whether standard input is a terminal
         (and therefore interactive).
     """
     readline.parse_and_bind('tab: complete')
+    # Have text pasted into the terminal arrive (from input) all at once,
+    # so a pasted block can be run in one go (see REPL.runText). Python
+    # turns this off by default.
+    readline.parse_and_bind('set enable-bracketed-paste on')
     readline.set_completer_delims(' \t\n')
     readline.set_completer(Completer(local).complete)
 
     # Readline code from https://docs.python.org/3.7/library/readline.html
     histfile = os.path.join(os.path.expanduser('~'), '.daudin_history')
 
+    if history is not None:
+        if not len(history) and os.path.exists(histfile):
+            # Bring in the history from before there was a database.
+            with open(histfile, errors='replace') as fp:
+                history.addMany(line.rstrip('\n') for line in fp
+                                if line.strip() and
+                                not line.startswith('_HiStOrY_V2_'))
+
+        # Only the most recent commands are given to readline. Commands
+        # are added to the database as they are run (see
+        # daudinlib.interaction.REPL), so the history of other sessions is
+        # not overwritten.
+        for entry in history.recent(historyLength):
+            readline.add_history(entry.command)
+        return True
+
     try:
         readline.read_history_file(histfile)
         historyLen = readline.get_current_history_length()
@@ -67,7 +92,7 @@ def setupReadline(local):
 
         def saveHistory(prevHistoryLen, histfile):
             newHistoryLen = readline.get_current_history_length()
-            readline.set_history_length(1000)
+            readline.set_history_length(historyLength)
             readline.append_history_file(newHistoryLen - prevHistoryLen,
                                          histfile)
 
@@ -0,0 +1,420 @@
+import os
+import sys
+import mmap
+import pickle
+import shutil
+import weakref
+from array import array
+from collections.abc import MutableMapping, Sequence
+from itertools import count
+from tempfile import NamedTemporaryFile, mkdtemp
+
+from daudinlib.lines import LineBuffer
+
+# Out-of-band pickle buffers are aligned to this many bytes in the file, so
+# (e.g.) NumPy arrays loaded from them are suitably aligned in memory.
+_ALIGN = 64
+
+_LINES, _PICKLE = '.lines', '.pickle'
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _isLines(value):
+    return (isinstance(value, (list, MappedLines, LineBuffer)) and
+            all(isinstance(line, str) and '\n' not in line for line in value))
+
+
+def writeLines(path, lines):
+    """
+    Save a list of lines as a text file.
+
+    @param path: The C{str} file path.
+    @param lines: A C{list} of C{str} lines, none of which contain a newline.
+    """
+    with open(path, 'w', encoding='utf-8', errors='surrogateescape') as fp:
+        if isinstance(lines, LineBuffer):
+            fp.write(lines.text)
+        else:
+            for line in lines:
+                fp.write(line)
+                fp.write('\n')
+
+
+class MappedLines(Sequence):
+    """
+    A read-only sequence of the lines in a file saved by C{writeLines}.
+
+    The file is mapped into memory and lines are only found (and decoded)
+    as they are used, so loading a large saved value is immediate. The
+    offsets of the lines found so far are kept, so indexing is fast once a
+    line has been reached. Asking for the length (or using a negative
+    index) finds all the lines.
+
+    @param path: The C{str} file path.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            self._size = os.fstat(fp.fileno()).st_size
+            self._mm = (mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                        if self._size else None)
+        # The offset of the start of each line found so far, followed by
+        # the offset just past its newline.
+        self._starts = array('q', [0])
+        self._complete = not self._size
+
+    def _findTo(self, index):
+        """
+        Find lines until (at least) a given line has been found.
+
+        @param index: The C{int} (non-negative) index of the line wanted, or
+            C{None} to find all lines.
+        """
+        starts = self._starts
+        find = self._mm.find if self._mm else None
+        while not self._complete and (index is None or
+                                      len(starts) - 1 <= index):
+            end = find(b'\n', starts[-1])
+            if end == -1:
+                # A final line with no newline (the file was not written by
+                # writeLines).
+                end = self._size
+            starts.append(end + 1)
+            if end + 1 >= self._size:
+                self._complete = True
+
+    def _line(self, index):
+        starts = self._starts
+        return self._mm[starts[index]:starts[index + 1] - 1].decode(
+            'utf-8', errors='surrogateescape')
+
+    def __len__(self):
+        self._findTo(None)
+        return len(self._starts) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._line(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+            if index < 0:
+                raise IndexError('line index out of range')
+        else:
+            self._findTo(index)
+            if index >= len(self._starts) - 1:
+                raise IndexError('line index out of range')
+        return self._line(index)
+
+    def __iter__(self):
+        index = 0
+        while True:
+            self._findTo(index)
+            if index >= len(self._starts) - 1:
+                return
+            yield self._line(index)
+            index += 1
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def writePickle(path, value):
+    """
+    Save a value using pickle protocol 5, with large buffers (e.g., the
+    data of NumPy arrays) stored out-of-band after the pickle data.
+
+    @param path: The C{str} file path.
+    @param value: The value to save.
+    """
+    buffers = []
+
+    def keep(buffer):
+        try:
+            buffers.append(buffer.raw())
+        except BufferError:
+            # The buffer is not contiguous, so it is pickled in-band.
+            return True
+
+    data = pickle.dumps(value, protocol=5, buffer_callback=keep)
+
+    with open(path, 'wb') as fp:
+        pickle.dump((len(data), [buffer.nbytes for buffer in buffers]), fp,
+                    protocol=5)
+        fp.write(data)
+        for buffer in buffers:
+            fp.write(b'\0' * (_aligned(fp.tell()) - fp.tell()))
+            fp.write(buffer)
+
+
+def readPickle(path):
+    """
+    Read a value saved by C{writePickle}. Out-of-band buffers are not read,
+    but are mapped into memory (copy-on-write), so their contents are only
+    read from disk when they are used.
+
+    @param path: The C{str} file path.
+    @return: The saved value.
+    """
+    with open(path, 'rb') as fp:
+        dataLength, lengths = pickle.load(fp)
+        if not lengths:
+            return pickle.loads(fp.read(dataLength))
+        offset = fp.tell()
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    view = memoryview(mm)
+    data = view[offset:offset + dataLength]
+    offset += dataLength
+    buffers = []
+    for length in lengths:
+        offset = _aligned(offset)
+        buffers.append(view[offset:offset + length])
+        offset += length
+
+    return pickle.loads(data, buffers=buffers)
+
+
+class ResultStore(MutableMapping):
+    """
+    A persistent mapping from names to saved pipeline values, kept as files
+    in a directory.
+
+    Lists of lines (e.g., the output of shell commands) are saved as plain
+    text files, which are read back as (lazy) C{MappedLines}. Other values
+    are pickled. Values are written as soon as
+    they are stored and are read (again) each time they are looked up, so
+    values saved by other sessions are also available.
+
+    @param directory: The C{str} directory to keep values in. It is created
+        when the first value is saved.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name, suffix):
+        if (not isinstance(name, str) or not name or name.startswith('.') or
+                os.sep in name or (os.altsep and os.altsep in name)):
+            raise ValueError('Invalid result name %r.' % (name,))
+        return os.path.join(self.directory, name + suffix)
+
+    def __getitem__(self, name):
+        path = self._path(name, _LINES)
+        if os.path.exists(path):
+            value = MappedLines(path)
+        else:
+            path = self._path(name, _PICKLE)
+            if os.path.exists(path):
+                value = readPickle(path)
+            else:
+                raise KeyError(name)
+
+        return value
+
+    def __setitem__(self, name, value):
+        if _isLines(value):
+            suffix, other, write = _LINES, _PICKLE, writeLines
+        else:
+            suffix, other, write = _PICKLE, _LINES, writePickle
+
+        path = self._path(name, suffix)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first, so a value that is being saved
+        # is never seen half-written (e.g., by another session).
+        with NamedTemporaryFile(dir=self.directory, prefix='.',
+                                delete=False) as tmp:
+            pass
+        try:
+            write(tmp.name, value)
+            os.replace(tmp.name, path)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+
+        try:
+            os.unlink(self._path(name, other))
+        except FileNotFoundError:
+            pass
+
+    def __delitem__(self, name):
+        found = False
+        for suffix in _LINES, _PICKLE:
+            try:
+                os.unlink(self._path(name, suffix))
+            except FileNotFoundError:
+                pass
+            else:
+                found = True
+        if not found:
+            raise KeyError(name)
+
+    def __iter__(self):
+        try:
+            filenames = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return
+        for filename in filenames:
+            name, suffix = os.path.splitext(filename)
+            if suffix in (_LINES, _PICKLE) and not name.startswith('.'):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, name):
+        try:
+            return any(
+                os.path.exists(self._path(name, suffix))
+                for suffix in (_LINES, _PICKLE))
+        except ValueError:
+            return False
+
+    def __repr__(self):
+        return '<%s %r: %s>' % (self.__class__.__name__, self.directory,
+                                ', '.join(self))
+
+
+def estimateSize(value):
+    """
+    Estimate the memory used by a value. This is its C{sys.getsizeof} plus
+    that of its items, if it is a C{list}, C{tuple}, C{set} or C{dict}
+    (items nested more deeply are not counted). A C{MappedLines} is taken
+    to use no memory, as its lines are in a file.
+
+    @param value: Any value.
+    @return: The C{int} estimated number of bytes.
+    """
+    if isinstance(value, MappedLines):
+        return 0
+    size = sys.getsizeof(value, 0)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sys.getsizeof(item, 0) for item in value)
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(key, 0) + sys.getsizeof(item, 0)
+                    for key, item in value.items())
+    elif isinstance(value, memoryview):
+        size += value.nbytes
+    return size
+
+
+class ResultHistory:
+    """
+    The earlier values of a pipeline, newest first, so C{history[1]} is the
+    most recent (C{_1} in the pipeline), C{history[2]} the one before it,
+    and so on.
+
+    Values are kept in memory until their total estimated size (see
+    C{estimateSize}) goes over a budget. The oldest values are then written
+    to files (in the formats used by C{ResultStore}) and read back (mapped
+    into memory, so lazily) when they are next used. Values that cannot be
+    written (e.g., that cannot be pickled) are dropped instead.
+
+    @param maxValues: The C{int} maximum number of values to keep.
+    @param budget: The C{int} number of bytes of memory the values may use.
+    @param directory: The C{str} directory to write values to, or C{None}
+        to use a temporary directory (made when it is first needed and
+        removed when the history is no longer used).
+    """
+    def __init__(self, maxValues=100, budget=256 << 20, directory=None):
+        self.maxValues = maxValues
+        self.budget = budget
+        self.directory = directory
+        self._store = None
+        self._ids = count()
+        # Each entry is a list of the value (or None, once it is written to
+        # the store), its estimated size, and its name in the store (or
+        # None).
+        self._entries = []
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        """
+        Get an earlier value.
+
+        @param index: The C{int} number of values back (1 is the most
+            recent).
+        @raise IndexError: If there is no such value.
+        @return: The value.
+        """
+        if not 1 <= index <= len(self._entries):
+            raise IndexError('No result %d.' % index)
+        value, _, name = self._entries[index - 1]
+        return value if name is None else self._store[name]
+
+    def __repr__(self):
+        return '<%s: %d value%s, %d bytes in memory>' % (
+            self.__class__.__name__, len(self._entries),
+            '' if len(self._entries) == 1 else 's', self._size)
+
+    def push(self, value):
+        """
+        Add the newest value.
+
+        @param value: The value.
+        """
+        size = estimateSize(value)
+        self._entries.insert(0, [value, size, None])
+        self._size += size
+
+        while len(self._entries) > self.maxValues:
+            self._drop(self._entries.pop())
+
+        # Write the oldest values that are in memory to the store until
+        # the rest fit in the budget.
+        index = len(self._entries) - 1
+        while self._size > self.budget and index >= 0:
+            entry = self._entries[index]
+            if entry[2] is None and entry[1]:
+                if not self._write(entry):
+                    del self._entries[index]
+            index -= 1
+
+    def clear(self):
+        """
+        Forget all the values.
+        """
+        for entry in self._entries:
+            self._drop(entry)
+        self._entries = []
+
+    def _drop(self, entry):
+        value, size, name = entry
+        if name is None:
+            self._size -= size
+        else:
+            del self._store[name]
+
+    def _write(self, entry):
+        """
+        Move a value from memory to the store.
+
+        @param entry: The C{list} entry of the value.
+        @return: C{True} if the value was written, C{False} if it could not
+            be (in which case it is dropped).
+        """
+        if self._store is None:
+            directory = self.directory
+            if directory is None:
+                directory = mkdtemp(prefix='daudin-history-')
+                weakref.finalize(self, shutil.rmtree, directory, True)
+            self._store = ResultStore(directory)
+
+        value, size, _ = entry
+        name = str(next(self._ids))
+        self._size -= size
+        try:
+            self._store[name] = value
+        except Exception:
+            return False
+        entry[0], entry[2] = None, name
+        return True
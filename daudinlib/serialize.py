@@ -0,0 +1,232 @@
+from io import IOBase
+from itertools import islice
+from threading import Thread
+
+from daudinlib import numeric
+from daudinlib.lines import LineBuffer
+from daudinlib.results import MappedLines
+from daudinlib.stream import LineStream, iteratorLines, isIterator
+
+# The number of lines, or of characters or bytes, in each chunk written to
+# a process.
+CHUNK_LINES = 4096
+CHUNK_SIZE = 1 << 16
+
+
+def _encode(text):
+    return text.encode('utf-8', errors='surrogateescape')
+
+
+def lineChunks(lines):
+    """
+    Join lines into chunks.
+
+    @param lines: An iterable of values, each of which is written (converted
+        with C{str}) as a line.
+    @return: A generator of C{bytes} chunks. If there are no lines, a single
+        empty line is produced (as the shell would for an empty list).
+    """
+    lines = iter(lines)
+    empty = True
+    while True:
+        batch = list(islice(lines, CHUNK_LINES))
+        if not batch:
+            break
+        empty = False
+        batch.append('')
+        yield _encode('\n'.join(map(str, batch)))
+    if empty:
+        yield b'\n'
+
+
+def textChunks(text, newline=True):
+    """
+    Split text into chunks.
+
+    @param text: A C{str}.
+    @param newline: If C{True}, add a final newline.
+    @return: A generator of C{bytes} chunks.
+    """
+    for start in range(0, len(text), CHUNK_SIZE):
+        yield _encode(text[start:start + CHUNK_SIZE])
+    if newline:
+        yield b'\n'
+
+
+def fileChunks(fp):
+    """
+    Read the rest of a file in chunks.
+
+    @param fp: A text or binary file, open for reading.
+    @return: A generator of C{bytes} chunks.
+    """
+    while True:
+        data = fp.read(CHUNK_SIZE)
+        if not data:
+            return
+        yield _encode(data) if isinstance(data, str) else data
+
+
+def serialize(value):
+    """
+    Get the bytes that a shell command should read (as its standard input)
+    for a pipeline value, in chunks, so the value is never converted to one
+    big string.
+
+    Values are written as follows:
+
+        - If the type of the value has a C{__daudin_serialize__} method, it
+          is called (with no arguments) and should return an iterable of
+          chunks (each C{str} or C{bytes}-like), which are written in turn.
+        - C{bytes}, C{bytearray} and C{memoryview}: as they are.
+        - A file (open for reading): the rest of its contents.
+        - An array (see C{daudinlib.numeric.arrayLines}): one number (or
+          row) per line.
+        - A C{LineBuffer}: its text.
+        - A C{list}, C{MappedLines}, C{LineStream} or other iterator: one
+          item per line.
+        - Anything else: its C{str}, followed by a newline.
+
+    @param value: A pipeline value (not C{None}).
+    @return: An iterable of C{bytes}-like chunks.
+    """
+    hook = getattr(type(value), '__daudin_serialize__', None)
+    if hook is not None:
+        return (_encode(chunk) if isinstance(chunk, str) else chunk
+                for chunk in hook(value))
+    elif isinstance(value, (bytes, bytearray)):
+        return (value,)
+    elif isinstance(value, memoryview):
+        return (value if value.contiguous else value.tobytes(),)
+    elif isinstance(value, IOBase):
+        return fileChunks(value)
+
+    elif isinstance(value, LineBuffer):
+        return textChunks(value.text, newline=False) if value else (b'\n',)
+
+    chunks = numeric.arrayChunks(value, CHUNK_LINES)
+    if chunks is not None:
+        return map(_encode, chunks)
+    elif isinstance(value, (list, MappedLines, LineStream)):
+        return lineChunks(value)
+    elif isIterator(value):
+        return lineChunks(iteratorLines(value))
+    else:
+        return textChunks(str(value))
+
+
+class Recording:
+    """
+    A copy of the text read from a file (e.g., the output of one process
+    as it is passed to another, see C{Feed}), kept only if it is not too
+    big.
+
+    @param limit: The C{int} maximum number of bytes to keep.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.complete = False
+        self._chunks = []
+        self._size = 0
+
+    def chunks(self, fp):
+        """
+        Read the rest of a file in chunks, keeping a copy. The file is
+        closed when all of it has been read (or reading stops).
+
+        @param fp: A text or binary file, open for reading.
+        @return: A generator of C{bytes} chunks.
+        """
+        try:
+            for chunk in fileChunks(fp):
+                if self._chunks is not None:
+                    self._size += len(chunk)
+                    if self._size > self.limit:
+                        self._chunks = None
+                    else:
+                        self._chunks.append(chunk)
+                yield chunk
+            self.complete = True
+        finally:
+            fp.close()
+
+    def value(self):
+        """
+        Get the lines of the text.
+
+        @return: A C{LineBuffer}, or C{None} if not all of the text was read
+            or it was too big to keep.
+        """
+        if not self.complete or self._chunks is None:
+            return None
+        return LineBuffer(b''.join(self._chunks).decode(
+            'utf-8', errors='surrogateescape'))
+
+
+class Feed:
+    """
+    The standard input for a process, written to it in chunks (by a
+    background thread) as the process reads it.
+
+    @param chunks: An iterable of C{bytes}-like chunks.
+    @param source: The C{LineStream} that the chunks are read from, or
+        C{None}. It is closed once it has been written (or the process stops
+        reading it).
+    """
+    def __init__(self, chunks, source=None):
+        self.chunks = chunks
+        self.source = source
+        if source is not None:
+            source.feeding = True
+
+    @classmethod
+    def fromValue(cls, value):
+        """
+        Make a C{Feed} for a pipeline value (see C{serialize}).
+
+        @param value: A pipeline value (not C{None}).
+        @return: A C{Feed}.
+        """
+        return cls(serialize(value),
+                   value if isinstance(value, LineStream) else None)
+
+    @classmethod
+    def fromInput(cls, data):
+        """
+        Make a C{Feed} for some input data.
+
+        @param data: A C{str} or C{bytes}-like input for a process, or a
+            C{Feed} (which is returned).
+        @return: A C{Feed}.
+        """
+        if isinstance(data, Feed):
+            return data
+        return cls((_encode(data) if isinstance(data, str) else data,))
+
+    def start(self, fp):
+        """
+        Start writing to a file (in a background thread).
+
+        @param fp: A text or binary file (e.g., the C{stdin} of a
+            C{subprocess.Popen}). It is closed when all the chunks have been
+            written or the reader has gone away.
+        @return: The started C{threading.Thread}.
+        """
+        def write():
+            try:
+                getattr(fp, 'buffer', fp).writelines(self.chunks)
+            except (BrokenPipeError, ValueError):
+                # The process did not read all its input (or it was stopped
+                # and its input closed).
+                pass
+            finally:
+                try:
+                    fp.close()
+                except BrokenPipeError:
+                    pass
+                if self.source is not None:
+                    self.source.close()
+
+        thread = Thread(target=write, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import signal
+import socket
+import struct
+import traceback
+from threading import Thread
+
+from daudinlib.client import receiveRequest
+
+
+def _exitStatus(exception):
+    """
+    Get the exit status for a C{SystemExit}.
+    """
+    code = exception.code
+    if code is None:
+        return 0
+    elif isinstance(code, int):
+        return code
+    else:
+        print(code, file=sys.stderr)
+        return 1
+
+
+class Server:
+    """
+    Run daudin commands for clients (see C{daudinlib.client}) that connect
+    to a Unix-domain socket.
+
+    The server starts up once, with a C{Pipeline} that has already run the
+    user's init file. Each connection is handled in a child process, so
+    changes made by a client (to the Python namespace, the current
+    directory, etc.) are not seen by others. The child uses either its own
+    copy of the server's (warm) pipeline or, if the client asks for it, a
+    fresh one. The client passes its standard input, output and error, so
+    the child can run an interactive session on the client's terminal.
+
+    @param path: The C{str} path of the socket.
+    @param pipeline: The C{daudinlib.pipeline.Pipeline} that forked
+        children start with.
+    @param makePipeline: A no-argument function that returns a new
+        C{Pipeline}, for clients that want a fresh one.
+    @param run: A function taking a C{Pipeline} and a C{list} of C{str}
+        script files, which runs them (or an interactive session, if the
+        list is empty), as the daudin command does.
+    """
+    def __init__(self, path, pipeline, makePipeline, run):
+        self.path = path
+        self.pipeline = pipeline
+        self.makePipeline = makePipeline
+        self.run = run
+
+    def _listen(self):
+        """
+        Create the listening socket.
+
+        @raise RuntimeError: If another server is using the socket.
+        @return: A listening C{socket.socket}.
+        """
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                # Left behind by a server that did not exit cleanly.
+                os.unlink(self.path)
+            else:
+                raise RuntimeError('A daudin server is already running at '
+                                   '%r.' % self.path)
+            finally:
+                probe.close()
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the user can connect.
+        oldUmask = os.umask(0o177)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(oldUmask)
+        sock.listen()
+        return sock
+
+    def serve(self):
+        """
+        Accept connections until interrupted.
+        """
+        sock = self._listen()
+        # Children are not waited for.
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        # Remove the socket when asked to stop.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            while True:
+                conn, _ = sock.accept()
+                if not self._allowed(conn):
+                    conn.close()
+                    continue
+                if os.fork() == 0:
+                    sock.close()
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    signal.signal(signal.SIGINT, signal.default_int_handler)
+                    self._child(conn)
+                else:
+                    conn.close()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            os.unlink(self.path)
+
+    def _allowed(self, conn):
+        """
+        Check that a connection comes from the user running the server.
+        """
+        try:
+            credentials = conn.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED,
+                struct.calcsize('3i'))
+        except (AttributeError, OSError):
+            # Not Linux. The socket permissions still apply.
+            return True
+        _, uid, _ = struct.unpack('3i', credentials)
+        return uid == os.getuid()
+
+    def _child(self, conn):
+        """
+        Handle a connection, in a child process. This does not return.
+        """
+        status = 1
+        try:
+            request, fds = receiveRequest(conn)
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['environ'])
+
+            pipeline = (self.makePipeline() if request['mode'] == 'fresh'
+                        else self.pipeline)
+            Thread(target=self._watch, args=(conn,), daemon=True).start()
+
+            try:
+                self.run(pipeline, request['scriptFiles'])
+            except SystemExit as e:
+                status = _exitStatus(e)
+            else:
+                status = pipeline.status
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            for fp in sys.stdout, sys.stderr:
+                try:
+                    fp.flush()
+                except Exception:
+                    pass
+            try:
+                conn.sendall(json.dumps({'status': status}).encode() + b'\n')
+            except OSError:
+                pass
+            os._exit(0)
+
+    def _watch(self, conn):
+        """
+        Pass on interrupts from the client, and stop if it goes away.
+        """
+        while True:
+            try:
+                data = conn.recv(1)
+            except OSError:
+                data = b''
+            if data == b'I':
+                os.kill(os.getpid(), signal.SIGINT)
+            elif not data:
+                os.kill(os.getpid(), signal.SIGHUP)
+                return
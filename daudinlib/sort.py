@@ -0,0 +1,180 @@
+import sys
+import pickle
+from heapq import merge
+from io import IOBase
+from os.path import join
+from tempfile import TemporaryDirectory, mkstemp
+
+from daudinlib.results import MappedLines, writeLines
+from daudinlib.stream import LineStream, sourceLines
+
+# The default number of bytes of memory to sort in before writing sorted
+# runs to temporary files.
+BUDGET = 256 << 20
+
+# The number of items pickled together in a run file. When merging, one
+# batch from each run is in memory.
+_BATCH = 4096
+
+# The size of a list slot (i.e., a pointer).
+_SLOT = 8
+
+
+def _writeRun(items, directory):
+    """
+    Write a sorted run to a temporary file.
+
+    @param items: A sorted C{list}.
+    @param directory: The C{str} directory to make the file in.
+    @return: The C{str} path of the file.
+    """
+    fd, path = mkstemp(dir=directory, suffix='.run')
+    with open(fd, 'wb') as fp:
+        for start in range(0, len(items), _BATCH):
+            pickle.dump(items[start:start + _BATCH], fp,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _readRun(path):
+    """
+    Read a run written by C{_writeRun}.
+
+    @param path: The C{str} path of the file.
+    @return: A generator of the items in the run.
+    """
+    with open(path, 'rb') as fp:
+        while True:
+            try:
+                batch = pickle.load(fp)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _unique(items, key, count):
+    """
+    Drop (sorted) items that are the same as the one before.
+
+    @param items: An iterable of sorted items.
+    @param key: A function giving the value to compare items by, or
+        C{None} to compare the items themselves.
+    @param count: If C{True}, give the number of times each item occurred.
+    @return: A generator of the items (or, if C{count} is C{True}, of
+        C{(count, item)} tuples).
+    """
+    previous = previousKey = None
+    n = 0
+    for item in items:
+        k = item if key is None else key(item)
+        if n and k == previousKey:
+            n += 1
+        else:
+            if n:
+                yield (n, previous) if count else previous
+            previous, previousKey, n = item, k, 1
+    if n:
+        yield (n, previous) if count else previous
+
+
+def xsort(data, key=None, reverse=False, unique=False, count=False,
+          budget=BUDGET, directory=None):
+    """
+    Sort values that may not fit in memory (e.g., the lines of a large file
+    or of the output of a shell command).
+
+    Items are sorted in chunks of about C{budget} bytes. Each sorted chunk
+    (or run) that does not fit is written to a temporary file, and the runs
+    are then merged (with C{heapq.merge}). The output of a shell command
+    that is being streamed is read directly from the process, and values
+    such as a C{LineStream} or C{MappedLines} are read as they are needed,
+    so they are never all in memory at once.
+
+    @param data: An iterable of items to sort (or a C{str} or C{bytes}, whose
+        lines are sorted).
+    @param key: A function giving the value to sort each item by, or
+        C{None} to sort by the items themselves.
+    @param reverse: If C{True}, sort into descending order.
+    @param unique: If C{True}, keep only the first of each run of items that
+        compare equal (by C{key}), like C{sort -u}.
+    @param count: If C{True}, give each distinct item (as for C{unique})
+        with the number of times it occurs, like C{sort | uniq -c}.
+    @param budget: The approximate C{int} number of bytes of memory to sort
+        in before writing runs to files.
+    @param directory: The C{str} directory to write temporary files in, or
+        C{None} to use the system default (see C{tempfile.gettempdir}).
+    @return: If everything fitted in memory, a C{list}. Otherwise, if all
+        the items are C{str} lines (and C{count} is not given), a
+        C{MappedLines} of a (deleted) temporary file, so the result does not
+        use memory either. Otherwise a C{LineStream} of the merged items
+        (or, if C{count} is given, of C{(count, item)} tuples).
+    """
+    items, close = sourceLines(data)
+    stripNewlines = isinstance(items, IOBase)
+    runs = []
+    chunk = []
+    size = 0
+    allLines = True
+    tmpdir = None
+
+    try:
+        for item in items:
+            if isinstance(item, str):
+                if stripNewlines and item.endswith('\n'):
+                    item = item[:-1]
+                elif allLines and '\n' in item:
+                    allLines = False
+            else:
+                allLines = False
+            chunk.append(item)
+            size += sys.getsizeof(item) + _SLOT
+            if size > budget:
+                if tmpdir is None:
+                    tmpdir = TemporaryDirectory(prefix='daudin-sort-',
+                                                dir=directory)
+                chunk.sort(key=key, reverse=reverse)
+                runs.append(_writeRun(chunk, tmpdir.name))
+                chunk = []
+                size = 0
+    except BaseException:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+        raise
+    finally:
+        if close is not None:
+            close()
+
+    chunk.sort(key=key, reverse=reverse)
+
+    if not runs:
+        if unique or count:
+            return list(_unique(chunk, key, count))
+        else:
+            return chunk
+
+    # The last chunk is merged from memory. As heapq.merge is stable, it
+    # must come last, so equal items stay in their original order.
+    iterables = [_readRun(path) for path in runs] + [chunk]
+    merged = merge(*iterables, key=key, reverse=reverse)
+    if unique or count:
+        merged = _unique(merged, key, count)
+
+    if allLines and not count:
+        path = join(tmpdir.name, 'sorted')
+        try:
+            writeLines(path, merged)
+            result = MappedLines(path)
+        finally:
+            # The file stays mapped (and in existence) until the result is
+            # no longer used.
+            tmpdir.cleanup()
+        return result
+
+    def lines():
+        try:
+            yield from merged
+        finally:
+            tmpdir.cleanup()
+
+    generator = lines()
+    return LineStream(generator, close=generator.close)
@@ -0,0 +1,358 @@
+import os
+import signal
+from collections.abc import Iterator, Sequence
+from io import StringIO
+from threading import RLock
+
+from daudinlib.lines import LineBuffer
+
+
+class LineStream(Sequence):
+    """
+    A sequence of lines that are only read (from a process or an iterator)
+    when they are needed.
+
+    Lines that have been read are kept, so the stream can be indexed and
+    iterated over repeatedly. Asking for its length (or for negative
+    indices) reads all remaining lines. Once a stream is closed no more
+    lines are read, and it behaves as though the lines read so far are all
+    there are.
+
+    Lines may be read from more than one thread (e.g., while the stream is
+    being written to a process, see C{daudinlib.serialize.Feed}).
+
+    @param lines: An iterable of C{str} lines (without trailing newlines).
+    @param close: A no-argument function to call to stop the production of
+        lines (e.g., to terminate a process) when the stream is closed, or
+        C{None}.
+    @param fp: A text file to read lines from, instead of C{lines}.
+    """
+    def __init__(self, lines=None, close=None, fp=None):
+        self._lines = []
+        self._fp = fp
+        self._iter = None if fp else iter(lines)
+        self._close = close
+        # exhausted means no more lines will be read (because the end of the
+        # input was reached or the stream was closed or detached), eof
+        # means that the end of the input was reached.
+        self.exhausted = self.eof = False
+        self.closed = False
+        # Set while the stream is being read by something else (e.g.,
+        # written to a process, or decoded), which closes the stream when
+        # it is done.
+        self.feeding = False
+        self._lock = RLock()
+
+    @property
+    def untouched(self):
+        """
+        Have no lines been read yet?
+        """
+        return not self._lines and not self.exhausted
+
+    def _readOne(self):
+        """
+        Read one more line.
+
+        @return: A C{bool} indicating whether a line was read.
+        """
+        with self._lock:
+            if self.exhausted:
+                return False
+
+            if self._fp is None:
+                try:
+                    line = next(self._iter)
+                except StopIteration:
+                    line = None
+            else:
+                line = self._fp.readline()
+                if line:
+                    if line.endswith('\n'):
+                        line = line[:-1]
+                else:
+                    line = None
+
+            if line is None:
+                self._finish()
+                return False
+            else:
+                self._lines.append(line)
+                return True
+
+    def _readAll(self):
+        with self._lock:
+            if self.exhausted:
+                return
+            if self._fp is None:
+                self._lines.extend(self._iter)
+            else:
+                text = self._fp.read()
+                if text:
+                    if text.endswith('\n'):
+                        text = text[:-1]
+                    self._lines.extend(text.split('\n'))
+            self._finish()
+
+    def _finish(self):
+        """
+        Note that the end of the input has been reached. The stream is
+        closed, so (e.g.) a process that produced it is waited for.
+        """
+        self.exhausted = self.eof = True
+        self.close()
+
+    def _readTo(self, index):
+        """
+        Read until (at least) a given number of lines have been read.
+
+        @param index: The C{int} (non-negative) index of the line wanted.
+        """
+        while len(self._lines) <= index and self._readOne():
+            pass
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.start, index.stop, index.step
+            if (stop is None or stop < 0 or (start or 0) < 0 or
+                    (step or 1) < 0):
+                self._readAll()
+            else:
+                self._readTo(stop - 1)
+        elif index < 0:
+            self._readAll()
+        else:
+            self._readTo(index)
+        return self._lines[index]
+
+    def __len__(self):
+        self._readAll()
+        return len(self._lines)
+
+    def __bool__(self):
+        self._readTo(0)
+        return bool(self._lines)
+
+    def __iter__(self):
+        lines = self._lines
+        index = 0
+        while True:
+            if index < len(lines):
+                yield lines[index]
+                index += 1
+            elif not self._readOne():
+                return
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        # Note that this must not read the stream (it is used in debugging
+        # output).
+        return '<%s: %d line%s read%s>' % (
+            self.__class__.__name__, len(self._lines),
+            '' if len(self._lines) == 1 else 's',
+            '' if self.exhausted else ' so far')
+
+    def detach(self):
+        """
+        Take the underlying file, so it can be given to another process to
+        read directly.
+
+        @return: The file, or C{None} if there is no underlying file or lines
+            have already been read from it. If a file is returned, the
+            stream is exhausted (i.e., it is empty).
+        """
+        with self._lock:
+            if self._fp is None or not self.untouched:
+                return None
+            fp, self._fp = self._fp, None
+            self.exhausted = True
+            return fp
+
+    def detachIterator(self):
+        """
+        Take the underlying iterator, so its lines can be read (once)
+        without the stream keeping them.
+
+        @return: The iterator, or C{None} if lines are read from a file or
+            have already been read. If an iterator is returned, the stream is
+            exhausted (i.e., it is empty). Closing the stream still stops the
+            production of lines.
+        """
+        with self._lock:
+            if self._iter is None or not self.untouched:
+                return None
+            self.exhausted = True
+            return self._iter
+
+    def tolist(self):
+        """
+        Read all remaining lines and close the stream.
+
+        @return: A C{list} of all the C{str} lines.
+        """
+        self._readAll()
+        self.close()
+        return self._lines
+
+    def close(self):
+        """
+        Stop reading lines. Whatever is producing them is told to stop.
+        """
+        if not self.closed:
+            self.closed = True
+            self.exhausted = True
+            if self._fp is not None:
+                self._fp.close()
+                if self._close is not None:
+                    self._close()
+            elif self._close is not None:
+                # Wait for any line being read in another thread (e.g., a
+                # generator cannot be closed while it is running).
+                with self._lock:
+                    self._close()
+
+
+def _stop(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+def processLines(process, drainer=None, watchdog=None, maxChars=None,
+                 onLimit=None, feeder=None):
+    """
+    Make a C{LineStream} that reads the output of a process.
+
+    @param process: A C{subprocess.Popen} instance, started with a text mode
+        C{stdout} pipe, in its own session (i.e., process group).
+    @param drainer: A C{threading.Thread} that reads the standard error of
+        the process (see C{daudinlib.capture.drain}), or C{None}.
+    @param watchdog: A C{daudinlib.limits.Watchdog} watching the process, or
+        C{None}. It is cancelled when the stream is closed.
+    @param maxChars: The C{int} maximum number of characters of output to
+        read (after which the process is stopped), or C{None}.
+    @param onLimit: A function to call with the C{str} name of the limit
+        ('out') if the process is stopped for writing more than C{maxChars}
+        characters, or C{None}.
+    @param feeder: A C{threading.Thread} that writes the standard input of
+        the process (see C{daudinlib.serialize.Feed}), or C{None}. It is
+        waited for when the stream is closed.
+    @return: A C{LineStream}.
+    """
+    def close():
+        # As with SIGPIPE in a shell pipeline, the process is stopped if
+        # its output is no longer wanted. If all its output was read, it is
+        # left to exit by itself.
+        if not stream.eof and process.poll() is None:
+            _stop(process)
+        if maxChars is not None:
+            process.stdout.close()
+        process.wait()
+        if watchdog is not None:
+            watchdog.cancel()
+        if drainer is not None:
+            drainer.join()
+        if feeder is not None:
+            feeder.join()
+
+    if maxChars is None:
+        stream = LineStream(close=close, fp=process.stdout)
+    else:
+        def lines():
+            remaining = maxChars
+            for line in process.stdout:
+                if len(line) > remaining:
+                    if remaining:
+                        yield line[:remaining].rstrip('\n')
+                    _stop(process)
+                    if onLimit is not None:
+                        onLimit('out')
+                    return
+                remaining -= len(line)
+                yield line[:-1] if line.endswith('\n') else line
+
+        stream = LineStream(lines(), close=close)
+
+    return stream
+
+
+def iteratorLines(iterator):
+    """
+    Make a C{LineStream} that reads from an iterator (e.g., a generator).
+
+    @param iterator: An iterator of values. These are converted to C{str}
+        and any trailing newline is removed.
+    @return: A C{LineStream}. When this is closed, the iterator is also
+        closed (if it has a C{close} method).
+    """
+    def lines():
+        for value in iterator:
+            line = str(value)
+            yield line[:-1] if line.endswith('\n') else line
+
+    return LineStream(lines(), close=getattr(iterator, 'close', None))
+
+
+def isSelfContained(value):
+    """
+    Is a value one that cannot refer to a stream (e.g., lazily, as
+    C{map(int, _)} would)?
+
+    @param value: Any value.
+    @return: A C{bool}.
+    """
+    if isinstance(value, (str, bytes, int, float, complex, bool, LineStream,
+                          LineBuffer, type(None))):
+        return True
+    elif isinstance(value, (list, tuple)):
+        return all(isinstance(item, (str, bytes, int, float, complex, bool))
+                   for item in value)
+    else:
+        return False
+
+
+def isIterator(value):
+    """
+    Is a value a (one-shot) iterator, as opposed to a container?
+
+    @param value: Any value.
+    @return: A C{bool}.
+    """
+    return isinstance(value, Iterator) and not isinstance(value, LineStream)
+
+
+def sourceLines(data):
+    """
+    Get the lines of some data (e.g., to decode or sort). The output of a
+    shell command that is being streamed is read directly from the process,
+    rather than through the C{LineStream} (which would keep the lines).
+
+    @param data: A C{str}, C{bytes}, file, C{LineStream} or other iterable
+        of C{str} lines.
+    @return: A C{tuple} of an iterable of C{str} lines (which may end with
+        newlines, if the iterable is a file) and a no-argument function to
+        call when no more lines are wanted (or C{None}).
+    """
+    if isinstance(data, LineStream):
+        # The stream is closed by the reader, not by the pipeline.
+        data.feeding = True
+        fp = data.detach()
+        lines = data.detachIterator() if fp is None else fp
+
+        def close():
+            if fp is not None:
+                fp.close()
+            data.close()
+
+        return (data if lines is None else lines), close
+    elif isinstance(data, str):
+        return StringIO(data), None
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        return StringIO(bytes(data).decode('utf-8')), None
+    else:
+        return data, None
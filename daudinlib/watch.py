@@ -0,0 +1,264 @@
+import os
+import re
+import shlex
+import struct
+import ctypes
+from os.path import abspath, basename, dirname, exists, isdir
+from select import select
+from shutil import get_terminal_size
+from time import sleep
+
+from daudinlib.parse import lineSplitter
+
+# How long (in seconds) to wait for a burst of changes (e.g., an editor
+# saving a file, or a build writing many files) to end before re-running.
+DEBOUNCE = 0.2
+
+# How often (in seconds) to look for changes when inotify is not available.
+POLL_INTERVAL = 1.0
+
+# The inotify constants (from <sys/inotify.h>).
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+         _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF |
+         _IN_MOVE_SELF)
+
+_EVENT = struct.Struct('iIII')
+
+_SEPARATOR = re.compile(r'(?:^|\s)--(?:\s|$)')
+
+
+def parseWatch(text):
+    """
+    Parse the arguments of a %watch command.
+
+    @param text: The C{str} text after '%watch'. This is either paths to
+        watch followed by '--' and a command line, or just a command line
+        (in which case the paths are those named in the command line that
+        exist, or the current directory if there are none).
+    @return: A C{tuple} of a C{list} of C{str} paths and the C{str} command
+        line.
+    """
+    match = _SEPARATOR.search(text)
+    if match is not None:
+        return shlex.split(text[:match.start()]), text[match.end():].strip()
+
+    commandLine = text.strip()
+    paths = []
+    for command in lineSplitter(commandLine):
+        try:
+            words = shlex.split(command)
+        except ValueError:
+            words = command.split()
+        for word in words:
+            if word not in paths and not word.startswith('-') and exists(
+                    os.path.expanduser(word)):
+                paths.append(os.path.expanduser(word))
+
+    return paths or ['.'], commandLine
+
+
+class _Watcher:
+    """
+    Wait for changes to files or directories (i.e., to the files in them).
+    """
+    def _changed(self, timeout):
+        """
+        Wait for a change.
+
+        @param timeout: The C{float} number of seconds to wait, or C{None}
+            to wait until there is a change.
+        @return: C{True} if there was a change, else C{False}.
+        """
+        raise NotImplementedError()
+
+    def wait(self, debounce=DEBOUNCE):
+        """
+        Wait until there is a change, and then until there have been no more
+        for a while.
+
+        @param debounce: The C{float} number of seconds without changes to
+            wait for after a change.
+        """
+        while not self._changed(None):
+            pass
+        while self._changed(debounce):
+            pass
+
+    def clear(self):
+        """
+        Forget any changes that have not been waited for.
+        """
+        while self._changed(0):
+            pass
+
+    def close(self):
+        pass
+
+
+def _libc():
+    libc = ctypes.CDLL(None, use_errno=True)
+    # These raise AttributeError if there is no inotify (i.e., not Linux).
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+def _check(result):
+    if result < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return result
+
+
+class InotifyWatcher(_Watcher):
+    """
+    Wait for changes using Linux inotify (through C{ctypes}).
+
+    The directory of each file is watched, rather than the file itself, so
+    a file that is replaced (as many editors do when saving) is still
+    watched.
+
+    @param paths: An iterable of C{str} file or directory paths.
+    @raise OSError: If inotify is not available or a path cannot be
+        watched.
+    """
+    def __init__(self, paths):
+        try:
+            libc = _libc()
+        except AttributeError:
+            raise OSError('inotify is not available.')
+        self._fd = _check(libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC))
+        # The names of the watched files in each watched directory (with
+        # None meaning any file).
+        self._names = {}
+        try:
+            for path in paths:
+                path = abspath(path)
+                if isdir(path):
+                    directory, name = path, None
+                else:
+                    directory, name = dirname(path), basename(path)
+                wd = _check(libc.inotify_add_watch(
+                    self._fd, os.fsencode(directory), _MASK))
+                self._names.setdefault(wd, set()).add(name)
+        except BaseException:
+            self.close()
+            raise
+
+    def _changed(self, timeout):
+        while True:
+            if not select([self._fd], [], [], timeout)[0]:
+                return False
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                continue
+            offset = 0
+            changed = False
+            while offset < len(data):
+                wd, _, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                names = self._names.get(wd, ())
+                if None in names or name in names:
+                    changed = True
+            if changed:
+                return True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class PollingWatcher(_Watcher):
+    """
+    Wait for changes by looking at the modification time, size and inode of
+    files (and of the files in directories) every so often.
+
+    @param paths: An iterable of C{str} file or directory paths.
+    @param interval: The C{float} number of seconds between looks.
+    """
+    def __init__(self, paths, interval=POLL_INTERVAL):
+        self.paths = [abspath(path) for path in paths]
+        self.interval = interval
+        self._state = self._snapshot()
+
+    def _snapshot(self):
+        state = {}
+        for path in self.paths:
+            state[path] = _stat(path)
+            if isdir(path):
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            state[entry.path] = _stat(entry.path)
+                except OSError:
+                    pass
+        return state
+
+    def _changed(self, timeout):
+        while True:
+            sleep(self.interval if timeout is None else
+                  min(timeout, self.interval))
+            state = self._snapshot()
+            changed, self._state = state != self._state, state
+            if changed or timeout is not None:
+                return changed
+
+
+def makeWatcher(paths):
+    """
+    Make a watcher for some paths, using inotify if possible, else polling.
+
+    @param paths: An iterable of C{str} file or directory paths.
+    @return: An C{InotifyWatcher} or C{PollingWatcher}.
+    """
+    paths = list(paths)
+    try:
+        return InotifyWatcher(paths)
+    except OSError:
+        return PollingWatcher(paths)
+
+
+def redraw(fp, header, text, terminal=True):
+    """
+    Show the latest output of a watched command line. On a terminal, the
+    previous output is overwritten in place (rather than the screen being
+    cleared first, which would flicker), and the output is cut to fit.
+
+    @param fp: The text file to write to.
+    @param header: A C{str} line to show first.
+    @param text: The C{str} output.
+    @param terminal: If C{True}, C{fp} is a terminal.
+    """
+    lines = [header, ''] + text.rstrip('\n').split('\n')
+    if terminal:
+        lines = lines[:get_terminal_size().lines - 1]
+        fp.write('\x1b[H' + ''.join(line + '\x1b[K\n' for line in lines) +
+                 '\x1b[J')
+    else:
+        fp.write(''.join(line + '\n' for line in lines))
+    fp.flush()
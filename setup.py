@@ -45,11 +45,14 @@ setup(name='daudin',
           'Topic :: System :: Shells'
       ],
       license='MIT',
-      scripts=['daudin'],
+      scripts=['daudin', 'daudinc'],
       description='A UNIX command-line shell based on Python',
       extras_require={
         'dev': [
             'flake8',
             'pytest',
-        ]
+        ],
+        'numeric': [
+            'numpy',
+        ],
       })
@@ -0,0 +1,198 @@
+import sys
+from unittest import TestCase
+from io import StringIO
+from queue import Queue
+from threading import Barrier, Thread
+
+from daudinlib.capture import LineCapture, ErrorBuffer, StreamProxy, redirect
+
+
+class TestLineCapture(TestCase):
+    """Test the LineCapture class."""
+
+    def testNothingWritten(self):
+        """If nothing is written, the result must be None."""
+        self.assertIs(None, LineCapture().result())
+
+    def testEmptyStringWritten(self):
+        """If only an empty string is written, the result must be None."""
+        lc = LineCapture()
+        lc.write('')
+        self.assertIs(None, lc.result())
+
+    def testNewlineWritten(self):
+        """If only a newline is written, the result must be ''."""
+        lc = LineCapture()
+        lc.write('\n')
+        self.assertEqual('', lc.result())
+
+    def testOneLine(self):
+        """If one line is written, the result must be that line."""
+        lc = LineCapture()
+        lc.write('hello\n')
+        self.assertEqual('hello', lc.result())
+
+    def testUnterminatedLine(self):
+        """A final line without a newline must be in the result."""
+        lc = LineCapture()
+        lc.write('hello\nthere')
+        self.assertEqual(['hello', 'there'], lc.result())
+
+    def testLinesSplitAcrossWrites(self):
+        """Lines written in pieces must be put back together."""
+        lc = LineCapture()
+        for piece in ('he', 'llo', '\nth', 'ere', '\n'):
+            lc.write(piece)
+        self.assertEqual(['hello', 'there'], lc.result())
+
+    def testLinesAvailableBeforeClose(self):
+        """Complete lines must be available before the capture is closed."""
+        lc = LineCapture()
+        lc.write('a\nb\nc')
+        self.assertEqual(['a', 'b'], lc.lines)
+
+    def testEcho(self):
+        """Complete lines must be echoed as soon as they are written."""
+        echo = StringIO()
+        lc = LineCapture(echo=echo)
+        lc.write('a\nb')
+        self.assertEqual('a\n', echo.getvalue())
+        lc.close()
+        self.assertEqual('a\nb\n', echo.getvalue())
+
+    def testQueue(self):
+        """Lines must be put onto a queue, if one is given."""
+        queue = Queue()
+        lc = LineCapture(queue=queue)
+        lc.write('a\nb\n')
+        lc.close()
+        self.assertEqual('a', queue.get_nowait())
+        self.assertEqual('b', queue.get_nowait())
+        self.assertTrue(queue.empty())
+        self.assertEqual([], lc.lines)
+        self.assertIs(None, lc.result())
+
+
+class TestErrorBuffer(TestCase):
+    """Test the ErrorBuffer class."""
+
+    def testEmpty(self):
+        """An empty buffer must have no lines."""
+        self.assertEqual([], ErrorBuffer().lines())
+
+    def testLines(self):
+        """Written output must be available as lines."""
+        eb = ErrorBuffer()
+        eb.write(b'a\nb')
+        eb.write(b'c\n')
+        self.assertEqual(['a', 'bc'], eb.lines())
+
+    def testBounded(self):
+        """Only the most recent output must be kept."""
+        eb = ErrorBuffer(maxBytes=4)
+        eb.write(b'ab\n')
+        eb.write(b'cd\n')
+        self.assertEqual(4, len(eb))
+        self.assertEqual(b'\ncd\n', eb.getvalue())
+        self.assertEqual(2, eb.dropped)
+
+    def testPartialFirstLineDropped(self):
+        """A partially discarded first line must not be returned."""
+        eb = ErrorBuffer(maxBytes=5)
+        eb.write(b'abc\nde\n')
+        self.assertEqual(['de'], eb.lines())
+
+    def testEcho(self):
+        """Output must be echoed when it is written."""
+        echo = StringIO()
+        eb = ErrorBuffer(echo=echo)
+        eb.write(b'oops\n')
+        self.assertEqual('oops\n', echo.getvalue())
+
+    def testEchoRawTerminal(self):
+        """
+        When the terminal is in raw mode, echoed newlines must be preceded
+        by a carriage return, but the buffered output must be unchanged.
+        """
+        echo = StringIO()
+        eb = ErrorBuffer(echo=echo)
+        eb.rawTerminal = True
+        eb.write(b'a\nb\r\n')
+        self.assertEqual('a\r\nb\r\n', echo.getvalue())
+        self.assertEqual(b'a\nb\r\n', eb.getvalue())
+
+    def testClear(self):
+        """Clearing must empty the buffer."""
+        eb = ErrorBuffer(maxBytes=2)
+        eb.write(b'abc')
+        eb.clear()
+        self.assertEqual(0, len(eb))
+        self.assertEqual(0, eb.dropped)
+
+
+class TestRedirect(TestCase):
+    """Test the redirect function."""
+
+    def testRedirect(self):
+        """Printed output must go to the redirected file."""
+        out = StringIO()
+        with redirect('stdout', out):
+            print('hello')
+        self.assertEqual('hello\n', out.getvalue())
+
+    def testProxyInstalled(self):
+        """A StreamProxy must be left in place of sys.stdout."""
+        with redirect('stdout', StringIO()):
+            pass
+        self.assertIsInstance(sys.stdout, StreamProxy)
+
+    def testRestored(self):
+        """Output after a redirect must go to the original stdout."""
+        original, sys.stdout = sys.stdout, StringIO()
+        try:
+            with redirect('stdout', StringIO()):
+                print('inside')
+            print('outside')
+            self.assertEqual('outside\n', sys.stdout.getvalue())
+        finally:
+            sys.stdout = original
+
+    def testNested(self):
+        """Nested redirects must each get their own output."""
+        outer, inner = StringIO(), StringIO()
+        with redirect('stdout', outer):
+            print('a')
+            with redirect('stdout', inner):
+                print('b')
+            print('c')
+        self.assertEqual('a\nc\n', outer.getvalue())
+        self.assertEqual('b\n', inner.getvalue())
+
+    def testStdin(self):
+        """Standard input must be read from the redirected file."""
+        with redirect('stdin', StringIO('line\n')):
+            self.assertEqual('line', input())
+
+    def testThreads(self):
+        """
+        Threads printing at the same time must each get only their own
+        output.
+        """
+        count = 4
+        barrier = Barrier(count)
+        outputs = [StringIO() for _ in range(count)]
+
+        def run(index):
+            with redirect('stdout', outputs[index]):
+                barrier.wait()
+                for _ in range(1000):
+                    print(index)
+
+        threads = [Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for index, output in enumerate(outputs):
+            self.assertEqual('%d\n' % index * 1000, output.getvalue())
@@ -0,0 +1,120 @@
+import sys
+from unittest import TestCase
+from io import StringIO
+
+from daudinlib.decode import decode
+from daudinlib.interaction import Batch
+from daudinlib.pipeline import Pipeline
+from daudinlib.stream import LineStream
+
+
+class TestDecode(TestCase):
+    """Test the decode function."""
+
+    def testUnknownFormat(self):
+        """An unknown format must raise ValueError."""
+        self.assertRaises(ValueError, decode, '', 'xml')
+
+    def testJSON(self):
+        """A JSON document must be decoded."""
+        self.assertEqual({'a': [1, 2]}, decode('{"a": [1, 2]}', 'json'))
+
+    def testJSONLines(self):
+        """A JSON document split over lines must be decoded."""
+        self.assertEqual({'a': 1}, decode(['{', '"a": 1', '}'], 'json'))
+
+    def testJSONBytes(self):
+        """A JSON document in bytes must be decoded."""
+        self.assertEqual([1], decode(b'[1]', 'json'))
+
+    def testJSONL(self):
+        """JSON Lines must be decoded, ignoring blank lines."""
+        self.assertEqual([{'a': 1}, 2, 'x'],
+                         decode(['{"a": 1}', '', '2', '"x"'], 'jsonl'))
+
+    def testJSONLText(self):
+        """JSON Lines in a string must be decoded."""
+        self.assertEqual([1, 2], decode('1\n2\n', 'jsonl'))
+
+    def testLazy(self):
+        """Lines must only be decoded as records are needed."""
+        def lines():
+            yield '1'
+            yield '2'
+            raise AssertionError('Too many lines read.')
+
+        records = decode(lines(), 'jsonl')
+        self.assertIsInstance(records, LineStream)
+        self.assertEqual([1, 2], records[:2])
+
+    def testCSV(self):
+        """CSV records must be dicts keyed by the header row."""
+        self.assertEqual([{'a': '1', 'b': 'x, y'}],
+                         decode(['a,b', '1,"x, y"'], 'csv'))
+
+    def testCSVNoHeader(self):
+        """CSV records without a header must be lists."""
+        self.assertEqual([['a', 'b'], ['1', '2']],
+                         decode(['a,b', '1,2'], 'csv', header=False))
+
+    def testTSV(self):
+        """TSV records must be split on tabs."""
+        self.assertEqual([{'a b': '1', 'c': '2'}],
+                         decode(['a b\tc', '1\t2'], 'tsv'))
+
+    def testStream(self):
+        """
+        Decoding a stream must close it once no more records are wanted.
+        """
+        closed = []
+        stream = LineStream(['1', '2', '3'], close=lambda: closed.append(1))
+        records = decode(stream, 'jsonl')
+        self.assertTrue(stream.feeding)
+        self.assertEqual(1, records[0])
+        records.close()
+        self.assertEqual([1], closed)
+
+
+class TestPipelineDecode(TestCase):
+    """Test decoding in a pipeline."""
+
+    def testDecode(self):
+        """The decode function must decode the pipeline value."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        p.run('["1", "2"]', 1, 2)
+        p.run('decode("jsonl")', 2, 2)
+        self.assertEqual([1, 2], p.stdin)
+
+    def testAsJSON(self):
+        """%as json must decode the output of a shell command."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        Batch(p).runCommandLine(
+            """printf '{"a": [1, 2]}' | %as json | _['a']""")
+        self.assertEqual([1, 2], p.stdin)
+
+    def testAsCSV(self):
+        """%as csv must decode the output of a shell command."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        Batch(p).runCommandLine("printf 'x,y\\n1,2\\n' | %as csv")
+        self.assertEqual([{'x': '1', 'y': '2'}], p.stdin)
+
+    def testAsStreamed(self):
+        """
+        %as jsonl must decode the output of a streamed shell command as it
+        is needed.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        Batch(p).runCommandLine('seq 100000000 | %as jsonl | _[:3]')
+        self.assertEqual([1, 2, 3], p.stdin)
+
+    def testAsUnknown(self):
+        """%as with an unknown format must be reported."""
+        p = Pipeline(loadInitFile=False)
+        sys.stderr, stderr = StringIO(), sys.stderr
+        try:
+            Batch(p).runCommandLine('%as xml')
+            err = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual('Give one format to %as (json, jsonl, csv, tsv).\n',
+                         err)
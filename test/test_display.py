@@ -0,0 +1,103 @@
+from unittest import TestCase
+from unittest.mock import patch
+from io import StringIO
+
+from daudinlib.display import (
+    valueLines, summaryRepr, truncate, writeLines, show)
+from daudinlib.lines import LineBuffer
+from daudinlib.pipeline import Pipeline
+
+
+class TestValueLines(TestCase):
+    """Test the valueLines function."""
+
+    def testString(self):
+        """A string must be split into lines, ignoring a final newline."""
+        self.assertEqual(['a', 'b'], valueLines('a\nb\n'))
+
+    def testList(self):
+        """A list displayed as a list must give its elements."""
+        self.assertEqual([1, 2], valueLines([1, 2], asList=True))
+
+    def testEmptyList(self):
+        """An empty list displayed as a list must give one empty line."""
+        self.assertEqual([''], valueLines([], asList=True))
+
+    def testListNotAsList(self):
+        """A list not displayed as a list must be shown as by print."""
+        self.assertEqual(['[1, 2]'], valueLines([1, 2]))
+
+
+class TestSummaryRepr(TestCase):
+    """Test the summaryRepr function."""
+
+    def testSmall(self):
+        """A small container must be shown in full."""
+        self.assertEqual('[1, 2, 3]', summaryRepr([1, 2, 3], 3))
+
+    def testLarge(self):
+        """A large container must be abbreviated and its length given."""
+        self.assertEqual('[0, 1, ...]\n(1000 items)',
+                         summaryRepr(list(range(1000)), 2))
+
+    def testSequence(self):
+        """
+        A large sequence that is not a list (e.g., a LineBuffer) must be
+        abbreviated like a list, without making the repr of all of it.
+        """
+        lines = LineBuffer(''.join('%d\n' % i for i in range(20)))
+        with patch.object(LineBuffer, '__repr__') as repr_:
+            self.assertEqual("['0', '1', ...]\n(20 items)",
+                             summaryRepr(lines, 2))
+        repr_.assert_not_called()
+
+    def testNoLimit(self):
+        """With no limit, a large container must be shown in full."""
+        self.assertEqual(str(list(range(1000))),
+                         summaryRepr(list(range(1000))))
+
+
+class TestTruncate(TestCase):
+    """Test the truncate function."""
+
+    def testShort(self):
+        """Lines that fit must be unchanged."""
+        self.assertEqual(['a', 'b'], list(truncate(['a', 'b'], 2)))
+
+    def testList(self):
+        """A long list must be abbreviated, saying how much was left out."""
+        self.assertEqual(
+            [0, 1, '... 6 more lines (10 in total) ...', 8, 9],
+            list(truncate(list(range(10)), 4)))
+
+    def testIterator(self):
+        """A long iterator must be abbreviated in the same way as a list."""
+        self.assertEqual(
+            [0, 1, '... 1 more line (5 in total) ...', 3, 4],
+            list(truncate(iter(range(5)), 4)))
+
+
+class TestShow(TestCase):
+    """Test the writeLines and show functions."""
+
+    def testWriteLines(self):
+        """Lines must be written with newlines, in chunks."""
+        fp = StringIO()
+        writeLines(map(str, range(100000)), fp)
+        self.assertEqual(
+            ''.join('%d\n' % i for i in range(100000)), fp.getvalue())
+
+    def testShowTruncated(self):
+        """A value with too many lines must be abbreviated."""
+        fp = StringIO()
+        show(list(map(str, range(100))), fp, asList=True, maxLines=2)
+        self.assertEqual('0\n... 98 more lines (100 in total) ...\n99\n',
+                         fp.getvalue())
+
+    def testPrintUsesDisplayLines(self):
+        """Pipeline.print_ must abbreviate long values."""
+        fp = StringIO()
+        p = Pipeline(loadInitFile=False, outfp=fp, displayLines=4)
+        p.run('list(range(100))')
+        p.print_()
+        self.assertEqual('[0, 1, 2, 3, ...]\n(100 items)\n', fp.getvalue())
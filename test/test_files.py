@@ -0,0 +1,304 @@
+import os
+import bz2
+import gzip
+import lzma
+from unittest import TestCase
+from io import StringIO
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from daudinlib.files import expandPaths, fileLines, read, writeValue
+from daudinlib.interaction import Batch
+from daudinlib.pipeline import Pipeline
+from daudinlib.stream import LineStream
+
+
+class _FilesMixin:
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name, data=b'', opener=open):
+        path = join(self.tmpdir.name, name)
+        with opener(path, 'wb') as fp:
+            fp.write(data)
+        return path
+
+
+class TestExpandPaths(_FilesMixin, TestCase):
+    """Test the expandPaths function."""
+
+    def testPlain(self):
+        """A path that is not a pattern must be kept (even if missing)."""
+        self.assertEqual(['/nonexistent'], expandPaths(['/nonexistent']))
+
+    def testPattern(self):
+        """A pattern must be expanded to the sorted matching paths."""
+        b = self.path('b.txt')
+        a = self.path('a.txt')
+        self.path('c.log')
+        self.assertEqual([a, b], expandPaths([join(self.tmpdir.name,
+                                                   '*.txt')]))
+
+    def testNoMatch(self):
+        """A pattern that matches nothing must raise FileNotFoundError."""
+        self.assertRaises(FileNotFoundError, expandPaths,
+                          [join(self.tmpdir.name, '*.txt')])
+
+
+class TestFileLines(_FilesMixin, TestCase):
+    """Test the fileLines function."""
+
+    def testPlain(self):
+        """The lines of a plain file must be read."""
+        path = self.path('f', b'a\nb\n\nc\n')
+        self.assertEqual(['a', 'b', '', 'c'], list(fileLines(path)))
+
+    def testNoFinalNewline(self):
+        """A last line with no newline must be read."""
+        path = self.path('f', b'a\nb')
+        self.assertEqual(['a', 'b'], list(fileLines(path)))
+
+    def testEmpty(self):
+        """An empty file must have no lines."""
+        self.assertEqual([], list(fileLines(self.path('f'))))
+
+    def testCarriageReturn(self):
+        """Carriage returns must be kept."""
+        path = self.path('f', b'a\r\nb\n')
+        self.assertEqual(['a\r', 'b'], list(fileLines(path)))
+
+    def testInvalidUTF8(self):
+        """Bytes that are not UTF-8 must not cause an error."""
+        path = self.path('f', b'\xff\n')
+        self.assertEqual(['\udcff'], list(fileLines(path)))
+
+    def testGzip(self):
+        """A gzip file must be decompressed."""
+        path = self.path('f', b'a\nb\n', gzip.open)
+        self.assertEqual(['a', 'b'], list(fileLines(path)))
+
+    def testBzip2(self):
+        """A bzip2 file must be decompressed."""
+        path = self.path('f', b'a\nb', bz2.open)
+        self.assertEqual(['a', 'b'], list(fileLines(path)))
+
+    def testXz(self):
+        """An xz file must be decompressed."""
+        path = self.path('f', b'a\r\nb\n', lzma.open)
+        self.assertEqual(['a\r', 'b'], list(fileLines(path)))
+
+    def testNamedPipe(self):
+        """A named pipe must be read."""
+        path = join(self.tmpdir.name, 'fifo')
+        os.mkfifo(path)
+        pid = os.fork()
+        if pid == 0:
+            with open(path, 'wb') as fp:
+                fp.write(b'a\nb\n')
+            os._exit(0)
+        try:
+            self.assertEqual(['a', 'b'], list(fileLines(path)))
+        finally:
+            os.waitpid(pid, 0)
+
+
+class TestRead(_FilesMixin, TestCase):
+    """Test the read function."""
+
+    def testNoPaths(self):
+        """Giving no paths must raise ValueError."""
+        self.assertRaises(ValueError, read)
+
+    def testMissing(self):
+        """A missing file must raise FileNotFoundError at once."""
+        self.assertRaises(FileNotFoundError, read,
+                          join(self.tmpdir.name, 'missing'))
+
+    def testLazy(self):
+        """Lines must only be read as they are needed."""
+        path = self.path('f', b'a\nb\nc\n')
+        lines = read(path)
+        self.assertIsInstance(lines, LineStream)
+        self.assertEqual('a', lines[0])
+        self.assertFalse(lines.exhausted)
+        lines.close()
+        self.assertEqual(['a'], list(lines))
+
+    def testSeveral(self):
+        """Several files (and patterns) must be read in turn."""
+        self.path('1.txt', b'a\nb\n')
+        self.path('2.txt', b'c\n', gzip.open)
+        last = self.path('last', b'd\n')
+        self.assertEqual(['a', 'b', 'c', 'd'],
+                         list(read(join(self.tmpdir.name, '*.txt'), last)))
+
+
+class TestWriteValue(_FilesMixin, TestCase):
+    """Test the writeValue function."""
+
+    def contents(self, path, opener=open):
+        with opener(path, 'rb') as fp:
+            return fp.read()
+
+    def testList(self):
+        """A list must be written one item per line."""
+        path = join(self.tmpdir.name, 'f')
+        self.assertEqual(4, writeValue(['a', 1], path))
+        self.assertEqual(b'a\n1\n', self.contents(path))
+
+    def testReplace(self):
+        """An existing file must be replaced, keeping its permissions."""
+        path = self.path('f', b'old\n')
+        os.chmod(path, 0o640)
+        writeValue('new', path)
+        self.assertEqual(b'new\n', self.contents(path))
+        self.assertEqual(0o640, os.stat(path).st_mode & 0o777)
+
+    def testAppend(self):
+        """Appending must add to the end of the file."""
+        path = self.path('f', b'a\n')
+        writeValue(['b'], path, append=True)
+        self.assertEqual(b'a\nb\n', self.contents(path))
+
+    def testAppendInPlace(self):
+        """
+        Appending must add to the file itself, not replace it with a copy.
+        """
+        path = self.path('f', b'a\n')
+        inode = os.stat(path).st_ino
+        writeValue(['b'], path, append=True)
+        self.assertEqual(inode, os.stat(path).st_ino)
+
+    def testAppendNew(self):
+        """Appending to a file that does not exist must create it."""
+        path = join(self.tmpdir.name, 'f')
+        writeValue(['a'], path, append=True)
+        self.assertEqual(b'a\n', self.contents(path))
+
+    def testEmpty(self):
+        """An empty list must make an empty file."""
+        path = join(self.tmpdir.name, 'f')
+        writeValue([], path)
+        self.assertEqual(b'', self.contents(path))
+
+    def testCompressBySuffix(self):
+        """A file whose name ends in .gz must be compressed."""
+        path = join(self.tmpdir.name, 'f.gz')
+        writeValue(['a'], path)
+        self.assertEqual(b'a\n', self.contents(path, gzip.open))
+
+    def testCompress(self):
+        """A compression can be given."""
+        path = join(self.tmpdir.name, 'f')
+        writeValue(['a'], path, compress='xz')
+        self.assertEqual(b'a\n', self.contents(path, lzma.open))
+
+    def testNoCompress(self):
+        """Compression by suffix can be turned off."""
+        path = join(self.tmpdir.name, 'f.gz')
+        writeValue(['a'], path, compress=False)
+        self.assertEqual(b'a\n', self.contents(path))
+
+    def testAppendCompressed(self):
+        """Appending to a compressed file must add another stream."""
+        path = join(self.tmpdir.name, 'f.bz2')
+        writeValue(['a'], path)
+        writeValue(['b'], path, append=True)
+        self.assertEqual(['a', 'b'], list(read(path)))
+
+    def testUnknownCompression(self):
+        """An unknown compression must raise ValueError."""
+        self.assertRaises(ValueError, writeValue, 'a',
+                          join(self.tmpdir.name, 'f'), compress='zip')
+
+    def testFailure(self):
+        """
+        If writing fails, the file must be unchanged and no temporary file
+        left behind.
+        """
+        path = self.path('f', b'old\n')
+
+        def lines():
+            yield 'new'
+            raise RuntimeError('Oops')
+
+        self.assertRaises(RuntimeError, writeValue, lines(), path)
+        self.assertEqual(b'old\n', self.contents(path))
+        self.assertEqual(['f'], os.listdir(self.tmpdir.name))
+
+    def testSymlink(self):
+        """Writing to a symbolic link must replace the file it points to."""
+        target = self.path('target', b'old\n')
+        link = join(self.tmpdir.name, 'link')
+        os.symlink(target, link)
+        writeValue('new', link)
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(b'new\n', self.contents(target))
+
+
+class TestPipelineRead(_FilesMixin, TestCase):
+    """Test reading files in a pipeline."""
+
+    def testRead(self):
+        """The read function must give the lines of a file."""
+        path = self.path('f', b'3\n4\n')
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        p.run('read(%r)' % path)
+        self.assertEqual(['3', '4'], p.stdin)
+
+    def testReadToShell(self):
+        """The lines read must be given to a following shell command."""
+        path = self.path('f', b'a\nb\nc\n', gzip.open)
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        Batch(p).runCommandLine('read(%r) | sed -n 2p' % path)
+        self.assertEqual(['b'], p.stdin)
+
+    def testWrite(self):
+        """
+        The write function must write _ to a file and leave it unchanged
+        (without printing it).
+        """
+        path = join(self.tmpdir.name, 'f')
+        out = StringIO()
+        p = Pipeline(loadInitFile=False, outfp=out, usePtys=False)
+        Batch(p).runCommandLine('seq 3 | write(%r)' % path)
+        with open(path) as fp:
+            self.assertEqual('1\n2\n3\n', fp.read())
+        self.assertEqual(['1', '2', '3'], p.stdin)
+        self.assertEqual('', out.getvalue())
+
+    def testWriteIterator(self):
+        """An iterator written to a file must still be available after."""
+        path = join(self.tmpdir.name, 'f')
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        Batch(p).runCommandLine('iter(range(3)) | write(%r) | len(_)' % path)
+        self.assertEqual(3, p.stdin)
+
+    def testTee(self):
+        """The tee function must write _ to a file and print it."""
+        path = join(self.tmpdir.name, 'f')
+        out = StringIO()
+        p = Pipeline(loadInitFile=False, outfp=out)
+        Batch(p).runCommandLine('[4, 5] | tee(%r)' % path)
+        with open(path) as fp:
+            self.assertEqual('4\n5\n', fp.read())
+        self.assertEqual([4, 5], p.stdin)
+        self.assertEqual('[4, 5]\n', out.getvalue())
+
+    def testWriteNotCached(self):
+        """
+        A stage that writes a file must be run again when a later command
+        line starts with it.
+        """
+        path = join(self.tmpdir.name, 'f')
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        batch = Batch(p)
+        batch.runCommandLine('seq 3 | write(%r) | len(_)' % path)
+        os.unlink(path)
+        batch.runCommandLine('seq 3 | write(%r) | len(_) | _ + 1' % path)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(4, p.stdin)
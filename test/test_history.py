@@ -0,0 +1,80 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os.path import join
+
+from daudinlib.history import History
+
+
+class TestHistory(TestCase):
+    """Test the History class."""
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = join(self.tmpdir.name, 'history.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testEmpty(self):
+        """A new history must be empty."""
+        history = History(self.path)
+        self.assertEqual(0, len(history))
+        self.assertEqual([], history.recent(10))
+        history.close()
+
+    def testAdd(self):
+        """An added command must be recorded with its details."""
+        history = History(self.path)
+        history.add('ls', cwd='/tmp', started=100.0, duration=0.5, status=2)
+        (entry,) = history.recent(10)
+        self.assertEqual(('ls', '/tmp', 100.0, 0.5, 2),
+                         (entry.command, entry.cwd, entry.started,
+                          entry.duration, entry.status))
+        history.close()
+
+    def testRecent(self):
+        """The most recent commands must be returned, oldest first."""
+        history = History(self.path)
+        history.addMany(str(i) for i in range(10))
+        self.assertEqual(['7', '8', '9'],
+                         [entry.command for entry in history.recent(3)])
+        history.close()
+
+    def testSearch(self):
+        """Commands containing all the query words must be found."""
+        history = History(self.path)
+        history.addMany(['git status', 'ls -l', 'git commit -m fix',
+                         'git push'])
+        self.assertEqual(['git commit -m fix'],
+                         [entry.command
+                          for entry in history.search('commit git')])
+        history.close()
+
+    def testSearchLimit(self):
+        """A search must return the most recent matches."""
+        history = History(self.path)
+        history.addMany('echo %d' % i for i in range(100))
+        self.assertEqual(['echo 98', 'echo 99'],
+                         [entry.command
+                          for entry in history.search('echo', n=2)])
+        history.close()
+
+    def testSearchPunctuation(self):
+        """A query that is not valid FTS syntax must still find commands."""
+        history = History(self.path)
+        history.addMany(['cat a.txt', 'cat b.txt'])
+        self.assertEqual(['cat a.txt'],
+                         [entry.command for entry in history.search('a.txt')])
+        history.close()
+
+    def testConcurrentSessions(self):
+        """Commands from two sessions must all be kept."""
+        history1 = History(self.path)
+        history2 = History(self.path)
+        history1.add('one')
+        history2.add('two')
+        history1.add('three')
+        self.assertEqual(['one', 'two', 'three'],
+                         [entry.command for entry in history2.recent(10)])
+        history1.close()
+        history2.close()
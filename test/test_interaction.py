@@ -1,7 +1,12 @@
 import sys
 from unittest import TestCase
 from io import StringIO
+from contextlib import redirect_stdout, redirect_stderr
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from os.path import join
 
+from daudinlib.history import History
 from daudinlib.interaction import REPL, Batch
 from daudinlib.pipeline import Pipeline
 
@@ -227,6 +232,77 @@ class TestREPL(TestCase):
         self.assertEqual(17, pl.stdin)
         self.assertEqual(REPL.DEFAULT_PS1, repl.prompt)
 
+    def testSearchHistory(self):
+        """
+        The %hist special command must print the matching history entries.
+        """
+        with TemporaryDirectory() as tmpdir:
+            history = History(join(tmpdir, 'history.db'))
+            history.addMany(['ls', 'git status', 'pwd'])
+            repl = REPL(Pipeline(loadInitFile=False), history=history)
+            with redirect_stdout(StringIO()) as out:
+                repl.runCommandLine('%hist git')
+            history.close()
+        self.assertTrue(out.getvalue().endswith('  git status\n'))
+        self.assertEqual(1, out.getvalue().count('\n'))
+
+    def testPastedPython(self):
+        """
+        A pasted block of Python must be compiled and run in one go, with
+        the '|' in it not splitting commands.
+        """
+        out = StringIO()
+        pl = Pipeline(loadInitFile=False, outfp=out)
+        repl = REPL(pl)
+        text = ('def f(x):\n'
+                '    return x | 1\n'
+                '\n'
+                'y = 0\n'
+                'for i in range(4):\n'
+                '    y += f(i)\n'
+                'print(y)\n')
+        with patch('daudinlib.pipeline.compile_command') as compile_:
+            self.assertTrue(repl.runText(text))
+        compile_.assert_not_called()
+        self.assertEqual('8\n', out.getvalue())
+        self.assertEqual('8', pl.stdin)
+        self.assertEqual(8, pl.local['y'])
+        self.assertEqual(REPL.DEFAULT_PS1, repl.prompt)
+
+    def testPastedExpression(self):
+        """
+        The value of an expression that ends a pasted block of Python must
+        be printed and become the pipeline value.
+        """
+        out = StringIO()
+        pl = Pipeline(loadInitFile=False, outfp=out)
+        repl = REPL(pl)
+        self.assertTrue(repl.runText('x = [1, 2, 3]\nlen(x)\n'))
+        self.assertEqual('3\n', out.getvalue())
+        self.assertEqual(3, pl.stdin)
+
+    def testPastedShellCommands(self):
+        """
+        A pasted block that is not all Python must be run line by line.
+        """
+        pl = Pipeline(loadInitFile=False)
+        repl = REPL(pl)
+        with redirect_stdout(StringIO()):
+            self.assertTrue(repl.runText('x = 3\necho hello | wc -w\n'))
+        self.assertEqual(3, pl.local['x'])
+        self.assertEqual(['1'], [line.strip() for line in pl.stdin])
+
+    def testPastedException(self):
+        """
+        A pasted block of Python that raises must have its traceback
+        printed.
+        """
+        pl = Pipeline(loadInitFile=False)
+        repl = REPL(pl)
+        with redirect_stderr(StringIO()) as err:
+            self.assertFalse(repl.runText('x = 1\nraise ValueError(x)\n'))
+        self.assertIn('ValueError: 1', err.getvalue())
+
 
 class TestInteractiveREADME(TestCase):
     """Test some examples from the README when entered interactively."""
@@ -476,4 +552,7 @@ echo hello too
         out = StringIO()
         pl = Pipeline(loadInitFile=False, outfp=out)
         Batch(pl).run(commands)
-        self.assertEqual('4\n4\n[3, 6, 9]\nhello\n', out.getvalue())
+        # The echo command is run natively, so its output is also printed
+        # to out.
+        self.assertEqual('4\n4\n[3, 6, 9]\nhello\nhello too\n',
+                         out.getvalue())
@@ -0,0 +1,321 @@
+import sys
+from unittest import TestCase, skipUnless
+from io import StringIO
+from contextlib import redirect_stdout
+from os.path import exists
+from time import time
+from unittest.mock import patch
+
+from daudinlib.capture import LineCapture
+from daudinlib.interaction import Batch
+from daudinlib.limits import (
+    Limits, LimitExceeded, LIMIT_STATUS, parseLimits, enforced)
+from daudinlib.pipeline import Pipeline
+
+
+class TestParseLimits(TestCase):
+    """Test the parseLimits function."""
+
+    def testNone(self):
+        """Text with no limits must be returned unchanged."""
+        self.assertEqual(({}, 'find /'), parseLimits('find /'))
+
+    def testLimits(self):
+        """Limits with units must be converted."""
+        self.assertEqual(
+            ({'time': 90.0, 'cpu': 2.5, 'mem': 1 << 30, 'out': 10240},
+             'find / | head'),
+            parseLimits('time=1.5m cpu=2.5 mem=1G out=10k find / | head'))
+
+    def testNoLimit(self):
+        """A limit of 'none' must give None."""
+        self.assertEqual(({'time': None}, ''), parseLimits('time=none'))
+
+    def testInvalid(self):
+        """An invalid limit must raise ValueError."""
+        self.assertRaises(ValueError, parseLimits, 'mem=lots')
+        self.assertRaises(ValueError, parseLimits, 'time=3G')
+
+
+class TestLimits(TestCase):
+    """Test the Limits class."""
+
+    def testFromString(self):
+        """A Limits must be made from a string."""
+        self.assertEqual(Limits(time=30.0, mem=2 << 30),
+                         Limits.fromString('time=30s mem=2G'))
+
+    def testFromStringWithCommand(self):
+        """A string with more than limits in it must raise ValueError."""
+        self.assertRaises(ValueError, Limits.fromString, 'time=30 ls')
+
+    def testStr(self):
+        """The string of a Limits must be parseable."""
+        limits = Limits(time=30.0, out=3 << 20)
+        self.assertEqual('time=30s cpu=none mem=none out=3M', str(limits))
+        self.assertEqual(limits, Limits.fromString(str(limits)))
+
+    def testBool(self):
+        """A Limits must only be true if it has a limit."""
+        self.assertFalse(Limits())
+        self.assertTrue(Limits(out=0))
+
+    def testTighter(self):
+        """Combining limits must keep the lower of each."""
+        self.assertEqual(
+            Limits(time=5, cpu=2, mem=10),
+            Limits(time=5, cpu=3).tighter(Limits(time=6, cpu=2, mem=10)))
+
+    def testRemaining(self):
+        """The remaining limits must allow for time already used."""
+        self.assertEqual(Limits(time=7.0, cpu=1.0, mem=10),
+                         Limits(time=10, cpu=3, mem=10).remaining(3.0, 2.0))
+
+    def testNoneRemaining(self):
+        """A time limit that has run out must still be positive."""
+        self.assertLess(0, Limits(time=1).remaining(5.0, 0.0).time)
+
+    def testNoChildSetup(self):
+        """
+        There must be no child setup function if there are no CPU time or
+        memory limits.
+        """
+        self.assertIsNone(Limits(time=3, out=10).childSetup())
+
+    def testChildSetup(self):
+        """There must be a child setup function if there is a CPU limit."""
+        self.assertTrue(callable(Limits(cpu=3).childSetup()))
+
+
+class TestEnforced(TestCase):
+    """Test the enforced context manager."""
+
+    def testTime(self):
+        """A Python loop must be stopped at its time limit."""
+        start = time()
+        with self.assertRaises(LimitExceeded) as cm:
+            with enforced(Limits(time=0.2)):
+                while True:
+                    pass
+        self.assertEqual('time', cm.exception.name)
+        self.assertLess(time() - start, 5)
+
+    def testCPU(self):
+        """A Python loop must be stopped at its CPU time limit."""
+        with self.assertRaises(LimitExceeded) as cm:
+            with enforced(Limits(cpu=0.2)):
+                while True:
+                    pass
+        self.assertEqual('cpu', cm.exception.name)
+
+    @skipUnless(exists('/proc/self/statm'), 'Needs /proc/self/statm')
+    def testMemory(self):
+        """An allocation over the memory limit must be stopped."""
+        with self.assertRaises(LimitExceeded) as cm:
+            with enforced(Limits(mem=50 << 20)):
+                bytearray(500 << 20)
+        self.assertEqual('mem', cm.exception.name)
+        # The limit must be removed afterwards.
+        bytearray(100 << 20)
+
+    def testNoLimit(self):
+        """Code that does not exceed its limits must run as usual."""
+        with enforced(Limits(time=10, cpu=10)):
+            result = sum(range(100))
+        self.assertEqual(4950, result)
+
+
+class TestLineCaptureLimit(TestCase):
+    """Test the output limit of LineCapture."""
+
+    def testLimit(self):
+        """Output over the limit must raise, keeping what fits."""
+        capture = LineCapture(maxChars=5)
+        capture.write('abc\n')
+        self.assertRaises(LimitExceeded, capture.write, 'defg\n')
+        self.assertEqual(['abc', 'd'], capture.result())
+
+
+class TestPipelineLimits(TestCase):
+    """Test the limits of pipeline stages."""
+
+    def testPythonTime(self):
+        """
+        A Python stage that runs for too long must be stopped, keeping its
+        output.
+        """
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err,
+                     limits=Limits(time=0.3))
+        p.run('import itertools; any(print("x") for _ in itertools.count())',
+              1, 2)
+        self.assertEqual(LIMIT_STATUS, p.status)
+        self.assertEqual('Time limit exceeded.\n', err.getvalue())
+        self.assertIn('x', p.stdin)
+        self.assertFalse(p.incomplete)
+
+    def testPythonOutput(self):
+        """A Python stage that prints too much must be stopped."""
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err, limits=Limits(out=20))
+        p.run('[print(i) for i in range(1000)]', 1, 2)
+        self.assertEqual(LIMIT_STATUS, p.status)
+        self.assertEqual('Output limit exceeded.\n', err.getvalue())
+        self.assertEqual([str(i) for i in range(10)], p.stdin)
+
+    def testShellTime(self):
+        """A shell command that runs for too long must be stopped."""
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err, outfp=StringIO(),
+                     usePtys=False, limits=Limits(time=0.5))
+        start = time()
+        p.run('echo hello; sleep 10')
+        self.assertLess(time() - start, 5)
+        self.assertEqual(LIMIT_STATUS, p.status)
+        self.assertEqual('Time limit exceeded.\n', err.getvalue())
+        self.assertEqual(['hello'], p.stdin)
+
+    def testShellOutput(self):
+        """A shell command that prints too much must be stopped."""
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err, outfp=StringIO(),
+                     usePtys=False, limits=Limits(out=10))
+        p.run('seq 1000000')
+        self.assertEqual(LIMIT_STATUS, p.status)
+        self.assertEqual(['1', '2', '3', '4', '5'], p.stdin)
+
+    def testPtySpawn(self):
+        """
+        A command in a pseudo-tty must be run in a new session, without a
+        preexec_fn (so the process can be started with vfork) if there are
+        no CPU time or memory limits.
+        """
+        import daudinlib.pipeline
+        p = Pipeline(loadInitFile=False, outfp=StringIO(),
+                     limits=Limits(time=5))
+        with patch.object(daudinlib.pipeline, 'Popen',
+                          wraps=daudinlib.pipeline.Popen) as popen:
+            p.run('printf "hello\\n"')
+        self.assertEqual(['hello'], p.stdin)
+        kwargs = popen.call_args[1]
+        self.assertTrue(kwargs['start_new_session'])
+        self.assertNotIn('preexec_fn', kwargs)
+
+    def testPtySpawnWithMemoryLimit(self):
+        """
+        A command in a pseudo-tty must be given a preexec_fn to set a memory
+        limit.
+        """
+        import daudinlib.pipeline
+        p = Pipeline(loadInitFile=False, outfp=StringIO(),
+                     limits=Limits(mem=4 << 30))
+        with patch.object(daudinlib.pipeline, 'Popen',
+                          wraps=daudinlib.pipeline.Popen) as popen:
+            p.run('printf "hello\\n"')
+        self.assertEqual(['hello'], p.stdin)
+        self.assertIn('preexec_fn', popen.call_args[1])
+
+    def testShellCPU(self):
+        """A shell command that uses too much CPU time must be stopped."""
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err, outfp=StringIO(),
+                     usePtys=False, limits=Limits(cpu=1))
+        p.run('while :; do :; done')
+        self.assertEqual(LIMIT_STATUS, p.status)
+        self.assertEqual('CPU time limit exceeded.\n', err.getvalue())
+
+    def testStreamedTime(self):
+        """
+        A streamed shell command that runs for too long must be stopped,
+        keeping its output.
+        """
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err, outfp=StringIO(),
+                     usePtys=False, limits=Limits(time=0.5))
+        start = time()
+        p.run('echo a; echo b; sleep 10', 1, 2)
+        p.run('sort -r', 2, 2)
+        self.assertLess(time() - start, 5)
+        self.assertEqual('Time limit exceeded.\n', err.getvalue())
+        self.assertEqual(['b', 'a'], p.stdin)
+
+    def testStreamedOutput(self):
+        """A streamed shell command that prints too much must be stopped."""
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err, outfp=StringIO(),
+                     usePtys=False, limits=Limits(out=6))
+        p.run('seq 1000000', 1, 2)
+        p.run('wc -l', 2, 2)
+        self.assertEqual('Output limit exceeded.\n', err.getvalue())
+        self.assertEqual(['3'], [line.strip() for line in p.stdin])
+
+    def testLineTime(self):
+        """
+        The time used by earlier stages must count against a command line
+        limit.
+        """
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err, outfp=StringIO(),
+                     usePtys=False, lineLimits=Limits(time=1.0))
+        start = time()
+        p.run('import time; time.sleep(0.7)', 1, 2)
+        p.run('sleep 10', 2, 2)
+        self.assertLess(time() - start, 5)
+        self.assertEqual(LIMIT_STATUS, p.status)
+
+    def testNoLimits(self):
+        """Commands within their limits must run as usual."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False,
+                     limits=Limits(time=10, cpu=10, out=1000))
+        p.run('echo hello')
+        self.assertEqual(0, p.status)
+        self.assertEqual(['hello'], p.stdin)
+
+
+class TestLimitSpecial(TestCase):
+    """Test the %limit special command."""
+
+    def testSetLimits(self):
+        """%limit with only limits must change the pipeline limits."""
+        p = Pipeline(loadInitFile=False)
+        batch = Batch(p)
+        batch.runCommandLine('%limit time=10 mem=1G')
+        batch.runCommandLine('%limit line cpu=1m')
+        self.assertEqual(Limits(time=10.0, mem=1 << 30), p.limits)
+        self.assertEqual(Limits(cpu=60.0), p.lineLimits)
+
+    def testShowLimits(self):
+        """%limit on its own must show the limits."""
+        p = Pipeline(loadInitFile=False, limits=Limits(time=10))
+        with redirect_stdout(StringIO()) as out:
+            Batch(p).runCommandLine('%limit')
+        self.assertEqual(
+            'stage: time=10s cpu=none mem=none out=none\n'
+            'line: time=none cpu=none mem=none out=none\n', out.getvalue())
+
+    def testCommandLine(self):
+        """
+        %limit with a command line must only apply the limits to it, and
+        must not split the command line before the limits are removed.
+        """
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, errfp=err, outfp=StringIO(),
+                     usePtys=False)
+        batch = Batch(p)
+        with redirect_stdout(StringIO()):
+            batch.runCommandLine('%limit time=0.3 echo a; sleep 10 | wc -l')
+        self.assertEqual('Time limit exceeded.\n', err.getvalue())
+        self.assertEqual(['1'], [line.strip() for line in p.stdin])
+        self.assertEqual(Limits(), p.limits)
+
+    def testInvalid(self):
+        """An invalid limit must be reported."""
+        p = Pipeline(loadInitFile=False)
+        sys.stderr, stderr = StringIO(), sys.stderr
+        try:
+            Batch(p).runCommandLine('%limit time=soon')
+            err = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual("Invalid time limit 'soon'.\n", err)
+        self.assertEqual(Limits(), p.limits)
@@ -0,0 +1,96 @@
+import sys
+from unittest import TestCase
+from io import StringIO
+
+from daudinlib.lines import LineBuffer
+from daudinlib.pipeline import Pipeline
+from daudinlib.serialize import serialize
+
+
+class TestLineBuffer(TestCase):
+    """Test the LineBuffer class."""
+
+    def testEmpty(self):
+        """A buffer with no text must have no lines."""
+        lines = LineBuffer('')
+        self.assertEqual(0, len(lines))
+        self.assertFalse(lines)
+        self.assertEqual([], lines)
+
+    def testLines(self):
+        """The lines of the text must be found."""
+        lines = LineBuffer('a\nbb\n\nc\n')
+        self.assertEqual(['a', 'bb', '', 'c'], list(lines))
+        self.assertEqual(4, len(lines))
+
+    def testNoFinalNewline(self):
+        """A final line with no newline must be found."""
+        lines = LineBuffer('a\nb')
+        self.assertEqual(['a', 'b'], lines)
+        self.assertEqual('a\nb\n', lines.text)
+
+    def testIndex(self):
+        """Lines must be indexable, including with negative indices."""
+        lines = LineBuffer('a\nb\nc\n')
+        self.assertEqual('a', lines[0])
+        self.assertEqual('c', lines[-1])
+        self.assertRaises(IndexError, lines.__getitem__, 3)
+        self.assertRaises(IndexError, lines.__getitem__, -4)
+
+    def testSlice(self):
+        """Slicing must give a list of lines."""
+        lines = LineBuffer('a\nb\nc\n')
+        self.assertEqual(['b', 'c'], lines[1:])
+        self.assertEqual(['c', 'a'], lines[::-2])
+
+    def testListMethods(self):
+        """The non-changing list methods must work."""
+        lines = LineBuffer('a\nb\na\n')
+        self.assertIn('b', lines)
+        self.assertEqual(2, lines.count('a'))
+        self.assertEqual(1, lines.index('b'))
+        self.assertEqual(['a', 'b', 'a', 'x'], lines + ['x'])
+        self.assertEqual(['x', 'a', 'b', 'a'], ['x'] + lines)
+
+    def testChange(self):
+        """A buffer must be changeable like a list."""
+        lines = LineBuffer('b\na\n')
+        lines.append('c')
+        lines.sort(reverse=True)
+        lines[0] = 'd'
+        del lines[1]
+        self.assertEqual(['d', 'a'], lines)
+        self.assertEqual('d\na\n', lines.text)
+
+    def testRepr(self):
+        """The repr of a buffer must be that of a list of its lines."""
+        self.assertEqual("['a', 'b']", repr(LineBuffer('a\nb\n')))
+
+    def testSmall(self):
+        """A buffer must use much less memory than a list of its lines."""
+        text = ''.join('%d\n' % i for i in range(10000))
+        strings = text.split('\n')
+        listSize = sys.getsizeof(strings) + sum(map(sys.getsizeof, strings))
+        self.assertLess(sys.getsizeof(LineBuffer(text)) * 3, listSize)
+
+    def testSerialize(self):
+        """A buffer must be given to a process as its text."""
+        self.assertEqual(b'a\nb\n', b''.join(serialize(LineBuffer('a\nb'))))
+        self.assertEqual(b'\n', b''.join(serialize(LineBuffer(''))))
+
+
+class TestPipelineLineBuffer(TestCase):
+    """Test that shell output is kept in a LineBuffer."""
+
+    def testShellOutput(self):
+        """The output of a shell command must be a LineBuffer."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        p.run('printf "a\\nb\\n"')
+        self.assertIsInstance(p.stdin, LineBuffer)
+        self.assertEqual(['a', 'b'], p.stdin)
+
+    def testNoOutput(self):
+        """A shell command with no output must give no lines."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        p.run('true')
+        self.assertEqual([], p.stdin)
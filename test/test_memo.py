@@ -0,0 +1,217 @@
+import os
+from unittest import TestCase
+from io import StringIO
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from daudinlib.interaction import Batch
+from daudinlib.lines import LineBuffer
+from daudinlib.memo import StageCache
+from daudinlib.pipeline import Pipeline
+
+
+class TestStageCache(TestCase):
+    """Test the StageCache class."""
+
+    def testEmpty(self):
+        """An empty cache must find nothing."""
+        self.assertEqual((0, None),
+                         StageCache().find('/', ('a', 'b'), None))
+
+    def testLongestPrefix(self):
+        """The longest kept start of a command line must be found."""
+        cache = StageCache()
+        cache.add('/', ('a',), 1)
+        cache.add('/', ('a', 'b'), 2)
+        self.assertEqual((2, 2), cache.find('/', ('a', 'b', 'c'), None))
+        self.assertEqual((1, 1), cache.find('/', ('a', 'x', 'c'), None))
+
+    def testNotWholeLine(self):
+        """The value of a whole command line must not be found."""
+        cache = StageCache()
+        cache.add('/', ('a', 'b'), 2)
+        self.assertEqual((0, None), cache.find('/', ('a', 'b'), None))
+
+    def testDirectory(self):
+        """Values must only be found for the same directory."""
+        cache = StageCache()
+        cache.add('/', ('a',), 1)
+        self.assertEqual((0, None), cache.find('/tmp', ('a', 'b'), None))
+
+    def testStart(self):
+        """
+        A value that depends on the start value must only be found for the
+        same start value.
+        """
+        cache = StageCache()
+        start = ['x']
+        cache.add('/', ('_',), 1, start)
+        self.assertEqual((0, None), cache.find('/', ('_', 'b'), ['x']))
+        self.assertEqual((1, 1), cache.find('/', ('_', 'b'), start))
+
+    def testMaxEntries(self):
+        """Only the most recently used values must be kept."""
+        cache = StageCache(maxEntries=2)
+        cache.add('/', ('a',), 1)
+        cache.add('/', ('b',), 2)
+        cache.find('/', ('a', 'x'), None)
+        cache.add('/', ('c',), 3)
+        self.assertEqual(2, len(cache))
+        self.assertEqual((1, 1), cache.find('/', ('a', 'x'), None))
+        self.assertEqual((0, None), cache.find('/', ('b', 'x'), None))
+
+    def testBudget(self):
+        """Values that do not fit in the budget must not be kept."""
+        cache = StageCache(budget=1000)
+        cache.add('/', ('a',), 'x' * 2000)
+        self.assertEqual(0, len(cache))
+
+    def testClear(self):
+        """Clearing must forget all values."""
+        cache = StageCache()
+        cache.add('/', ('a',), 1)
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+class TestPipelineStageCache(TestCase):
+    """Test reusing the values of the first stages of command lines."""
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.count = join(self.tmpdir.name, 'count')
+        self.pipeline = Pipeline(loadInitFile=False, outfp=StringIO(),
+                                 usePtys=False)
+        self.batch = Batch(self.pipeline)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def slow(self):
+        """
+        Get a shell command that outputs some lines, and counts the number
+        of times it is run.
+        """
+        return 'echo x >> %s; printf "a\\nb\\nc\\n"' % self.count
+
+    def runs(self):
+        with open(self.count) as fp:
+            return len(fp.readlines())
+
+    def testReuse(self):
+        """The start of an edited command line must not be run again."""
+        self.batch.runCommandLine(self.slow() + ' | grep a')
+        self.batch.runCommandLine(self.slow() + ' | grep b')
+        self.assertEqual(['b'], self.pipeline.stdin)
+        self.assertEqual(1, self.runs())
+
+    def testRecorded(self):
+        """
+        The output of a shell command given directly to another must be
+        kept.
+        """
+        self.batch.runCommandLine(self.slow() + ' | sort -r')
+        self.batch.runCommandLine(self.slow() + ' | wc -l')
+        self.assertEqual(1, self.runs())
+        self.assertEqual(['3'], [line.strip()
+                                 for line in self.pipeline.stdin])
+
+    def testPythonStage(self):
+        """The value of a Python stage must be reused."""
+        self.batch.runCommandLine(self.slow() + ' | [x * 2 for x in _] | '
+                                  'len(_)')
+        self.batch.runCommandLine(self.slow() + ' | [x * 2 for x in _] | '
+                                  '_[0]')
+        self.assertEqual('aa', self.pipeline.stdin)
+        self.assertEqual(1, self.runs())
+
+    def testSameLine(self):
+        """Running the previous command line again must run all of it."""
+        self.batch.runCommandLine(self.slow() + ' | grep a')
+        self.batch.runCommandLine(self.slow() + ' | grep a')
+        self.assertEqual(2, self.runs())
+
+    def testPartlyRead(self):
+        """A stage whose output was not all read must not be kept."""
+        self.batch.runCommandLine(self.slow() + ' | head -n 1')
+        self.batch.runCommandLine(self.slow() + ' | grep c')
+        self.assertEqual(['c'], self.pipeline.stdin)
+        self.assertEqual(2, self.runs())
+
+    def testUsesValue(self):
+        """A stage that uses _ must not be reused once _ has changed."""
+        self.batch.runCommandLine('[1, 2, 3]')
+        self.batch.runCommandLine('_[1:] | sum(_)')
+        self.batch.runCommandLine('_[1:] | len(_)')
+        self.assertEqual(0, self.pipeline.stdin)
+
+    def testKept(self):
+        """Kept lines of text must be kept compactly."""
+        self.batch.runCommandLine(self.slow() + ' | grep a')
+        ((_, _, value, _),) = [
+            (key, entry[0], entry[1], entry[2])
+            for key, entry in self.pipeline.stageCache._entries.items()]
+        self.assertIsInstance(value, LineBuffer)
+        self.assertEqual(['a', 'b', 'c'], value)
+
+    def testFresh(self):
+        """%fresh must forget kept values."""
+        self.batch.runCommandLine(self.slow() + ' | grep a')
+        self.batch.runCommandLine('%fresh')
+        self.batch.runCommandLine(self.slow() + ' | grep b')
+        self.assertEqual(2, self.runs())
+
+    def testFreshCommandLine(self):
+        """%fresh must run a command line given after it."""
+        self.batch.runCommandLine(self.slow() + ' | grep a')
+        self.batch.runCommandLine('%fresh ' + self.slow() + ' | grep b')
+        self.assertEqual(['b'], self.pipeline.stdin)
+        self.assertEqual(2, self.runs())
+
+    def testCd(self):
+        """Changing directory must forget kept values."""
+        self.batch.runCommandLine(self.slow() + ' | grep a')
+        self.addCleanup(os.chdir, os.getcwd())
+        self.pipeline.cd(self.tmpdir.name)
+        self.assertEqual(0, len(self.pipeline.stageCache))
+
+    def testDisabled(self):
+        """With no stage cache, all stages must always be run."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False,
+                     stageCache=False)
+        batch = Batch(p)
+        batch.runCommandLine(self.slow() + ' | grep a')
+        batch.runCommandLine(self.slow() + ' | grep b')
+        self.assertEqual(2, self.runs())
+
+    def testUsesVariable(self):
+        """
+        A Python stage that uses a variable must not be reused, as the
+        variable may have changed.
+        """
+        self.batch.runCommandLine('n = 3')
+        self.batch.runCommandLine('[i for i in range(n)] | sum(_)')
+        self.batch.runCommandLine('n = 5')
+        self.batch.runCommandLine('[i for i in range(n)] | len(_)')
+        self.assertEqual(5, self.pipeline.stdin)
+
+    def testBuiltins(self):
+        """A Python stage that uses only builtins must be reused."""
+        self.batch.runCommandLine(self.slow() + ' | [len(x) for x in _] | '
+                                  'sum(_)')
+        self.batch.runCommandLine(self.slow() + ' | [len(x) for x in _] | '
+                                  'max(_)')
+        self.assertEqual(1, self.pipeline.stdin)
+        self.assertEqual(1, self.runs())
+
+    def testChangedValue(self):
+        """
+        A kept value must not be changed by later stages of the command
+        line it came from, or of the command line that reuses it.
+        """
+        self.batch.runCommandLine('[3, 1, 2] | _.append(9)')
+        self.batch.runCommandLine('[3, 1, 2] | len(_)')
+        self.assertEqual(3, self.pipeline.stdin)
+        self.batch.runCommandLine('[3, 1, 2] | _.append(8)')
+        self.batch.runCommandLine('[3, 1, 2] | len(_)')
+        self.assertEqual(3, self.pipeline.stdin)
@@ -0,0 +1,269 @@
+import os
+from unittest import TestCase
+from unittest.mock import patch
+from io import StringIO
+from time import time
+
+from daudinlib.interaction import Batch
+from daudinlib.native import parseCommand, run, exitStatus
+from daudinlib.pipeline import Pipeline
+from daudinlib.stream import LineStream
+
+
+class TestParseCommand(TestCase):
+    """Test the parseCommand function."""
+
+    def testSimple(self):
+        """A simple command must be split into its arguments."""
+        self.assertEqual(['head', '-n', '3'], parseCommand('head -n 3'))
+
+    def testQuoted(self):
+        """Quoted arguments must be unquoted."""
+        self.assertEqual(['grep', 'a*b c'], parseCommand("grep 'a*b c'"))
+
+    def testRedirection(self):
+        """A command with a redirection must not be parsed."""
+        self.assertIs(None, parseCommand('sort > /tmp/x'))
+
+    def testGlob(self):
+        """A command with an unquoted glob character must not be parsed."""
+        self.assertIs(None, parseCommand('grep x *.py'))
+
+    def testVariable(self):
+        """A command with a variable in double quotes must not be parsed."""
+        self.assertIs(None, parseCommand('echo "$HOME"'))
+
+    def testBackslash(self):
+        """
+        A command with a backslash (e.g., to force use of the shell) must not
+        be parsed.
+        """
+        self.assertIs(None, parseCommand('\\grep x'))
+
+    def testUnterminatedQuote(self):
+        """A command with an unterminated quote must not be parsed."""
+        self.assertIs(None, parseCommand("grep 'x"))
+
+
+class TestRun(TestCase):
+    """Test the run function."""
+
+    def testUnknownCommand(self):
+        """An unknown command must not be run."""
+        self.assertIs(None, run(['ls'], None))
+
+    def testGrep(self):
+        """grep must select matching lines."""
+        self.assertEqual(['cat', 'scat'],
+                         run(['grep', 'cat'], ['cat', 'dog', 'scat']))
+
+    def testGrepRegex(self):
+        """grep must match regular expressions."""
+        self.assertEqual(['cat'], run(['grep', '^c.t$'], ['cat', 'scat']))
+
+    def testGrepOptions(self):
+        """grep must handle -v, -i and -c."""
+        self.assertEqual(['dog'], run(['grep', '-v', 'cat'], ['cat', 'dog']))
+        self.assertEqual(['CAT'], run(['grep', '-i', 'cat'], ['CAT', 'dog']))
+        self.assertEqual(['2'], run(['grep', '-c', 'a'], ['a', 'b', 'ab']))
+
+    def testGrepFixed(self):
+        """grep -F must match literal strings."""
+        self.assertEqual(['a.b'], run(['grep', '-F', 'a.b'], ['a.b', 'axb']))
+
+    def testGrepBasicRegexSpecial(self):
+        """
+        A basic regular expression whose meaning differs in Python must not
+        be handled.
+        """
+        self.assertIs(None, run(['grep', 'a+'], ['a+']))
+
+    def testGrepBasicRegexLiteralAnchors(self):
+        """
+        A basic regular expression with a '^', '$', or '*' that grep takes
+        literally must not be handled.
+        """
+        self.assertIs(None, run(['grep', 'a$b'], ['a$b']))
+        self.assertIs(None, run(['grep', 'a^b'], ['a^b']))
+        self.assertIs(None, run(['grep', '*a'], ['*a']))
+        self.assertIs(None, run(['grep', '^*a'], ['*a']))
+        self.assertEqual(['ab'], run(['grep', '^ab$'], ['ab', 'abc']))
+
+    def testGrepExitStatus(self):
+        """The exit status of grep must be 1 if nothing matches."""
+        self.assertEqual(1, exitStatus(['grep', 'x'], []))
+        self.assertEqual(0, exitStatus(['grep', 'x'], ['x']))
+        self.assertEqual(1, exitStatus(['grep', '-c', 'x'], ['0']))
+        self.assertEqual(0, exitStatus(['grep', '-c', 'x'], ['2']))
+        self.assertEqual(0, exitStatus(['head'], []))
+
+    def testGrepFile(self):
+        """grep with a file argument must not be handled."""
+        self.assertIs(None, run(['grep', 'x', 'file'], []))
+
+    def testHead(self):
+        """head must return the wanted number of lines."""
+        lines = list(map(str, range(20)))
+        self.assertEqual(lines[:10], run(['head'], lines))
+        self.assertEqual(lines[:3], run(['head', '-3'], lines))
+        self.assertEqual(lines[:2], run(['head', '-n', '2'], lines))
+        self.assertEqual(lines[:4], run(['head', '-n4'], lines))
+
+    def testHeadNegative(self):
+        """head with a negative count must not be handled."""
+        self.assertIs(None, run(['head', '-n', '-3'], []))
+
+    def testTail(self):
+        """tail must return the wanted number of lines."""
+        lines = list(map(str, range(20)))
+        self.assertEqual(lines[-10:], run(['tail'], lines))
+        self.assertEqual(lines[-3:], run(['tail', '-3'], lines))
+        self.assertEqual([], run(['tail', '-0'], lines))
+
+    def testTailFrom(self):
+        """tail -n +N must not be handled."""
+        self.assertIs(None, run(['tail', '-n', '+3'], []))
+
+    def testWc(self):
+        """wc must count lines, words and bytes."""
+        lines = ['a b', 'cé']
+        self.assertEqual(['2'], run(['wc', '-l'], lines))
+        self.assertEqual(['3'], run(['wc', '-w'], lines))
+        self.assertEqual(['8'], run(['wc', '-c'], lines))
+        self.assertIs(None, run(['wc'], lines))
+
+    def testSort(self):
+        """sort must sort lines."""
+        with patch.dict(os.environ, {'LC_ALL': 'C'}):
+            self.assertEqual(['B', 'a', 'b'], run(['sort'], ['b', 'a', 'B']))
+            self.assertEqual(['b', 'a'], run(['sort', '-r'], ['a', 'b']))
+            self.assertEqual(['a', 'b'], run(['sort', '-u'], ['b', 'a', 'b']))
+
+    def testSortNumeric(self):
+        """sort -n must sort lines numerically."""
+        with patch.dict(os.environ, {'LC_ALL': 'C'}):
+            self.assertEqual(['x', '2 a', '10 b'],
+                             run(['sort', '-n'], ['10 b', '2 a', 'x']))
+            self.assertEqual(['10 b', '2 a', 'x'],
+                             run(['sort', '-nr'], ['10 b', '2 a', 'x']))
+
+    def testSortLocale(self):
+        """sort must not be handled if the locale collation differs."""
+        with patch.dict(os.environ, {'LC_ALL': 'en_US.UTF-8'}):
+            self.assertIs(None, run(['sort'], ['a']))
+
+    def testUniq(self):
+        """uniq must remove adjacent duplicates."""
+        self.assertEqual(['a', 'b', 'a'],
+                         run(['uniq'], ['a', 'a', 'b', 'a']))
+        self.assertEqual(['      2 a', '      1 b'],
+                         run(['uniq', '-c'], ['a', 'a', 'b']))
+
+    def testCut(self):
+        """cut must select fields."""
+        lines = ['a:b:c:d', 'no delimiter']
+        self.assertEqual(['b', 'no delimiter'],
+                         run(['cut', '-d:', '-f2'], lines))
+        self.assertEqual(['a:c:d', 'no delimiter'],
+                         run(['cut', '-d', ':', '-f', '1,3-'], lines))
+        self.assertEqual(['x'], run(['cut', '-f1'], ['x\ty']))
+
+    def testStreamed(self):
+        """
+        Filters given a stream must read it lazily, and close it when they
+        are closed.
+        """
+        closed = []
+
+        def lines():
+            yield from ['a1', 'b', 'a2']
+            raise RuntimeError('Read too far.')
+
+        for argv in (['grep', 'a'], ['cut', '-f1'], ['uniq']):
+            stream = LineStream(lines(), close=lambda: closed.append(1))
+            result = run(argv, stream)
+            self.assertIsInstance(result, LineStream)
+            self.assertEqual('a1', next(iter(result)))
+            result.close()
+        self.assertEqual([1, 1, 1], closed)
+
+    def testEcho(self):
+        """echo must return its arguments."""
+        self.assertEqual(['a b'], run(['echo', 'a', 'b'], None))
+        self.assertIs(None, run(['echo', '-n', 'a'], None))
+        self.assertIs(None, run(['echo', 'a\\tb'], None))
+
+    def testPwd(self):
+        """pwd must return the current directory."""
+        self.assertEqual([os.getcwd()], run(['pwd'], None))
+
+    def testTrue(self):
+        """true must return no lines."""
+        self.assertEqual([], run(['true'], None))
+
+
+class TestPipelineNative(TestCase):
+    """Test native commands in a pipeline."""
+
+    def testNativeGrep(self):
+        """grep on a Python list must be run natively."""
+        out = StringIO()
+        p = Pipeline(loadInitFile=False, outfp=out)
+        with patch('daudinlib.pipeline.Pipeline.sh') as sh:
+            p.run("['cat', 'dog']", 1, 2)
+            p.run('grep o', 2, 2)
+            self.assertFalse(sh.called)
+        self.assertEqual(['dog'], p.stdin)
+        self.assertEqual('dog\n', out.getvalue())
+
+    def testNonList(self):
+        """A non-list pipeline value must be converted to lines."""
+        p = Pipeline(loadInitFile=False)
+        p.run('"a\\nb"', 1, 2)
+        p.run('wc -l', 2, 2)
+        self.assertEqual(['2'], p.stdin)
+
+    def testNotInPipeline(self):
+        """
+        A command that reads standard input must not be run natively if it
+        is not in a pipeline.
+        """
+        p = Pipeline(loadInitFile=False, usePtys=False)
+        with patch('daudinlib.pipeline.Pipeline.sh') as sh:
+            sh.return_value = ''
+            p.run('head -3')
+            self.assertTrue(sh.called)
+
+    def testDisabled(self):
+        """Commands must not be run natively if useNative is False."""
+        p = Pipeline(loadInitFile=False, useNative=False)
+        with patch('daudinlib.pipeline.Pipeline.sh') as sh:
+            sh.return_value = 'x\n'
+            p.run('[1]', 1, 2)
+            p.run('head -1', 2, 2)
+            self.assertTrue(sh.called)
+
+    def testGrepStatus(self):
+        """A native grep that matches nothing must set status to 1."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        p.run("['a', 'b']", 1, 2)
+        p.run('grep x', 2, 2)
+        self.assertEqual(1, p.status)
+
+    def testEscape(self):
+        """A leading backslash must force use of the shell."""
+        p = Pipeline(loadInitFile=False, usePtys=False)
+        p.run("['b', 'a']", 1, 2)
+        p.run('\\sort', 2, 2)
+        self.assertEqual(['a', 'b'], p.stdin)
+
+    def testStreamedGrep(self):
+        """
+        A native grep of streamed shell output must stop reading it once
+        enough lines have been taken.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        start = time()
+        Batch(p).runCommandLine('seq 100000000 | grep 7 | head -2')
+        self.assertEqual(['7', '17'], p.stdin)
+        self.assertLess(time() - start, 5)
@@ -0,0 +1,119 @@
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from daudinlib import numeric
+from daudinlib.numeric import (
+    nums, cols, nfilter, nsum, percentile, histogram)
+from daudinlib.pipeline import Pipeline
+
+
+class _NumericMixin:
+    """
+    Tests of the numeric functions, run with and without NumPy.
+    """
+
+    def testNums(self):
+        """Whitespace-separated numbers must be parsed."""
+        self.assertEqual([1.0, 2.5, 3.0, 4.0],
+                         list(nums(['1 2.5', ' 3', '4'])))
+
+    def testNumsInt(self):
+        """Integers must be parsed if dtype is int."""
+        self.assertEqual([1, 2, 3], list(nums('1 2\n3\n', dtype=int)))
+
+    def testNumsSeparator(self):
+        """Numbers separated by a given separator must be parsed."""
+        self.assertEqual([1.0, 2.0, 3.0], list(nums(['1,2,', '3'], sep=',')))
+
+    def testNumsEmpty(self):
+        """Parsing no lines must give an empty array."""
+        self.assertEqual([], list(nums([])))
+
+    def testOneColumn(self):
+        """A single column must be returned as a one-dimensional array."""
+        self.assertEqual([10.0, 20.0],
+                         list(cols(['10 file one', '20 file-two'], 0)))
+
+    def testTwoColumns(self):
+        """Two columns must be returned in order."""
+        result = cols(['1 x 5', '2 y 6'], 2, 0, dtype=int)
+        self.assertEqual([5, 6], list(result[0]))
+        self.assertEqual([1, 2], list(result[1]))
+
+    def testColumnsSeparator(self):
+        """Columns with a given separator must be parsed."""
+        self.assertEqual([3.0, 4.0], list(cols(['a,3', 'b,4'], 1, sep=',')))
+
+    def testFilter(self):
+        """Filtering must keep only the wanted values."""
+        self.assertEqual([3.0, 4.0],
+                         list(nfilter(['1 2 3 4'], lambda a: a > 2)))
+
+    def testSum(self):
+        """Summing must work on text."""
+        self.assertEqual(10.0, nsum(['1 2', '3 4']))
+
+    def testSumNumbers(self):
+        """Summing must work on a list of numbers."""
+        self.assertEqual(6.0, nsum([1, 2, 3]))
+
+    def testPercentile(self):
+        """Percentiles must be interpolated."""
+        self.assertEqual(2.5, percentile(['1 2 3 4'], 50))
+        self.assertEqual([1.0, 4.0], percentile(['1 2 3 4'], [0, 100]))
+
+    def testHistogram(self):
+        """A histogram must count values in equal-width bins."""
+        counts, edges = histogram(['1 2 2 3 4'], bins=3)
+        self.assertEqual([1, 2, 2], list(counts))
+        self.assertEqual(4, len(edges))
+        self.assertEqual(1.0, edges[0])
+        self.assertEqual(4.0, edges[-1])
+
+
+@skipUnless(numeric.np, 'NumPy is not installed')
+class TestNumericWithNumPy(_NumericMixin, TestCase):
+    """Test the numeric functions using NumPy."""
+
+
+class TestNumericWithoutNumPy(_NumericMixin, TestCase):
+    """Test the numeric functions without NumPy."""
+
+    def setUp(self):
+        patcher = patch.object(numeric, 'np', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestPipelineNumeric(TestCase):
+    """Test the numeric functions in a pipeline."""
+
+    def testNumsOnPipelineValue(self):
+        """nums must operate on the pipeline value."""
+        p = Pipeline(loadInitFile=False, usePtys=False)
+        p.run('seq 4', 1, 3)
+        p.run('nums()', 2, 3)
+        p.run('nsum()', 3, 3)
+        self.assertEqual(10.0, p.stdin)
+
+    def testNumsToShell(self):
+        """An array from nums must be given to the shell one per line."""
+        p = Pipeline(loadInitFile=False, usePtys=False, useNative=False)
+        p.run('seq 5', 1, 3)
+        p.run('nums(dtype=int)', 2, 3)
+        p.run('sort -rn', 3, 3)
+        self.assertEqual(['5', '4', '3', '2', '1'], p.stdin)
+
+    def testNumsToNative(self):
+        """An array from nums must be given to a native command per line."""
+        p = Pipeline(loadInitFile=False, usePtys=False)
+        p.run('seq 3', 1, 3)
+        p.run('nums()', 2, 3)
+        p.run('head -2', 3, 3)
+        self.assertEqual(['1.0', '2.0'], p.stdin)
+
+    def testExplicitData(self):
+        """A data keyword argument must be used instead of _."""
+        p = Pipeline(loadInitFile=False)
+        p.run('nsum(data=[3, 4])')
+        self.assertEqual(7.0, p.stdin)
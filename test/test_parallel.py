@@ -0,0 +1,115 @@
+import os
+import sys
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os.path import dirname, join
+from subprocess import PIPE, DEVNULL, run
+from time import time
+
+from daudinlib.parallel import outputNames
+
+TOP = dirname(dirname(os.path.abspath(__file__)))
+
+
+class TestOutputNames(TestCase):
+    """Test the outputNames function."""
+
+    def testNames(self):
+        """The names must be the file names of the scripts."""
+        self.assertEqual(['a', 'b.daudin'],
+                         outputNames(['x/a', '/tmp/y/b.daudin']))
+
+    def testDuplicates(self):
+        """Scripts with the same file name must be given different names."""
+        self.assertEqual(['a', 'a-2', 'a-3'],
+                         outputNames(['x/a', 'y/a', 'a']))
+
+
+class TestParallel(TestCase):
+    """Test running scripts in parallel with daudin --jobs."""
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.env = dict(os.environ, PYTHONPATH=TOP)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def script(self, name, text):
+        path = join(self.tmpdir.name, name)
+        with open(path, 'w') as fp:
+            fp.write(text)
+        return name
+
+    def daudin(self, *args):
+        return run([sys.executable, join(TOP, 'daudin'), '--noInit',
+                    '--noPtys'] + list(args),
+                   stdin=DEVNULL, stdout=PIPE, stderr=PIPE,
+                   universal_newlines=True, env=self.env,
+                   cwd=self.tmpdir.name, timeout=30)
+
+    def testPrefixedOutput(self):
+        """
+        The output of each script must be shown in order, with each line
+        prefixed by the script name.
+        """
+        one = self.script('one', 'import time\ntime.sleep(0.5)\n1\n2\n')
+        two = self.script('two', '3\necho four\n')
+        result = self.daudin('-j', '2', one, two)
+        self.assertEqual('one: 1\none: 2\ntwo: 3\ntwo: four\n',
+                         result.stdout)
+        self.assertEqual('', result.stderr)
+        self.assertEqual(0, result.returncode)
+
+    def testSeparateNamespaces(self):
+        """Each script must have its own Python namespace."""
+        one = self.script('one', 'x = 1\n')
+        two = self.script('two', "'x' in dir()\n")
+        result = self.daudin('-j', '2', one, two)
+        self.assertEqual('two: False\n', result.stdout)
+
+    def testConcurrent(self):
+        """Scripts must be run at the same time."""
+        scripts = [self.script(str(i), 'sleep 1\n') for i in range(3)]
+        start = time()
+        result = self.daudin('-j', '3', *scripts)
+        self.assertEqual(0, result.returncode)
+        self.assertLess(time() - start, 2.5)
+
+    def testExitStatus(self):
+        """
+        The exit status must be the highest of the scripts, and failing
+        scripts must be reported.
+        """
+        one = self.script('one', 'raise SystemExit(3)\n')
+        two = self.script('two', 'sh -c "exit 2"\n')
+        three = self.script('three', '4\n')
+        result = self.daudin('-j', '2', one, two, three)
+        self.assertEqual('three: 4\n', result.stdout)
+        self.assertEqual('one: exit status 3.\ntwo: exit status 2.\n',
+                         result.stderr)
+        self.assertEqual(3, result.returncode)
+
+    def testOutputDir(self):
+        """
+        With --outputDir, the output of each script must be written to
+        files named for the script.
+        """
+        one = self.script('one', '1\nls /nonexistent-daudin-file\n')
+        two = self.script('two', '2\n')
+        result = self.daudin('-j', '2', '--outputDir', 'out', one, two)
+        self.assertEqual('', result.stdout)
+        out = join(self.tmpdir.name, 'out')
+        with open(join(out, 'one.out')) as fp:
+            self.assertEqual('1\n', fp.read())
+        with open(join(out, 'one.err')) as fp:
+            self.assertIn('nonexistent-daudin-file', fp.read())
+        with open(join(out, 'two.out')) as fp:
+            self.assertEqual('2\n', fp.read())
+
+    def testStandardInput(self):
+        """'-' must not be allowed as a script with --jobs."""
+        result = self.daudin('-j', '2', '-')
+        self.assertEqual(2, result.returncode)
+        self.assertIn('"-" cannot be used as a FILE with --jobs.',
+                      result.stderr)
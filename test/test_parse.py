@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from daudinlib.parse import lineSplitter
+from daudinlib.parse import lineSplitter, CommandBlock
 
 
 class TestLineSplitter(TestCase):
@@ -25,3 +25,127 @@ class TestLineSplitter(TestCase):
         """An escaped | should result in one field, with the escape remvoed."""
         self.assertEqual([r'echo hi | wc -c'],
                          list(lineSplitter(r'echo hi \| wc -c')))
+
+    def testLeadingAndTrailingPipes(self):
+        """Leading and trailing pipes must give empty commands."""
+        self.assertEqual(['', ' x ', ''], list(lineSplitter('| x |')))
+
+    def testSingleQuoted(self):
+        """A | in a single-quoted string must not split the line."""
+        self.assertEqual(["grep 'a|b' ", ' wc -l'],
+                         list(lineSplitter("grep 'a|b' | wc -l")))
+
+    def testDoubleQuoted(self):
+        """A | in a double-quoted string must not split the line."""
+        self.assertEqual(['"a|b".split("|")'],
+                         list(lineSplitter('"a|b".split("|")')))
+
+    def testEscapedQuote(self):
+        """An escaped quote must not end a quoted string."""
+        self.assertEqual(['"a\\"|b" ', ' x'],
+                         list(lineSplitter('"a\\"|b" | x')))
+
+    def testBackquoted(self):
+        """A | in a backquoted command must not split the line."""
+        self.assertEqual(['echo `ls | wc -l`'],
+                         list(lineSplitter('echo `ls | wc -l`')))
+
+    def testBrackets(self):
+        """A | inside brackets must not split the line."""
+        self.assertEqual(['(x | y) ', ' {1} ', ' [a | b]'],
+                         list(lineSplitter('(x | y) | {1} | [a | b]')))
+        self.assertEqual(['f(a | b, [c | d]) ', ' cat'],
+                         list(lineSplitter('f(a | b, [c | d]) | cat')))
+
+    def testShellSubstitution(self):
+        """A | inside $(...) must not split the line."""
+        self.assertEqual(['echo $(ls | wc -l) ', ' cat'],
+                         list(lineSplitter('echo $(ls | wc -l) | cat')))
+
+    def testOr(self):
+        """A shell || must not split the line."""
+        self.assertEqual(['true || false ', ' cat'],
+                         list(lineSplitter('true || false | cat')))
+
+    def testOrAssignment(self):
+        """A Python |= must not split the line."""
+        self.assertEqual(['x |= 4'], list(lineSplitter('x |= 4')))
+
+    def testComment(self):
+        """A | in a comment must not split the line."""
+        self.assertEqual(['x = 3  # a | b'],
+                         list(lineSplitter('x = 3  # a | b')))
+
+    def testHashInWord(self):
+        """A # inside a word does not start a comment."""
+        self.assertEqual(['echo a#b ', ' cat'],
+                         list(lineSplitter('echo a#b | cat')))
+
+    def testEscapedInQuotes(self):
+        """An escaped | in a quoted string must have the escape removed."""
+        self.assertEqual(["sh('date | cut -f2')"],
+                         list(lineSplitter(r"sh('date \| cut -f2')")))
+
+
+class TestCommandBlock(TestCase):
+    """Test the CommandBlock class."""
+
+    def testOpenBracket(self):
+        """A block with an open bracket must not be ready."""
+        block = CommandBlock()
+        self.assertFalse(block.add('x = [1,'))
+        self.assertTrue(block.open)
+        self.assertFalse(block.add('     2,'))
+        self.assertTrue(block.add('     3]'))
+        self.assertEqual('x = [1,\n     2,\n     3]', block.text)
+
+    def testBracketInString(self):
+        """A bracket in a string must be ignored."""
+        block = CommandBlock()
+        self.assertFalse(block.add('x = ("(",'))
+        self.assertTrue(block.add('     "]")'))
+
+    def testBracketInComment(self):
+        """A bracket in a comment must be ignored."""
+        block = CommandBlock()
+        self.assertTrue(block.add('x = 1  # (not open'))
+
+    def testTripleQuotedString(self):
+        """A block in a triple-quoted string must not be ready."""
+        block = CommandBlock()
+        self.assertFalse(block.add('x = """hello ('))
+        self.assertFalse(block.add(''))
+        self.assertTrue(block.add('there"""'))
+
+    def testBackslashContinuation(self):
+        """A block ending in a backslash must not be ready."""
+        block = CommandBlock()
+        self.assertFalse(block.add('x = 1 + \\'))
+        self.assertTrue(block.add('    2'))
+
+    def testUnbalancedBracket(self):
+        """A block with an unbalanced closing bracket must be ready."""
+        block = CommandBlock()
+        self.assertFalse(block.add('x = (1,'))
+        self.assertTrue(block.add('     2]'))
+
+    def testCompound(self):
+        """
+        A compound statement must only be ready after a blank or unindented
+        line.
+        """
+        block = CommandBlock()
+        block.add('def f(x):')
+        block.incomplete()
+        self.assertFalse(block.add('    y = ['))
+        self.assertFalse(block.add('    1]'))
+        self.assertFalse(block.add('    return x'))
+        self.assertTrue(block.add(''))
+
+    def testCompoundUnindented(self):
+        """An unindented line in a compound statement must be ready."""
+        block = CommandBlock()
+        block.add('if x:')
+        block.incomplete()
+        self.assertFalse(block.add('    pass'))
+        self.assertTrue(block.add('else:'))
@@ -1,6 +1,12 @@
 from unittest import TestCase
+from io import StringIO
+from time import time
+from threading import Barrier, Thread
+from code import compile_command
+from unittest.mock import patch
 
 from daudinlib.pipeline import Pipeline
+from daudinlib.stream import LineStream
 
 
 class TestPipeline(TestCase):
@@ -114,3 +120,334 @@ class TestREADME(TestCase):
         # self.assertFalse(p.inPipeline)
 
         self.assertAlmostEqual(12.566370614359172, p.stdin)
+
+
+class TestIncomplete(TestCase):
+    """Test multi-line (incomplete) Python commands."""
+
+    def testLongFunctionCompiledOnce(self):
+        """
+        The lines of a long function must not be compiled as each is
+        entered.
+        """
+        calls = []
+
+        def compile_(command):
+            calls.append(command)
+            return compile_command(command)
+
+        p = Pipeline(loadInitFile=False)
+        with patch('daudinlib.pipeline.compile_command', compile_):
+            p.run('def f():')
+            p.run('    x = 0')
+            for _ in range(500):
+                p.run('    x += 1')
+            p.run('    return x')
+            self.assertTrue(p.incomplete)
+            p.run('')
+        self.assertFalse(p.incomplete)
+        self.assertEqual(2, len(calls))
+        p.run('f()')
+        self.assertEqual(500, p.stdin)
+
+    def testBrackets(self):
+        """A command continued in brackets must be run when they close."""
+        p = Pipeline(loadInitFile=False)
+        p.run('x = [1,')
+        self.assertTrue(p.incomplete)
+        p.run('     2]')
+        self.assertFalse(p.incomplete)
+        p.run('x')
+        self.assertEqual([1, 2], p.stdin)
+
+    def testBlankLineInString(self):
+        """A blank line in a triple-quoted string must not end a command."""
+        p = Pipeline(loadInitFile=False)
+        p.run('x = """a')
+        p.run('')
+        self.assertTrue(p.incomplete)
+        p.run('b"""')
+        self.assertFalse(p.incomplete)
+        p.run('x')
+        self.assertEqual('a\n\nb', p.stdin)
+
+    def testIfElse(self):
+        """An 'else' must continue an 'if' statement."""
+        p = Pipeline(loadInitFile=False)
+        p.run('if False:')
+        p.run('    x = 1')
+        p.run('else:')
+        self.assertTrue(p.incomplete)
+        p.run('    x = 2')
+        p.run('')
+        self.assertFalse(p.incomplete)
+        p.run('x')
+        self.assertEqual(2, p.stdin)
+
+    def testDecorator(self):
+        """A decorated function must be defined."""
+        p = Pipeline(loadInitFile=False)
+        p.run('@staticmethod')
+        p.run('def f():')
+        p.run('    return 3')
+        p.run('')
+        self.assertFalse(p.incomplete)
+        p.run('f.__func__()')
+        self.assertEqual(3, p.stdin)
+
+
+class TestOutputCapture(TestCase):
+    """Test the capture of output printed by Python commands."""
+
+    def testPrintedLinesBecomeList(self):
+        """
+        Several lines printed by an intermediate exec'd command must become a
+        list.
+        """
+        p = Pipeline(loadInitFile=False)
+        p.run('print(0); print(1); print(2)', 1, 2)
+        self.assertEqual(['0', '1', '2'], p.stdin)
+
+    def testFinalCommandOutputIsPrintedOnce(self):
+        """
+        Output printed by the last exec'd command on a line must be printed
+        (once) as it is produced and then not printed again.
+        """
+        out = StringIO()
+        p = Pipeline(loadInitFile=False, outfp=out)
+        _, doPrint = p.run('print(0); print(1); print(2)')
+        self.assertFalse(doPrint)
+        self.assertEqual('0\n1\n2\n', out.getvalue())
+        self.assertEqual(['0', '1', '2'], p.stdin)
+
+    def testOutputBeforeExceptionIsShown(self):
+        """
+        Output printed by the last command on a line before it raises an
+        exception must already have been shown when the command is given
+        to the shell, but must not be in the pipeline value.
+        """
+        out = StringIO()
+        p = Pipeline(loadInitFile=False, usePtys=False, outfp=out,
+                     errfp=StringIO(), echoErrors=False)
+        p.run('print(1); foo()')
+        self.assertEqual('1\n', out.getvalue())
+        self.assertEqual([], p.stdin)
+        self.assertNotEqual(0, p.status)
+
+    def testThreads(self):
+        """
+        Pipelines running in different threads must not get each other's
+        output.
+        """
+        count = 4
+        barrier = Barrier(count)
+        pipelines = [Pipeline(loadInitFile=False) for _ in range(count)]
+
+        def run(index):
+            barrier.wait()
+            pipelines[index].run(
+                'exec("for _ in range(2000): print(%d)")' % index, 1, 2)
+
+        threads = [Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for index, p in enumerate(pipelines):
+            self.assertEqual([str(index)] * 2000, p.stdin)
+
+
+class TestStandardError(TestCase):
+    """Test the handling of standard error from shell commands."""
+
+    def testStderrNotInResult(self):
+        """
+        Standard error output must be kept out of the command result and be
+        available in _err.
+        """
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, usePtys=False, errfp=err,
+                     outfp=StringIO())
+        p.run('echo out; echo err >&2')
+        self.assertEqual(['out'], p.stdin)
+        self.assertEqual(['err'], p.local['_err'])
+        self.assertEqual('err\n', err.getvalue())
+
+    def testStderrNotEchoed(self):
+        """
+        Standard error output must not be printed if echoErrors is False.
+        """
+        err = StringIO()
+        p = Pipeline(loadInitFile=False, usePtys=False, errfp=err,
+                     echoErrors=False)
+        p.run('echo err >&2')
+        self.assertEqual(['err'], p.local['_err'])
+        self.assertEqual('', err.getvalue())
+
+    def testStderrBounded(self):
+        """
+        Only the configured amount of standard error output must be kept.
+        """
+        p = Pipeline(loadInitFile=False, usePtys=False, echoErrors=False,
+                     errBufferSize=10)
+        p.run('seq 1000 >&2')
+        self.assertEqual(['999', '1000'], p.local['_err'])
+
+    def testStderrFromPty(self):
+        """
+        Standard error output from a command run in a pseudo-tty must be
+        kept out of the command result.
+        """
+        p = Pipeline(loadInitFile=False, echoErrors=False)
+        p.run('echo err >&2')
+        self.assertEqual([], p.stdin)
+        self.assertEqual(['err'], p.local['_err'])
+
+
+class TestStreaming(TestCase):
+    """Test the streaming of values between commands on a command line."""
+
+    def testIntermediateShellOutputIsStreamed(self):
+        """
+        The output of a shell command followed by another command on the
+        same command line must be read lazily.
+        """
+        p = Pipeline(loadInitFile=False)
+        p.run('seq 5', 1, 2)
+        self.assertIsInstance(p.stdin, LineStream)
+        self.assertEqual('1', p.stdin[0])
+
+    def testStreamSettledAtEndOfLine(self):
+        """
+        A streamed value must be converted to a list at the end of the
+        command line.
+        """
+        p = Pipeline(loadInitFile=False)
+        p.run('seq 3', 1, 2)
+        p.run('', 2, 2)
+        self.assertEqual(['1', '2', '3'], p.stdin)
+
+    def testShellToShell(self):
+        """
+        A streamed value must be readable by a following shell command.
+        """
+        p = Pipeline(loadInitFile=False, usePtys=False, outfp=StringIO())
+        p.run('seq 3', 1, 2)
+        p.run('tr 123 abc', 2, 2)
+        self.assertEqual(['a', 'b', 'c'], p.stdin)
+
+    def testShellToNativeHead(self):
+        """
+        An upstream command must be stopped when the native head command
+        has read what it needs.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        start = time()
+        p.run('yes', 1, 2)
+        p.run('head -3', 2, 2)
+        self.assertEqual(['y', 'y', 'y'], p.stdin)
+        self.assertLess(time() - start, 5)
+
+    def testShellToShellHead(self):
+        """
+        An upstream command must be stopped when a downstream shell command
+        exits.
+        """
+        p = Pipeline(loadInitFile=False, usePtys=False, useNative=False,
+                     outfp=StringIO())
+        start = time()
+        p.run('yes', 1, 2)
+        p.run('head -2', 2, 2)
+        self.assertEqual(['y', 'y'], p.stdin)
+        self.assertLess(time() - start, 5)
+
+    def testShellToPythonIndex(self):
+        """
+        Indexing a streamed value must not need to read all of it, and the
+        upstream command must then be stopped.
+        """
+        p = Pipeline(loadInitFile=False)
+        start = time()
+        p.run('sleep 30 & yes', 1, 2)
+        p.run('_[0]', 2, 2)
+        self.assertEqual('y', p.stdin)
+        self.assertLess(time() - start, 5)
+
+    def testGeneratorClosed(self):
+        """
+        A generator whose values are not all read by a following native
+        command must be closed.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        p.run('def gen():', 1, 1)
+        p.run('    global closed', 1, 1)
+        p.run('    closed = False', 1, 1)
+        p.run('    try:', 1, 1)
+        p.run('        while True: yield "x"', 1, 1)
+        p.run('    finally:', 1, 1)
+        p.run('        closed = True', 1, 1)
+        p.run('', 1, 1)
+        p.run('gen()', 1, 2)
+        p.run('head -2', 2, 2)
+        self.assertEqual(['x', 'x'], p.stdin)
+        self.assertTrue(p.local['closed'])
+
+    def testLazyMapOverStream(self):
+        """
+        A lazy map over a streamed value must see all of it.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        p.run('seq 100', 1, 3)
+        p.run('map(int, _)', 2, 3)
+        p.run('sum(_)', 3, 3)
+        self.assertEqual(5050, p.stdin)
+
+    def testGeneratorExpressionOverStream(self):
+        """
+        A generator expression over a streamed value must see all of it.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        p.run('seq 100', 1, 3)
+        p.run('(int(x) * 2 for x in _)', 2, 3)
+        p.run('sum(_)', 3, 3)
+        self.assertEqual(10100, p.stdin)
+
+    def testLazyFilterOverStreamToShell(self):
+        """
+        A lazy filter over a streamed value must give all its lines to a
+        following shell command.
+        """
+        p = Pipeline(loadInitFile=False, usePtys=False, outfp=StringIO())
+        p.run('seq 5', 1, 3)
+        p.run('filter(None, _)', 2, 3)
+        p.run('wc -l', 3, 3)
+        self.assertEqual(['5'], p.stdin)
+
+    def testLazyMapSurvivesCommandLine(self):
+        """
+        A lazy map over a streamed value that is left as the value of _ at
+        the end of a command line must still give all the values later.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        p.run('seq 10', 1, 2)
+        p.run('map(int, _)', 2, 2)
+        p.run('sum(_)')
+        self.assertEqual(55, p.stdin)
+
+
+class TestStatus(TestCase):
+    """Test the recording of command exit statuses."""
+
+    def testShellStatus(self):
+        """The exit status of a shell command must be recorded."""
+        p = Pipeline(loadInitFile=False, usePtys=False, outfp=StringIO())
+        p.run('exit 3')
+        self.assertEqual(3, p.status)
+
+    def testPythonStatus(self):
+        """A Python command must have a zero exit status."""
+        p = Pipeline(loadInitFile=False, usePtys=False, outfp=StringIO())
+        p.run('exit 3')
+        p.run('4')
+        self.assertEqual(0, p.status)
@@ -0,0 +1,309 @@
+import sys
+from unittest import TestCase, skipUnless
+from io import StringIO
+from tempfile import TemporaryDirectory
+from os.path import exists, join
+
+from daudinlib.interaction import Batch
+from daudinlib.results import (
+    ResultStore, ResultHistory, MappedLines, writeLines, writePickle,
+    readPickle, estimateSize)
+from daudinlib.pipeline import Pipeline
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TestResultStore(TestCase):
+    """Test the ResultStore class."""
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.directory = join(self.tmpdir.name, 'results')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testEmpty(self):
+        """A store whose directory does not exist must be empty."""
+        store = ResultStore(self.directory)
+        self.assertEqual([], list(store))
+        self.assertNotIn('x', store)
+        self.assertRaises(KeyError, store.__getitem__, 'x')
+
+    def testLines(self):
+        """A list of lines must be saved as a text file."""
+        store = ResultStore(self.directory)
+        store['x'] = ['a', '', 'b']
+        self.assertTrue(exists(join(self.directory, 'x.lines')))
+        self.assertEqual(['a', '', 'b'], ResultStore(self.directory)['x'])
+
+    def testLinesAreMapped(self):
+        """Saved lines must be loaded as a lazy MappedLines."""
+        store = ResultStore(self.directory)
+        store['x'] = ['a', 'b']
+        self.assertIsInstance(store['x'], MappedLines)
+
+    def testEmptyLines(self):
+        """An empty list must be saved and loaded."""
+        store = ResultStore(self.directory)
+        store['x'] = []
+        self.assertEqual([], store['x'])
+
+    def testPickled(self):
+        """A value that is not a list of lines must be pickled."""
+        store = ResultStore(self.directory)
+        store['x'] = {'a': [1, 2]}
+        self.assertTrue(exists(join(self.directory, 'x.pickle')))
+        self.assertEqual({'a': [1, 2]}, ResultStore(self.directory)['x'])
+
+    def testReplaceDifferentFormat(self):
+        """A value saved in a different format must replace the old one."""
+        store = ResultStore(self.directory)
+        store['x'] = ['a']
+        store['x'] = 3
+        self.assertEqual(['x'], list(store))
+        self.assertEqual(3, store['x'])
+
+    def testDelete(self):
+        """A deleted value must be removed."""
+        store = ResultStore(self.directory)
+        store['x'] = 3
+        del store['x']
+        self.assertNotIn('x', store)
+        self.assertRaises(KeyError, store.__delitem__, 'x')
+
+    def testInvalidName(self):
+        """A name containing a path separator must be rejected."""
+        store = ResultStore(self.directory)
+        self.assertRaises(ValueError, store.__setitem__, 'a/b', 3)
+
+    @skipUnless(np, 'NumPy is not installed')
+    def testOutOfBandBuffers(self):
+        """
+        An array's data must be stored out-of-band and mapped when loaded.
+        """
+        path = join(self.tmpdir.name, 'array')
+        writePickle(path, {'a': np.arange(1000), 'b': np.ones(3)})
+        value = readPickle(path)
+        self.assertTrue(np.array_equal(np.arange(1000), value['a']))
+        self.assertTrue(np.array_equal(np.ones(3), value['b']))
+        self.assertEqual(0, value['a'].ctypes.data % 64)
+        # The memory is a copy-on-write mapping of the file, so it can be
+        # changed.
+        value['a'][0] = 7
+
+
+class TestMappedLines(TestCase):
+    """Test the MappedLines class."""
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = join(self.tmpdir.name, 'lines')
+        writeLines(self.path, ['zero', '', 'two', 'three'])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testIndexIsLazy(self):
+        """Getting an early line must not find all the lines."""
+        lines = MappedLines(self.path)
+        self.assertEqual('', lines[1])
+        self.assertEqual(3, len(lines._starts))
+
+    def testNegativeIndex(self):
+        """A negative index must count from the end."""
+        self.assertEqual('three', MappedLines(self.path)[-1])
+
+    def testIndexError(self):
+        """An index past the end must raise IndexError."""
+        lines = MappedLines(self.path)
+        self.assertRaises(IndexError, lines.__getitem__, 4)
+        self.assertRaises(IndexError, lines.__getitem__, -5)
+
+    def testSlice(self):
+        """A slice must give a list of lines."""
+        self.assertEqual(['', 'two'], MappedLines(self.path)[1:3])
+
+    def testIterate(self):
+        """Iterating must give all the lines."""
+        self.assertEqual(['zero', '', 'two', 'three'],
+                         list(MappedLines(self.path)))
+        self.assertEqual(4, len(MappedLines(self.path)))
+
+
+class TestPipelineResults(TestCase):
+    """Test saving and loading pipeline values."""
+
+    def testSaveAndLoad(self):
+        """A saved value must be loadable by another Pipeline."""
+        with TemporaryDirectory() as tmpdir:
+            p = Pipeline(loadInitFile=False, resultsDir=tmpdir)
+            p.run('[1, 2, 3]')
+            p.save('x')
+            p = Pipeline(loadInitFile=False, resultsDir=tmpdir)
+            p.run('4')
+            p.load('x')
+            self.assertEqual([1, 2, 3], p.stdin)
+            p.run('results["x"][1]')
+            self.assertEqual(2, p.stdin)
+
+    def testLoadedLinesToShell(self):
+        """Loaded lines must be given to a shell command one per line."""
+        with TemporaryDirectory() as tmpdir:
+            p = Pipeline(loadInitFile=False, resultsDir=tmpdir,
+                         usePtys=False, useNative=False, outfp=StringIO())
+            p.run("['b', 'a']")
+            p.save('x')
+            p.load('x')
+            p.run('', 1, 2)
+            p.run('sort', 2, 2)
+            self.assertEqual(['a', 'b'], p.stdin)
+
+
+class TestEstimateSize(TestCase):
+    """Test the estimateSize function."""
+
+    def testList(self):
+        """The size of a list must include the size of its items."""
+        value = ['a' * 100, 'b' * 100]
+        self.assertEqual(
+            sys.getsizeof(value) + 2 * sys.getsizeof('a' * 100),
+            estimateSize(value))
+
+    def testMappedLines(self):
+        """A MappedLines must be taken to use no memory."""
+        with TemporaryDirectory() as tmpdir:
+            path = join(tmpdir, 'lines')
+            writeLines(path, ['a'])
+            self.assertEqual(0, estimateSize(MappedLines(path)))
+
+
+class TestResultHistory(TestCase):
+    """Test the ResultHistory class."""
+
+    def testNewestFirst(self):
+        """The most recent value must be number 1."""
+        history = ResultHistory()
+        history.push('a')
+        history.push('b')
+        self.assertEqual(2, len(history))
+        self.assertEqual('b', history[1])
+        self.assertEqual('a', history[2])
+
+    def testIndexError(self):
+        """Asking for a value that is not kept must raise IndexError."""
+        history = ResultHistory()
+        history.push('a')
+        self.assertRaises(IndexError, history.__getitem__, 0)
+        self.assertRaises(IndexError, history.__getitem__, 2)
+
+    def testMaxValues(self):
+        """Only the most recent values must be kept."""
+        history = ResultHistory(maxValues=2)
+        for value in 'abc':
+            history.push(value)
+        self.assertEqual(2, len(history))
+        self.assertEqual('b', history[2])
+
+    def testBudget(self):
+        """
+        Values over the memory budget must be written to disk and read back
+        when they are used.
+        """
+        with TemporaryDirectory() as tmpdir:
+            history = ResultHistory(budget=1000, directory=tmpdir)
+            history.push([str(i) for i in range(100)])
+            history.push({'x': 1})
+            self.assertLessEqual(history._size, 1000)
+            self.assertIsInstance(history[2], MappedLines)
+            self.assertEqual([str(i) for i in range(100)], list(history[2]))
+            self.assertEqual({'x': 1}, history[1])
+
+    def testUnwritable(self):
+        """A value over the budget that cannot be written must be dropped."""
+        with TemporaryDirectory() as tmpdir:
+            history = ResultHistory(budget=100, directory=tmpdir)
+            history.push([lambda: 1] * 100)
+            history.push('a')
+            self.assertEqual(1, len(history))
+            self.assertEqual('a', history[1])
+
+    def testClear(self):
+        """Clearing must remove the values and their files."""
+        with TemporaryDirectory() as tmpdir:
+            history = ResultHistory(budget=0, directory=tmpdir)
+            history.push(['a'])
+            history.clear()
+            self.assertEqual(0, len(history))
+            self.assertEqual([], list(ResultStore(tmpdir)))
+
+
+class TestPipelineResultHistory(TestCase):
+    """Test the earlier values of a pipeline."""
+
+    def testNames(self):
+        """Earlier values must be available as _1, _2, etc."""
+        p = Pipeline(loadInitFile=False)
+        p.run('1')
+        p.run('2')
+        p.run('3')
+        p.run('[_1, _2]')
+        self.assertEqual([2, 1], p.stdin)
+        self.assertNotIn('_1', p.local)
+
+    def testAssigned(self):
+        """A name like _2 that a command sets must be kept."""
+        p = Pipeline(loadInitFile=False)
+        p.run('1')
+        p.run('2')
+        p.run('_2 = 99')
+        p.run('_3 = 98')
+        p.run('_2 + _3')
+        self.assertEqual(197, p.stdin)
+
+    def testCommandLine(self):
+        """Only the value at the end of each command line must be kept."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        p.run('1')
+        p.run('2', 1, 2)
+        p.run('_ + 1', 2, 2)
+        self.assertEqual(1, len(p.resultHistory))
+        self.assertEqual(1, p.resultHistory[1])
+
+    def testUnchanged(self):
+        """A command that does not change _ must not be kept."""
+        p = Pipeline(loadInitFile=False)
+        p.run('1')
+        p.run('x = 3')
+        self.assertEqual(0, len(p.resultHistory))
+
+    def testInFunction(self):
+        """Earlier values used in a function body must be available."""
+        p = Pipeline(loadInitFile=False)
+        p.run('4')
+        p.run('5')
+        p.run('(lambda: _1 + 1)()')
+        self.assertEqual(5, p.stdin)
+
+    def testUndo(self):
+        """%u N must restore an earlier value."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO())
+        batch = Batch(p)
+        for command in '1', '2', '3':
+            batch.runCommandLine(command)
+        batch.runCommandLine('%u 2')
+        self.assertEqual(1, p.stdin)
+
+    def testUndoTooFar(self):
+        """%u N with too large an N must be reported."""
+        p = Pipeline(loadInitFile=False)
+        sys.stderr, stderr = StringIO(), sys.stderr
+        try:
+            Batch(p).runCommandLine('%u 3')
+            err = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual('Only 0 earlier results kept.\n', err)
@@ -0,0 +1,189 @@
+from unittest import TestCase
+from array import array
+from io import BytesIO, StringIO
+from itertools import count
+from tempfile import NamedTemporaryFile
+
+from daudinlib.pipeline import Pipeline
+from daudinlib.serialize import (
+    serialize, lineChunks, textChunks, Feed, CHUNK_LINES)
+from daudinlib.stream import LineStream
+
+
+def _bytes(value):
+    return b''.join(bytes(chunk) for chunk in serialize(value))
+
+
+class Custom:
+    def __init__(self, n):
+        self.n = n
+
+    def __daudin_serialize__(self):
+        for i in range(self.n):
+            yield 'item %d\n' % i
+
+
+class TestSerialize(TestCase):
+    """Test the serialize function."""
+
+    def testList(self):
+        """A list must be written one item per line."""
+        self.assertEqual(b'a\n1\nb\n', _bytes(['a', 1, 'b']))
+
+    def testEmptyList(self):
+        """An empty list must be written as one empty line."""
+        self.assertEqual(b'\n', _bytes([]))
+
+    def testLongList(self):
+        """A long list must be written in several chunks."""
+        lines = list(map(str, range(3 * CHUNK_LINES)))
+        chunks = list(serialize(lines))
+        self.assertEqual(3, len(chunks))
+        self.assertEqual(('\n'.join(lines) + '\n').encode(), b''.join(chunks))
+
+    def testString(self):
+        """A string must be written followed by a newline."""
+        self.assertEqual('héllo\n'.encode(), _bytes('héllo'))
+
+    def testNumber(self):
+        """A number must be written as its str."""
+        self.assertEqual(b'3.5\n', _bytes(3.5))
+
+    def testBytes(self):
+        """Bytes must be written as they are."""
+        value = b'\x00\xff'
+        self.assertEqual([value], list(serialize(value)))
+
+    def testMemoryview(self):
+        """A memoryview must be written as it is, without a copy."""
+        value = memoryview(b'abcdef')[1:4]
+        self.assertEqual([value], list(serialize(value)))
+        self.assertEqual(b'bcd', _bytes(value))
+
+    def testNonContiguousMemoryview(self):
+        """A non-contiguous memoryview must be written."""
+        self.assertEqual(b'ace', _bytes(memoryview(b'abcdef')[::2]))
+
+    def testTextFile(self):
+        """A text file must have the rest of its contents written."""
+        fp = StringIO('a\nb\n')
+        fp.readline()
+        self.assertEqual(b'b\n', _bytes(fp))
+
+    def testBinaryFile(self):
+        """A binary file must have its contents written."""
+        self.assertEqual(b'\x00\x01', _bytes(BytesIO(b'\x00\x01')))
+
+    def testArray(self):
+        """An array must be written one number per line."""
+        self.assertEqual(b'1.5\n2.0\n', _bytes(array('d', [1.5, 2.0])))
+
+    def testEmptyArray(self):
+        """An empty array must be written as one empty line."""
+        self.assertEqual(b'\n', _bytes(array('d')))
+
+    def testGenerator(self):
+        """A generator must be read lazily, one item per line."""
+        chunks = serialize(str(i) + '\n' for i in count())
+        self.assertTrue(next(iter(chunks)).startswith(b'0\n1\n2\n'))
+
+    def testLineStream(self):
+        """A LineStream must be written one line per line."""
+        self.assertEqual(b'x\ny\n', _bytes(LineStream(['x', 'y'])))
+
+    def testHook(self):
+        """A __daudin_serialize__ method must be used."""
+        self.assertEqual(b'item 0\nitem 1\n', _bytes(Custom(2)))
+
+    def testLineChunks(self):
+        """lineChunks must join lines with newlines."""
+        self.assertEqual([b'a\nb\n'], list(lineChunks(['a', 'b'])))
+
+    def testTextChunks(self):
+        """textChunks must add a final newline."""
+        self.assertEqual(b'abc\n', b''.join(textChunks('abc')))
+
+
+class TestFeed(TestCase):
+    """Test the Feed class."""
+
+    def testStart(self):
+        """A Feed must write its chunks and close the file."""
+        with NamedTemporaryFile() as tmp:
+            fp = open(tmp.name, 'w')
+            Feed([b'a\n', b'b\n']).start(fp).join()
+            self.assertTrue(fp.closed)
+            with open(tmp.name) as fp:
+                self.assertEqual('a\nb\n', fp.read())
+
+    def testSourceClosed(self):
+        """The source LineStream of a Feed must be closed when written."""
+        stream = LineStream(['a'])
+        feed = Feed.fromValue(stream)
+        self.assertTrue(stream.feeding)
+        feed.start(BytesIO()).join()
+        self.assertTrue(stream.closed)
+
+
+class TestPipelineFeed(TestCase):
+    """Test giving pipeline values to shell commands."""
+
+    def testInfiniteGenerator(self):
+        """
+        An infinite generator must be streamed to a shell command that only
+        reads some of it.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False,
+                     useNative=False)
+        p.run('import itertools', 1, 1)
+        p.run('itertools.count()', 1, 3)
+        p.run('cat', 2, 3)
+        p.run('head -n 3', 3, 3)
+        self.assertEqual(['0', '1', '2'], p.stdin)
+
+    def testBytes(self):
+        """Bytes must be given to a shell command as they are."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False,
+                     useNative=False)
+        p.run("b'abc'", 1, 2)
+        p.run('wc -c', 2, 2)
+        self.assertEqual(['3'], [line.strip() for line in p.stdin])
+
+    def testHook(self):
+        """A __daudin_serialize__ method must be used for a shell command."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False,
+                     useNative=False)
+        p.local['Custom'] = Custom
+        p.run('Custom(1000)', 1, 2)
+        p.run('tail -n 1', 2, 2)
+        self.assertEqual(['item 999'], p.stdin)
+
+    def testFile(self):
+        """A file must be given to a shell command."""
+        with NamedTemporaryFile('w') as tmp:
+            print('b\na', file=tmp, flush=True)
+            p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False,
+                         useNative=False)
+            p.run('open(%r)' % tmp.name, 1, 2)
+            p.run('sort', 2, 2)
+        self.assertEqual(['a', 'b'], p.stdin)
+
+    def testFileNative(self):
+        """A file must be given to a native command as lines."""
+        with NamedTemporaryFile('w') as tmp:
+            print('b\na', file=tmp, flush=True)
+            p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+            p.run('open(%r)' % tmp.name, 1, 2)
+            p.run('sort', 2, 2)
+        self.assertEqual(['a', 'b'], p.stdin)
+
+    def testStreamedGenerator(self):
+        """
+        A generator given to a streamed shell command must all be read.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False,
+                     useNative=False)
+        p.run('(str(i) for i in range(10000))', 1, 3)
+        p.run('cat', 2, 3)
+        p.run('wc -l', 3, 3)
+        self.assertEqual(['10000'], [line.strip() for line in p.stdin])
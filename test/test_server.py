@@ -0,0 +1,81 @@
+import os
+import sys
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from os.path import dirname, exists, join
+from subprocess import Popen, PIPE, DEVNULL, run
+from time import sleep
+
+TOP = dirname(dirname(os.path.abspath(__file__)))
+
+
+class TestServer(TestCase):
+    """Test running commands in a daudin server with the daudinc client."""
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.socket = join(self.tmpdir.name, 'daudin.sock')
+        self.env = dict(os.environ, PYTHONPATH=TOP)
+        self.server = Popen(
+            [sys.executable, join(TOP, 'daudin'), '--server', '--noInit',
+             '--noPtys', '--socket', self.socket],
+            env=self.env, stdin=DEVNULL)
+        for _ in range(100):
+            if exists(self.socket):
+                break
+            sleep(0.05)
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.wait()
+        self.tmpdir.cleanup()
+
+    def client(self, *args, input=''):
+        return run([sys.executable, join(TOP, 'daudinc'), '--socket',
+                    self.socket] + list(args),
+                   input=input, stdout=PIPE, universal_newlines=True,
+                   env=self.env, cwd=self.tmpdir.name, timeout=30)
+
+    def testScriptFile(self):
+        """A script file must be run by the server."""
+        script = join(self.tmpdir.name, 'script')
+        with open(script, 'w') as fp:
+            fp.write('x = 3\nx + 4\n')
+        result = self.client(script)
+        self.assertEqual('7\n', result.stdout)
+        self.assertEqual(0, result.returncode)
+
+    def testStandardInput(self):
+        """Commands must be read from the client's standard input."""
+        result = self.client(input='6 * 7\n')
+        self.assertEqual('42\n', result.stdout)
+
+    def testCurrentDirectory(self):
+        """Commands must run in the client's current directory."""
+        result = self.client('--fresh', input='import os\nos.getcwd()\n')
+        self.assertEqual(os.path.realpath(self.tmpdir.name) + '\n',
+                         result.stdout)
+
+    def testExitStatus(self):
+        """The exit status of the last command must be the client's."""
+        result = self.client(input='exit 3\n')
+        self.assertEqual(3, result.returncode)
+
+    def testIsolated(self):
+        """A name defined by one client must not be seen by another."""
+        self.client(input='secret = 1\n')
+        result = self.client(input="'secret' in dir()\n")
+        self.assertEqual('False\n', result.stdout)
+
+    def testSocketRemoved(self):
+        """The socket must be removed when the server is stopped."""
+        self.server.terminate()
+        self.server.wait()
+        self.assertFalse(exists(self.socket))
+
+    def testNoServer(self):
+        """The client must fail if there is no server."""
+        result = run([sys.executable, join(TOP, 'daudinc'), '--socket',
+                      join(self.tmpdir.name, 'nothing')],
+                     stdout=PIPE, stderr=PIPE, env=self.env, timeout=30)
+        self.assertEqual(2, result.returncode)
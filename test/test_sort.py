@@ -0,0 +1,119 @@
+import os
+from unittest import TestCase
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from daudinlib.interaction import Batch
+from daudinlib.pipeline import Pipeline
+from daudinlib.results import MappedLines
+from daudinlib.sort import xsort
+from daudinlib.stream import LineStream
+
+
+class TestXsort(TestCase):
+    """Test the xsort function."""
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testInMemory(self):
+        """Values that fit in memory must be sorted into a list."""
+        self.assertEqual(['a', 'b', 'c'], xsort(['c', 'a', 'b']))
+
+    def testText(self):
+        """The lines of a string must be sorted."""
+        self.assertEqual(['a', 'b'], xsort('b\na\n'))
+
+    def testKey(self):
+        """A key function must be used."""
+        self.assertEqual(['2', '10'], xsort(['10', '2'], key=int))
+
+    def testReverse(self):
+        """Items must be sorted into descending order if asked."""
+        self.assertEqual([3, 2, 1], xsort([1, 3, 2], reverse=True))
+
+    def testUnique(self):
+        """Only the first of equal items must be kept if asked."""
+        self.assertEqual(['a', 'B'],
+                         xsort(['a', 'B', 'b', 'A'], key=str.lower,
+                               unique=True))
+
+    def testCount(self):
+        """Distinct items must be counted if asked."""
+        self.assertEqual([(2, 'a'), (1, 'b')], xsort(['a', 'b', 'a'],
+                                                     count=True))
+
+    def testSpilledLines(self):
+        """
+        Lines that do not fit in the memory budget must be sorted (through
+        temporary files) into a MappedLines, and no files must be left.
+        """
+        lines = [str(i) for i in range(1000)]
+        result = xsort(reversed(lines), budget=1000,
+                       directory=self.tmpdir.name)
+        self.assertIsInstance(result, MappedLines)
+        self.assertEqual(sorted(lines), list(result))
+        self.assertEqual([], os.listdir(self.tmpdir.name))
+
+    def testSpilledOptions(self):
+        """Spilled lines must be sorted by key, in reverse, uniquely."""
+        lines = [str(i % 100) for i in range(1000)]
+        result = xsort(lines, key=int, reverse=True, unique=True,
+                       budget=1000, directory=self.tmpdir.name)
+        self.assertEqual([str(i) for i in range(99, -1, -1)], list(result))
+
+    def testSpilledValues(self):
+        """
+        Values that are not lines must be merged into a LineStream, and
+        the temporary files removed once it has been read.
+        """
+        values = list(range(500)) * 2
+        result = xsort(values, budget=1000, count=True,
+                       directory=self.tmpdir.name)
+        self.assertIsInstance(result, LineStream)
+        self.assertEqual([(2, i) for i in range(500)], list(result))
+        self.assertEqual([], os.listdir(self.tmpdir.name))
+
+    def testStable(self):
+        """Items with equal keys must keep their order."""
+        values = [(i % 3, i) for i in range(300)]
+        self.assertEqual(
+            sorted(values, key=lambda v: v[0]),
+            list(xsort(values, key=lambda v: v[0], budget=500,
+                       directory=self.tmpdir.name)))
+
+    def testStream(self):
+        """
+        A stream must be read without keeping its lines, and be closed.
+        """
+        closed = []
+        stream = LineStream(iter(['b', 'c', 'a']),
+                            close=lambda: closed.append(1))
+        self.assertEqual(['a', 'b', 'c'], xsort(stream))
+        self.assertEqual([], stream.tolist())
+        self.assertEqual([1], closed)
+
+
+class TestPipelineXsort(TestCase):
+    """Test xsort in a pipeline."""
+
+    def testShellOutput(self):
+        """The streamed output of a shell command must be sorted."""
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        Batch(p).runCommandLine(
+            'seq 10000 | xsort(key=int, reverse=True, budget=10000) | '
+            '_[:3]')
+        self.assertEqual(['10000', '9999', '9998'], p.stdin)
+
+    def testLastCommand(self):
+        """
+        The sorted lines of a large value must stay on disk once the
+        command line has finished.
+        """
+        p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+        Batch(p).runCommandLine('seq 1000 | xsort(budget=1000)')
+        self.assertIsInstance(p.stdin, MappedLines)
+        self.assertEqual('999', p.stdin[-1])
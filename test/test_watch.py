@@ -0,0 +1,210 @@
+import os
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+from io import StringIO
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Timer
+
+from daudinlib.interaction import Batch
+from daudinlib.pipeline import Pipeline
+from daudinlib.watch import (
+    parseWatch, InotifyWatcher, PollingWatcher, redraw)
+
+try:
+    InotifyWatcher(['.']).close()
+except OSError:
+    haveInotify = False
+else:
+    haveInotify = True
+
+
+class TestParseWatch(TestCase):
+    """Test the parseWatch function."""
+
+    def testExplicitPaths(self):
+        """Paths before '--' must be watched."""
+        self.assertEqual((['a', 'b c'], 'wc -l a | sort'),
+                         parseWatch(" a 'b c' -- wc -l a | sort"))
+
+    def testPathsInCommandLine(self):
+        """Paths that exist in the command line must be watched."""
+        with TemporaryDirectory() as tmpdir:
+            path = join(tmpdir, 'log')
+            open(path, 'w').close()
+            self.assertEqual(([path], 'tail -n 3 %s | grep x' % path),
+                             parseWatch(' tail -n 3 %s | grep x' % path))
+
+    def testCurrentDirectory(self):
+        """With no paths, the current directory must be watched."""
+        self.assertEqual((['.'], 'date'), parseWatch(' date'))
+
+
+class _WatcherMixin:
+    """Tests for the watchers."""
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = join(self.tmpdir.name, 'file')
+        with open(self.path, 'w') as fp:
+            fp.write('a\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def later(self, function, delay=0.1):
+        timer = Timer(delay, function)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def append(self, path=None):
+        with open(path or self.path, 'a') as fp:
+            fp.write('b\n')
+
+    def testNoChange(self):
+        """With no changes, no change must be found."""
+        watcher = self.makeWatcher([self.path])
+        self.assertFalse(watcher._changed(0.1))
+        watcher.close()
+
+    def testFileChange(self):
+        """A change to a watched file must be found."""
+        watcher = self.makeWatcher([self.path])
+        self.later(self.append)
+        watcher.wait(debounce=0.05)
+        watcher.close()
+
+    def testReplacedFile(self):
+        """A watched file that is replaced must be found to change."""
+        watcher = self.makeWatcher([self.path])
+
+        def replace():
+            other = join(self.tmpdir.name, 'other')
+            with open(other, 'w') as fp:
+                fp.write('new contents\n')
+            os.replace(other, self.path)
+
+        self.later(replace)
+        watcher.wait(debounce=0.05)
+        watcher.close()
+
+    def testDirectory(self):
+        """A new file in a watched directory must be found."""
+        watcher = self.makeWatcher([self.tmpdir.name])
+        self.later(lambda: self.append(join(self.tmpdir.name, 'new')))
+        watcher.wait(debounce=0.05)
+        watcher.close()
+
+    def testOtherFile(self):
+        """A change to an unwatched file must not be found."""
+        watcher = self.makeWatcher([self.path])
+        self.append(join(self.tmpdir.name, 'other'))
+        self.assertFalse(watcher._changed(0.1))
+        watcher.close()
+
+    def testClear(self):
+        """Changes that have not been waited for must be forgotten."""
+        watcher = self.makeWatcher([self.path])
+        self.append()
+        watcher._changed(0.1)
+        self.append()
+        watcher.clear()
+        self.assertFalse(watcher._changed(0.1))
+        watcher.close()
+
+
+@skipUnless(haveInotify, 'Needs inotify')
+class TestInotifyWatcher(_WatcherMixin, TestCase):
+    """Test the InotifyWatcher class."""
+
+    def makeWatcher(self, paths):
+        return InotifyWatcher(paths)
+
+
+class TestPollingWatcher(_WatcherMixin, TestCase):
+    """Test the PollingWatcher class."""
+
+    def makeWatcher(self, paths):
+        return PollingWatcher(paths, interval=0.02)
+
+
+class TestRedraw(TestCase):
+    """Test the redraw function."""
+
+    def testNotTerminal(self):
+        """Output that is not to a terminal must just be written."""
+        fp = StringIO()
+        redraw(fp, 'header', 'a\nb\n', terminal=False)
+        self.assertEqual('header\n\na\nb\n', fp.getvalue())
+
+    def testTerminal(self):
+        """Output to a terminal must overwrite the previous output."""
+        fp = StringIO()
+        redraw(fp, 'header', 'a\n', terminal=True)
+        self.assertEqual('\x1b[Hheader\x1b[K\n\x1b[K\na\x1b[K\n\x1b[J',
+                         fp.getvalue())
+
+
+class _FakeWatcher:
+    """Pretend there is one change, and then that Ctrl-C is pressed."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.waits = 0
+        self.closed = False
+
+    def wait(self):
+        self.waits += 1
+        if self.waits > 1:
+            raise KeyboardInterrupt()
+
+    def clear(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class TestWatchSpecial(TestCase):
+    """Test the %watch special command."""
+
+    def testRerun(self):
+        """
+        The command line must be run again after a change, until Ctrl-C is
+        pressed.
+        """
+        out = StringIO()
+        p = Pipeline(loadInitFile=False, outfp=out, usePtys=False)
+        p.run('0')
+        watchers = []
+
+        def makeWatcher(paths):
+            watchers.append(_FakeWatcher(paths))
+            return watchers[0]
+
+        with patch('daudinlib.interaction.makeWatcher', makeWatcher):
+            Batch(p).runCommandLine('%watch x -- _ + 1')
+
+        self.assertEqual(2, p.stdin)
+        self.assertEqual(['x'], watchers[0].paths)
+        self.assertTrue(watchers[0].closed)
+        lines = out.getvalue().split('\n')
+        self.assertEqual(['1', '2'], [line for line in lines
+                                      if line.isdigit()])
+
+    def testNoKeptValues(self):
+        """
+        Kept values of the first stages of earlier command lines must not
+        be used.
+        """
+        with TemporaryDirectory() as tmpdir:
+            count = join(tmpdir, 'count')
+            slow = 'echo x >> %s; echo a' % count
+            p = Pipeline(loadInitFile=False, outfp=StringIO(), usePtys=False)
+            batch = Batch(p)
+            batch.runCommandLine(slow + ' | wc -l')
+            with patch('daudinlib.interaction.makeWatcher', _FakeWatcher):
+                batch.runCommandLine('%%watch x -- %s | grep a' % slow)
+            with open(count) as fp:
+                self.assertEqual(3, len(fp.readlines()))
+